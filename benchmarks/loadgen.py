@@ -0,0 +1,85 @@
+"""Closed-loop HTTP load generator.
+
+`concurrency` virtual users each send a request, wait for the answer and
+send the next, for `duration` seconds. Every user first gets a session
+cookie of its own from the API, like a browser would. All users share one
+address, which the API's per-client fairness counts as one client.
+Requests finishing during the warm-up are not recorded.
+"""
+import time
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable
+
+import httpx
+
+# make_request(client, user, i) sends the i-th request of a virtual user
+RequestFactory = Callable[[httpx.AsyncClient, int, int], Awaitable[httpx.Response]]
+
+
+def percentile(values: list, q: float) -> float:
+    """The q-th percentile (0-100) of sorted `values`, interpolating between ranks."""
+    if not values:
+        return 0.0
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class ScenarioResult:
+    """Latencies and statuses of the requests of one scenario."""
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.latencies = []  # seconds, of successful requests
+        self.statuses = Counter()  # status code (or "error" for connection failures) -> requests
+        self.elapsed = 0.0
+
+    def record(self, status, latency: float):
+        self.statuses[str(status)] += 1
+        if isinstance(status, int) and status < 400:
+            self.latencies.append(latency)
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        requests = sum(self.statuses.values())
+        return {
+            "concurrency": self.concurrency,
+            "requests": requests,
+            "errors": requests - len(latencies),
+            "throughput": len(latencies) / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+            "statuses": dict(self.statuses),
+        }
+
+
+async def run_load(name: str, base_url: str, make_request: RequestFactory, concurrency: int = 16,
+                   duration: float = 10.0, warmup: float = 1.0) -> ScenarioResult:
+    """Drives `make_request` from `concurrency` virtual users for `warmup` + `duration` seconds."""
+    result = ScenarioResult(name, concurrency)
+    recording = time.perf_counter() + warmup
+    deadline = recording + duration
+
+    async def user(number: int):
+        # A client (and keep-alive connection) per user, like separate browsers
+        async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+            await client.get("/health")  # the API issues the session cookie
+            i = 0
+            while time.perf_counter() < deadline:
+                sent = time.perf_counter()
+                try:
+                    status = (await make_request(client, number, i)).status_code
+                except httpx.HTTPError:
+                    status = "error"
+                if sent >= recording:
+                    result.record(status, time.perf_counter() - sent)
+                i += 1
+
+    await asyncio.gather(*(user(number) for number in range(concurrency)))
+    result.elapsed = max(time.perf_counter() - recording, 1e-9)
+    return result
@@ -0,0 +1,262 @@
+"""Load-test benchmark of the API layer against a local stand-in inference backend.
+
+Starts the stand-in backend (tests/backend.py) with the requested latency
+distribution, error rate and result sizes, and the API in a uvicorn
+process pointed at it. Then it drives each scenario at the target
+concurrency and reports p50/p95/p99 latency, throughput and the API
+process's peak RSS. Results can be compared with a saved baseline: the
+run fails if a scenario got slower or used more memory than the
+tolerance allows.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenarios name,bio --concurrency 32 --latency lognormal:0.2:0.5
+    python -m benchmarks.run --save-baseline
+
+Baselines are only comparable on the same machine and settings.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from PIL import Image
+
+from benchmarks.loadgen import run_load
+from tests.backend import StandInBackend, free_port
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+UPLOAD_DIR = ROOT_DIR / "src" / "static" / "images"
+SAMPLE_IMAGE = ROOT_DIR / "tests" / "files" / "sample.jpg"
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+SCENARIOS = ("upload", "name", "bio", "anime")
+
+# Regressions checked against the baseline: (metric, True if higher is worse)
+CHECKS = (("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("throughput", False))
+
+
+def parse_latency(spec: str) -> Optional[dict]:
+    """Parses "fixed:0.05", "uniform:0.01:0.1", "exponential:0.05" or "lognormal:0.05:0.5"."""
+    if not spec or spec == "none":
+        return None
+    dist, *params = spec.split(":")
+    params = [float(param) for param in params]
+    if dist == "fixed":
+        return {"dist": "fixed", "value": params[0]}
+    if dist == "uniform":
+        return {"dist": "uniform", "low": params[0], "high": params[1]}
+    if dist == "exponential":
+        return {"dist": "exponential", "mean": params[0]}
+    if dist == "lognormal":
+        return {"dist": "lognormal", "median": params[0], "sigma": params[1] if len(params) > 1 else 0.5}
+    raise argparse.ArgumentTypeError(f"Unknown latency distribution: {spec}")
+
+
+def image_variants(count: int) -> list:
+    """Distinct JPEGs of the sample image, so results aren't served from caches or coalesced calls."""
+    variants = []
+    with Image.open(SAMPLE_IMAGE) as sample:
+        sample = sample.convert("RGB")
+        for i in range(count):
+            image = sample.copy()
+            image.putpixel((0, 0), (i % 256, i // 256 % 256, 255))
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=90)
+            variants.append(buffer.getvalue())
+    return variants
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak resident set size of a process, from /proc (Linux only)."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class APIServer:
+    """Runs the API in a uvicorn process pointed at the stand-in backend."""
+
+    def __init__(self, backend_url: str, env: Optional[dict] = None):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {**os.environ, "VPS_URL": backend_url, "PYTHONPATH": str(ROOT_DIR), **(env or {})}
+        self.process = None
+        self._workdir = tempfile.TemporaryDirectory()  # for the logs and instance folder
+
+    def start(self, timeout: float = 30.0):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=self._workdir.name, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                httpx.get(self.url + "/health", timeout=0.5)
+                return self
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("The API did not start")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        self._workdir.cleanup()
+
+
+async def run_scenarios(server: APIServer, scenarios: list, concurrency: int, duration: float, warmup: float) -> dict:
+    variants = image_variants(64)
+    encoded = [base64.b64encode(variant).decode("utf-8") for variant in variants]
+
+    # Names are generated for images already uploaded
+    async with httpx.AsyncClient(base_url=server.url, timeout=30.0) as client:
+        uploaded = []
+        for i, variant in enumerate(variants):
+            response = await client.post("/upload_image", files={"file": (f"bench{i}.jpg", variant, "image/jpeg")})
+            response.raise_for_status()
+            uploaded.append(response.json()["imgUrl"])
+
+    def params(user: int, i: int) -> dict:
+        # A distinct diversity per request, so no two calls are coalesced
+        return {"diversity": 1.0 + (user * 100003 + i) % 1000 / 10000, "no_cache": True}
+
+    def upload(client, user, i):
+        variant = variants[(user + i * concurrency) % len(variants)]
+        return client.post("/upload_image", files={"file": ("bench.jpg", variant, "image/jpeg")})
+
+    def name(client, user, i):
+        image = uploaded[(user + i * concurrency) % len(uploaded)]
+        return client.post("/generate/name", json={"imageSrc": image, "min_name_length": 2, "max_name_length": 5,
+                                                   **params(user, i)})
+
+    def bio(client, user, i):
+        return client.post("/generate/bio", json={"name": f"Bench {user}-{i}", "max_bio_length": 200, **params(user, i)})
+
+    def anime(client, user, i):
+        image = encoded[(user + i * concurrency) % len(encoded)]
+        return client.post("/convert_to_anime", json={"image": image, "no_cache": True})
+
+    requests = {"upload": upload, "name": name, "bio": bio, "anime": anime}
+    results = {}
+    for scenario in scenarios:
+        result = await run_load(scenario, server.url, requests[scenario], concurrency, duration, warmup)
+        results[scenario] = {**result.summary(), "peak_rss_mb": peak_rss_mb(server.process.pid)}
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Describes every metric that regressed by more than `tolerance` (a fraction) from the baseline."""
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if base is None:
+            continue
+        for metric, higher_is_worse in CHECKS:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            worse = new > old * (1 + tolerance) if higher_is_worse else new < old * (1 - tolerance)
+            if worse:
+                regressions.append(f"{scenario} {metric}: {old:.1f} -> {new:.1f}")
+
+    old_rss, new_rss = baseline.get("peak_rss_mb"), max_rss(results)
+    if old_rss and new_rss and new_rss > old_rss * (1 + tolerance):
+        regressions.append(f"peak_rss_mb: {old_rss:.1f} -> {new_rss:.1f}")
+    return regressions
+
+
+def max_rss(results: dict) -> Optional[float]:
+    values = [result["peak_rss_mb"] for result in results.values() if result.get("peak_rss_mb")]
+    return max(values) if values else None
+
+
+def report(results: dict):
+    print(f"{'scenario':<10}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for scenario, result in results.items():
+        print(f"{scenario:<10}{result['requests']:>10}{result['errors']:>8}{result['throughput']:>10.1f}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['max_ms']:>10.1f}")
+    rss = max_rss(results)
+    if rss:
+        print(f"peak RSS of the API: {rss:.1f} MB")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated, of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users per scenario")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds run before measuring")
+    parser.add_argument("--latency", type=parse_latency, default="lognormal:0.05:0.5",
+                        help="backend latency: fixed:S, uniform:LOW:HIGH, exponential:MEAN, lognormal:MEDIAN[:SIGMA] or none")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of backend calls failing with 500")
+    parser.add_argument("--bio-words", type=int, default=50, help="filler words per bio")
+    parser.add_argument("--anime-bytes", type=int, default=0, help="anime result size, 0 echoes the input")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression, as a fraction")
+    parser.add_argument("--output", type=Path, help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    existing = set(UPLOAD_DIR.iterdir()) if UPLOAD_DIR.exists() else set()
+    backend = StandInBackend().start()
+    server = None
+    try:
+        backend.control(latency=args.latency, error_rate=args.error_rate, bio_words=args.bio_words,
+                        anime_bytes=args.anime_bytes)
+        # The virtual users share one address: let that client queue as many calls as there are users
+        server = APIServer(backend.url, env={"FAIR_CLIENT_QUEUE": str(args.concurrency)}).start()
+        results = asyncio.run(run_scenarios(server, scenarios, args.concurrency, args.duration, args.warmup))
+    finally:
+        if server is not None:
+            server.stop()
+        backend.stop()
+        # Remove the images the benchmark uploaded
+        for path in set(UPLOAD_DIR.iterdir()) - existing if UPLOAD_DIR.exists() else ():
+            path.unlink(missing_ok=True)
+
+    report(results)
+    run = {
+        "settings": {key: value for key, value in vars(args).items() if key not in ("baseline", "save_baseline", "tolerance", "output")},
+        "scenarios": results,
+        "peak_rss_mb": max_rss(results),
+    }
+    if args.output:
+        args.output.write_text(json.dumps(run, indent=2, default=str))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(run, indent=2, default=str) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("settings", {}) != json.loads(json.dumps(run["settings"], default=str)):
+        print("Note: the baseline was recorded with other settings")
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import math
+import time
+import asyncio
+import logging
+from typing import Optional
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from src.api.config import settings
+from src.api.fairness import BucketStore, bucket_store, current_client
+from src.api.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+BUSY = "Server is busy, try again later"
+THROTTLED = "Too many requests, slow down"
+
+
+class AdmissionLimiter:
+    """Caps the inference calls of one kind that are in flight at once.
+
+    Calls over the limit wait in per-client FIFO queues, and freed slots
+    are handed to the clients in turn (round-robin), so one client
+    flooding the queue cannot starve the others. A call is shed with a 503
+    and a `Retry-After` estimated from recent call durations when the
+    queue (or its client's share of it) is full, or after waiting
+    `queue_timeout` seconds.
+
+    Clients are also rate limited with a token bucket: each call costs
+    `cost` tokens, refilled at `rate` per second up to `burst`; a client
+    out of tokens gets a 429. Clients are told apart by `current_client`.
+
+    Optional work (speculative bios) only takes a `spare_slot()`: one that
+    is free right now, without queueing or using the client's tokens.
+
+    A `max_concurrent` of 0 disables the limit, a `rate` of 0 the rate limit.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float = 30.0,
+                 max_client_queue: Optional[int] = None, rate: float = 0.0, burst: float = 1.0, cost: float = 1.0,
+                 buckets: BucketStore = bucket_store):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_client_queue = max_client_queue or max_queue
+        self.rate = rate
+        self.burst = burst
+        self.cost = min(cost, burst)
+        self.buckets = buckets
+
+        self.inflight = 0
+        self._queues = OrderedDict()  # client -> deque of waiting futures, next client to serve first
+        self._waiting = 0
+        self._hold_ewma = None  # smoothed seconds a slot is held
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new caller."""
+        hold = self._hold_ewma or 1.0
+        return max(1, math.ceil(hold * (self.waiting + 1) / max(self.max_concurrent, 1)))
+
+    def _busy(self) -> HTTPException:
+        return HTTPException(status_code=503, detail=BUSY, headers={"Retry-After": str(self.retry_after())})
+
+    def _admit(self, waited: float):
+        self.admitted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    async def throttle(self, client: Optional[str] = None):
+        """Takes the call's tokens from the client's bucket, raising a 429 when it is empty."""
+        if self.rate <= 0:
+            return
+        wait = await self.buckets.take(client or current_client.get(), self.cost, self.rate, self.burst)
+        if wait > 0:
+            self.throttled += 1
+            raise HTTPException(status_code=429, detail=THROTTLED, headers={"Retry-After": str(math.ceil(wait))})
+
+    async def _acquire(self, shed: bool) -> float:
+        client = current_client.get()
+        if shed:
+            await self.throttle(client)
+
+        if self.max_concurrent <= 0 or (self.inflight < self.max_concurrent and not self._waiting):
+            self.inflight += 1
+            self._admit(0.0)
+            return 0.0
+
+        queue = self._queues.get(client)
+        if shed and (self.waiting >= self.max_queue or (queue and len(queue) >= self.max_client_queue)):
+            self.rejected += 1
+            raise self._busy()
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[client] = deque()
+        queue.append(future)
+        self._waiting += 1
+        start = time.monotonic()
+        try:
+            if shed and self.queue_timeout:
+                await asyncio.wait_for(future, self.queue_timeout)
+            else:
+                await future
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                self._release()  # handed over just as the wait timed out
+            else:
+                self._forget(client, future)
+            self.timed_out += 1
+            raise self._busy()
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # the slot was handed over already
+            else:
+                self._forget(client, future)
+            raise
+
+        waited = time.monotonic() - start
+        self._admit(waited)
+        return waited
+
+    def _forget(self, client: str, future: asyncio.Future):
+        future.cancel()
+        queue = self._queues.get(client)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        self._waiting -= 1
+        if not queue:
+            del self._queues[client]
+
+    def _release(self):
+        while self._queues:
+            # Serve the first client in line, then send it to the back
+            client, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+
+            if not future.done():
+                future.set_result(None)  # the slot passes on, inflight stays the same
+                return
+        self.inflight -= 1
+
+    @asynccontextmanager
+    async def slot(self, shed: bool = True):
+        """Holds an inference slot inside the block, yielding the seconds spent queued.
+
+        :param shed: reject with 503 when the queue is full or the wait times
+            out; without it the call waits for as long as it takes
+        """
+        waited = await self._acquire(shed)
+        observe_stage("queue", waited)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            held = time.monotonic() - start
+            self._hold_ewma = held if self._hold_ewma is None else 0.8 * self._hold_ewma + 0.2 * held
+            self._release()
+
+    @asynccontextmanager
+    async def spare_slot(self):
+        """Holds a slot that is free right now inside the block, for optional work.
+
+        Raises HTTPException 503 at once if no slot is free or calls are
+        queued, and doesn't charge the client's token bucket, so optional
+        work never delays, sheds or throttles the client's real calls.
+        """
+        if self.max_concurrent > 0 and (self.inflight >= self.max_concurrent or self._waiting):
+            raise self._busy()
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.max_concurrent,
+            "queue_limit": self.max_queue,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "waiting_clients": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "throttled": self.throttled,
+            "mean_wait": self.wait_total / self.admitted if self.admitted else 0.0,
+            "max_wait": self.wait_max,
+        }
+
+
+def build_limiters() -> dict:
+    """Builds one limiter per inference endpoint, configured from settings."""
+    return {
+        name: AdmissionLimiter(
+            name,
+            max_concurrent=getattr(settings, f"admission_{name}_concurrency"),
+            max_queue=getattr(settings, f"admission_{name}_queue"),
+            queue_timeout=settings.admission_queue_timeout,
+            max_client_queue=settings.fair_client_queue,
+            rate=settings.fair_rate,
+            burst=settings.fair_burst,
+            cost=getattr(settings, f"fair_{name}_cost"),
+        )
+        for name in ("name", "bio", "anime")
+    }
+
+
+limiters = build_limiters()
@@ -0,0 +1,373 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import urljoin
+
+import httpx
+
+from fastapi import HTTPException
+
+from src.api.metrics import observe_stage, upstream_errors, upstream_requests_in_flight
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+RETRYABLE_STATUS = {500, 502, 503, 504}
+
+# How a streamed response body ended
+COMPLETED = "completed"
+FAILED = "failed"
+ABANDONED = "abandoned"
+
+
+class ClosingStream(httpx.AsyncByteStream):
+    """Body of a streamed response that calls `on_close(outcome)` once, when it is closed.
+
+    The outcome is COMPLETED if the body was read to the end, FAILED if
+    reading it raised an HTTP error and ABANDONED if it was closed early.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._outcome = ABANDONED
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except httpx.HTTPError:
+            self._outcome = FAILED
+            raise
+        self._outcome = COMPLETED
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close is not None:
+                on_close(self._outcome)
+
+
+class Backend:
+    """A single inference backend with load and health bookkeeping.
+
+    Tracks the number of in-flight requests and an EWMA of response latency
+    for load balancing, and a circuit breaker that ejects the node after
+    `failure_threshold` consecutive failures for `cooldown` seconds.
+    After the cooldown one trial request is let through (half-open); its
+    outcome decides whether the node rejoins the pool.
+    """
+
+    def __init__(self, url: str, failure_threshold: int = 3, cooldown: float = 30.0, ewma_alpha: float = 0.3):
+        self.url = url if url.endswith("/") else url + "/"
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+
+        self.inflight = 0
+        self.ewma_latency = 0.0
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._trial_inflight = False
+
+    def __repr__(self):
+        return f"Backend({self.url!r}, state={self.state}, inflight={self.inflight}, ewma={self.ewma_latency:.3f})"
+
+    def endpoint(self, path: str) -> str:
+        return urljoin(self.url, path)
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Whether the circuit breaker lets a request through to this backend."""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        return self.state == HALF_OPEN and not self._trial_inflight
+
+    def load(self, strategy: str = "inflight"):
+        """Load score used to pick the least-loaded backend (lower is better)."""
+        if strategy == "ewma":
+            # Peak-EWMA: expected latency scaled by the queue we'd join
+            return self.ewma_latency * (self.inflight + 1)
+        return (self.inflight, self.ewma_latency)
+
+    def acquire(self):
+        self.inflight += 1
+        if self.state == HALF_OPEN:
+            self._trial_inflight = True
+
+    def release(self):
+        self.inflight -= 1
+        self._trial_inflight = False
+
+    def record_success(self, latency: Optional[float] = None):
+        if latency is not None:
+            if self.ewma_latency:
+                self.ewma_latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.ewma_latency
+            else:
+                self.ewma_latency = latency
+        if self.state != CLOSED:
+            logger.info(f"Inference backend {self.url} recovered")
+        self.failures = 0
+        self.state = CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"Inference backend {self.url} ejected after {self.failures} consecutive failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Caps retries to a fraction of regular traffic.
+
+    Every request deposits `ratio` tokens, every retry or hedge withdraws one.
+    `min_per_second` retries are always allowed so a quiet service can still
+    fail over. This keeps a struggling backend pool from being buried
+    under a retry storm.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self._reserve = min_per_second
+        self._last_refill = time.monotonic()
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        now = time.monotonic()
+        self._reserve = min(self.min_per_second, self._reserve + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        if self._reserve >= 1:
+            self._reserve -= 1
+            return True
+        return False
+
+
+class BackendPool:
+    """Routes inference requests across a pool of backends.
+
+    Picks the least-loaded available backend, retries retryable failures on
+    a different node within the retry budget, optionally hedges slow requests
+    with a second one, and probes every node in the background.
+    """
+
+    def __init__(
+        self,
+        urls: list,
+        strategy: str = "inflight",
+        max_retries: int = 1,
+        retry_budget: Optional[RetryBudget] = None,
+        hedge_delay: float = 2.0,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        probe_path: str = "health",
+        probe_interval: float = 10.0,
+        probe_timeout: float = 2.0,
+    ):
+        self.backends = [Backend(url, failure_threshold=failure_threshold, cooldown=cooldown) for url in urls]
+        self.strategy = strategy
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget or RetryBudget()
+        self.hedge_delay = hedge_delay
+        self.probe_path = probe_path
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def pick(self, exclude=()) -> Optional[Backend]:
+        """Returns the least-loaded available backend, or None if all are ejected."""
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+        if not candidates:
+            return None
+        random.shuffle(candidates)  # break ties randomly
+        return min(candidates, key=lambda b: b.load(self.strategy))
+
+    async def _send_to(self, client: httpx.AsyncClient, backend: Backend, path: str, stream: bool = False, **kwargs) -> httpx.Response:
+        backend.acquire()
+        upstream_requests_in_flight.inc(backend=backend.url)
+        start = time.monotonic()
+
+        def release():
+            backend.release()
+            upstream_requests_in_flight.dec(backend=backend.url)
+
+        try:
+            request = client.build_request("POST", backend.endpoint(path), **kwargs)
+            response = await client.send(request, stream=stream)
+        except httpx.HTTPError as e:
+            release()
+            backend.record_failure()
+            upstream_errors.inc(status="timeout" if isinstance(e, httpx.TimeoutException) else "error")
+            raise
+        except BaseException:
+            release()
+            raise
+
+        if response.status_code >= 400:
+            upstream_errors.inc(status=str(response.status_code))
+        if response.status_code in RETRYABLE_STATUS:
+            release()
+            backend.record_failure()
+            if stream:
+                await response.aclose()  # the body is never read, give the connection back
+        elif stream:
+            # The backend is busy until the body has been read: account for it when the response is closed
+            def finish(outcome: str):
+                release()
+                if outcome == COMPLETED:
+                    backend.record_success(time.monotonic() - start)
+                elif outcome == FAILED:
+                    backend.record_failure()
+                    upstream_errors.inc(status="error")
+
+            response.stream = ClosingStream(response.stream, finish)
+        else:
+            release()
+            backend.record_success(time.monotonic() - start)
+        return response
+
+    async def _send_hedged(self, client: httpx.AsyncClient, backend: Backend, path: str, tried: set, **kwargs) -> httpx.Response:
+        """Sends to `backend` and, if it hasn't answered within `hedge_delay`, races a second backend."""
+        primary = asyncio.create_task(self._send_to(client, backend, path, **kwargs))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay)
+            if done:
+                return primary.result()
+
+            second = self.pick(exclude=tried)
+            if second is None or not self.retry_budget.withdraw():
+                return await primary
+            tried.add(second)
+            logger.info(f"Hedging slow request to {backend.url} with {second.url}")
+
+            pending.add(asyncio.create_task(self._send_to(client, second, path, **kwargs)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRYABLE_STATUS:
+                        return task.result()
+            return task.result()  # both failed, surface the last outcome
+        finally:
+            # Also when the caller is cancelled: no request may keep its backend slot and connection
+            for task in pending:
+                task.cancel()
+
+    async def post(self, client: httpx.AsyncClient, path: str, hedge: bool = False, stream: bool = False, **kwargs) -> httpx.Response:
+        """Posts to the least-loaded backend, failing over to others on retryable errors.
+
+        With `stream=True` the response body is not read, the caller must
+        close the returned response. Streamed requests are never hedged, and
+        hold their backend (and count as inference time) until closed.
+
+        Raises HTTPException 503 if no backend is available, 504 if the last
+        attempt timed out and 502 if it failed otherwise.
+        """
+        start = time.perf_counter()
+        try:
+            response = await self._post(client, path, hedge=hedge, stream=stream, **kwargs)
+        except BaseException:
+            observe_stage("inference", time.perf_counter() - start)
+            raise
+
+        if stream:
+            response.stream = ClosingStream(response.stream, lambda outcome: observe_stage("inference", time.perf_counter() - start))
+        else:
+            observe_stage("inference", time.perf_counter() - start)
+        return response
+
+    async def _post(self, client: httpx.AsyncClient, path: str, hedge: bool, stream: bool, **kwargs) -> httpx.Response:
+        self.retry_budget.deposit()
+        tried = set()
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            backend = self.pick(exclude=tried)
+            if backend is None:
+                break
+            if attempt and not self.retry_budget.withdraw():
+                logger.warning("Inference retry budget exhausted")
+                break
+            tried.add(backend)
+
+            try:
+                if hedge and not stream and len(self.backends) > 1:
+                    response = await self._send_hedged(client, backend, path, tried, **kwargs)
+                else:
+                    response = await self._send_to(client, backend, path, stream=stream, **kwargs)
+            except httpx.HTTPError as e:
+                logger.error(f"Inference request to {backend.url} failed: {e!r}")
+                last_error = e
+                continue
+
+            if response.status_code in RETRYABLE_STATUS:
+                logger.error(f"Inference backend {backend.url} returned {response.status_code}")
+                last_error = response
+                continue
+            return response
+
+        if last_error is None:
+            raise HTTPException(status_code=503, detail="No inference backend available")
+        if isinstance(last_error, httpx.TimeoutException):
+            raise HTTPException(status_code=504, detail="Inference service timed out")
+        raise HTTPException(status_code=502, detail="Inference function failed")
+
+    async def probe(self, client: httpx.AsyncClient):
+        """Health-checks every backend once and updates its breaker state."""
+        async def check(backend: Backend):
+            try:
+                response = await client.get(backend.endpoint(self.probe_path), timeout=self.probe_timeout)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+
+            if healthy:
+                if backend.state != CLOSED:
+                    backend.record_success()
+            elif backend.state != OPEN:
+                backend.record_failure()
+
+        await asyncio.gather(*(check(backend) for backend in self.backends))
+
+    async def _probe_loop(self, client: httpx.AsyncClient):
+        while True:
+            try:
+                await self.probe(client)
+            except Exception:
+                logger.exception("Inference backend probe failed")
+            await asyncio.sleep(self.probe_interval)
+
+    def start_probing(self, client: httpx.AsyncClient):
+        if self._probe_task is None and self.probe_interval > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop(client))
+
+    async def stop_probing(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects concurrent calls of one type into a single batched call.
+
+    Items submitted while a batch is open are sent together once the batch
+    holds `max_batch_size` items or `max_wait` seconds have passed since its
+    first item, whichever comes first. `send_batch` receives the list of
+    items and returns one result per item, in order; a result that is an
+    exception is raised in the awaiting caller only.
+    """
+
+    def __init__(self, send_batch: Callable[[list], Awaitable[list]], max_batch_size: int = 8,
+                 max_wait: float = 0.01, name: str = "batch"):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+
+        self._pending = []  # (item, future) waiting for the next flush
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        """Adds an item to the current batch and waits for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            chunk = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+
+            # Callers that gave up while waiting are not sent upstream
+            batch = [(item, future) for item, future in chunk if not future.done()]
+            if batch:
+                task = asyncio.create_task(self._run(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.send_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name}: got {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,194 @@
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+from src.api.config import settings
+from src.api.executor import io_pool
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(endpoint: str, **params) -> str:
+    """Canonical cache key for an inference call: endpoint plus its sorted parameters."""
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return f"{endpoint}:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+class CacheStats:
+    """Hit/miss/eviction counters of a cache tier."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats.evictions += 1
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class DiskCache:
+    """On-disk cache tier: one JSON file per key, survives restarts and is shared between workers.
+
+    Blocking: `ResultCache` calls it from the io worker pool.
+    """
+
+    def __init__(self, directory, ttl: float = 24 * 3600):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.stats.misses += 1
+            return None
+
+        if entry["expires_at"] <= time.time():
+            path.unlink(missing_ok=True)
+            self.stats.evictions += 1
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        return entry["value"]
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"expires_at": time.time() + ttl, "value": value}, f)
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {path.name}: {e}")
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def clear(self):
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+
+class ResultCache:
+    """Two-tier cache for inference results: memory first, then (optionally) disk.
+
+    Values must be JSON-serializable. A disk hit is promoted to memory.
+    The disk tier runs in the io worker pool; when the pool is too busy, a
+    read counts as a miss and a write is skipped.
+    """
+
+    def __init__(self, memory: Optional[MemoryCache] = None, disk: Optional[DiskCache] = None, enabled: bool = True):
+        self.memory = memory or MemoryCache()
+        self.disk = disk
+        self.enabled = enabled
+
+    async def _on_disk(self, label: str, fn, *args):
+        try:
+            return await io_pool.run(label, fn, *args)
+        except HTTPException:
+            return None  # shed: the disk tier is only an optimization
+
+    async def get(self, key: str):
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = await self._on_disk("cache_read", self.disk.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value):
+        if not self.enabled:
+            return
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await self._on_disk("cache_write", self.disk.set, key, value)
+
+    async def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            await self._on_disk("cache_write", self.disk.delete, key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        stats = {"memory": {**self.memory.stats.as_dict(), "entries": len(self.memory)}}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats.as_dict()
+        return stats
+
+
+def build_cache() -> ResultCache:
+    """Builds the result cache configured from settings."""
+    disk = DiskCache(settings.cache_dir, ttl=settings.cache_disk_ttl) if settings.cache_dir else None
+    return ResultCache(
+        MemoryCache(max_entries=settings.cache_max_entries, ttl=settings.cache_ttl),
+        disk,
+        enabled=settings.cache_enabled,
+    )
+
+
+result_cache = build_cache()
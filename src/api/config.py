@@ -1,18 +1,139 @@
+import os
 from pathlib import Path
+from typing import Optional
 
+import dotenv
 from pydantic_settings import BaseSettings
 
-class Settings(BaseSettings):
-    testing: bool = False
-
-settings = Settings()
-
 ROOT_DIR = Path(__file__).resolve().parent.parent
 TEMPLATE_DIR = ROOT_DIR / 'templates'
+STATIC_DIR = ROOT_DIR / 'static'
 UPLOAD_DIR = ROOT_DIR / 'static/images'
+INSTANCE_DIR = Path(os.getcwd()) / 'instance'
 
 ENV_DIR = ROOT_DIR.parent / '.env'
 
+if ENV_DIR.exists():
+    dotenv.load_dotenv(ENV_DIR)
+    if not os.getenv("VPS_URL"):
+        raise RuntimeError("VPS_URL is not set. Please configure your .env file.")
+
+
+class Settings(BaseSettings):
+    testing: bool = False
+
+    # Inference service connection
+    vps_url: Optional[str] = None  # comma-separated list for a pool of backends
+    inference_pool_size: int = 20  # max open connections to the inference service
+    inference_keepalive: int = 10  # idle keep-alive connections kept in the pool
+    inference_connect_timeout: float = 5.0
+    inference_read_timeout: float = 120.0  # bio generation on CPU can take a while
+    inference_http2: bool = False  # requires the optional `h2` package
+    inference_transport: str = "auto"  # image transport: "binary", "json" (base64) or "auto" (binary, json fallback)
+    inference_fallback_ttl: float = 300.0  # seconds before binary (or batching) is tried again on a backend that rejected it
+
+    # Inference backend routing
+    inference_balance: str = "inflight"  # "inflight" or "ewma" (peak-EWMA latency)
+    inference_max_retries: int = 1  # failover attempts on other backends
+    inference_retry_ratio: float = 0.2  # retries allowed per regular request
+    inference_failure_threshold: int = 3  # consecutive failures before a backend is ejected
+    inference_breaker_cooldown: float = 30.0  # seconds before an ejected backend is retried
+    inference_probe_path: str = "health"
+    inference_probe_interval: float = 10.0  # seconds, 0 disables background probing
+    inference_hedge_bio: bool = False  # race a second backend for slow bio requests
+    inference_hedge_delay: float = 2.0  # seconds before a hedged request is sent
+
+    # Image retention
+    image_ttl: float = 300  # seconds since last use before an image is deleted
+    image_quota_bytes: int = 256 * 1024 * 1024  # least recently used images go first above this
+    image_sweep_interval: float = 30  # seconds between retention sweeps
+
+    # Inference result cache
+    cache_enabled: bool = True
+    cache_max_entries: int = 1024  # in-memory LRU size
+    cache_ttl: float = 3600  # seconds an in-memory entry lives
+    cache_dir: Optional[str] = None  # enables the on-disk tier
+    cache_disk_ttl: float = 24 * 3600
+    cache_unseeded: bool = False  # also cache sampled name/bio results requested without a seed
+
+    # Speculative bio generation right after a name is generated
+    prefetch_bio: bool = False
+    prefetch_max_inflight: int = 2  # speculative bios generated at once
+    prefetch_ttl: float = 60  # seconds an unclaimed speculative bio is kept
+    prefetch_default_diversity: float = 1.0  # for clients that haven't requested a bio yet (UI defaults)
+    prefetch_default_max_bio_length: int = 200
+
+    # Near-duplicate reuse of anime conversions (perceptual hash)
+    phash_enabled: bool = True
+    phash_max_distance: int = 6  # differing bits of the 64-bit hash still considered the same image
+    phash_max_entries: int = 4096  # converted inputs remembered, least recently used go first
+
+    # Micro-batching of concurrent inference calls
+    batch_name: bool = False
+    batch_bio: bool = False
+    batch_max_size: int = 8  # items per batched backend call
+    batch_max_wait_ms: float = 10  # how long the first item waits for company
+
+    # Admission control: concurrent inference calls per endpoint, 0 disables the limit
+    admission_name_concurrency: int = 8
+    admission_name_queue: int = 32  # calls waiting for a slot before new ones are shed with 503
+    admission_bio_concurrency: int = 4
+    admission_bio_queue: int = 16
+    admission_anime_concurrency: int = 2
+    admission_anime_queue: int = 8
+    admission_queue_timeout: float = 30.0  # seconds a call may wait for a slot
+
+    # Per-client fairness: clients are told apart by IP; this cookie (issued and signed by the server) tells sessions apart
+    client_cookie: str = "ficbot_session"
+    client_cookie_secret: Optional[str] = None  # signing key, shared by all workers; random per process if unset
+    fair_client_queue: int = 4  # calls one client may have waiting per endpoint
+    fair_rate: float = 0.0  # token-bucket refill per client per second, 0 disables rate limiting
+    fair_burst: float = 10.0  # bucket size
+    fair_name_cost: float = 1.0  # tokens taken per inference call
+    fair_bio_cost: float = 2.0
+    fair_anime_cost: float = 5.0
+
+    # Image normalization before name generation
+    normalize_images: bool = True
+    normalize_size: int = 256  # longest side sent to the name model, in pixels
+    normalize_quality: int = 90  # JPEG quality of the normalized image
+    normalize_max_pixels: int = 40_000_000  # decompression bomb guard
+
+    # Worker pools for blocking work kept off the event loop
+    executor_io_workers: int = 8  # threads for file reads and writes
+    executor_cpu_kind: str = "thread"  # "thread" or "process", for image validation and base64
+    executor_cpu_workers: int = 4
+    executor_queue: int = 64  # tasks waiting per pool before new ones are shed with 503
+
+    # Background jobs (anime conversion)
+    job_workers: int = 2  # jobs processed concurrently
+    job_queue_size: int = 100  # queued jobs before new ones are refused
+    job_result_ttl: float = 600  # seconds a finished job can still be polled
+
+    # Batch bio generation
+    bio_batch_max_items: int = 32  # names per /generate/bio/batch request
+    bio_batch_concurrency: int = 4  # items of one batch generated at once
+
+    # WebSocket session channel for the generation UI
+    session_channel: bool = True
+    session_max_operations: int = 8  # operations one connection may have running at once
+
+    # Diagnostics
+    server_timing: bool = True  # per-stage timings in a Server-Timing response header
+    admin_token: Optional[str] = None  # enables the /admin endpoints, sent in the X-Admin-Token header
+    profile_max_seconds: float = 300  # longest a profiling run may last
+
+    # Static files and pages, served from memory
+    static_max_age: int = 3600  # seconds static files requested without their fingerprint may be cached
+    static_cache_max_file_bytes: int = 2 * 1024 * 1024  # larger static files are served from disk
+    static_precompress: bool = True  # gzip (and brotli, if installed) variants of text files
+
+    # Logging, written out by a background thread
+    log_queue_size: int = 10000  # records waiting to be written before new ones are dropped
+    log_sample_rates: dict = {}  # fraction of INFO/DEBUG records kept per logger, e.g. {"httpx": 0.1}
+
+settings = Settings()
+
 UPLOAD_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif"}
 MAX_CONTENT_LENGTH = 2 * 1024 * 1024  # 2MB limit
 
@@ -21,7 +142,7 @@ LOGGING_CONFIG = {
     "disable_existing_loggers": False,
     "formatters": {
         "json": {
-            "format": '{"time": "%(asctime)s", "level": "%(levelname)s", "name": "%(name)s", "message": "%(message)s"}'
+            "()": "src.api.logs.JsonFormatter",
         }
     },
     "handlers": {
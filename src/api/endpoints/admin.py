@@ -0,0 +1,42 @@
+import asyncio
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from src.api.metrics import TimedJSONResponse
+from src.api.models.admin import ProfileRequest
+from src.api.profiling import profiler
+from src.api.config import settings
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Lets through requests with the admin token; the endpoints don't exist without one configured."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.post("/profile", status_code=202)
+async def start_profile(request_data: ProfileRequest):
+    """Samples the server's stacks for the next N requests or T seconds, into a flame graph profile."""
+    if not profiler.start(request_data.requests, request_data.seconds, request_data.interval_ms / 1000):
+        raise HTTPException(status_code=409, detail="Profiling is already running")
+    return TimedJSONResponse(status_code=202, content={"success": True, **profiler.stats()})
+
+
+@router.get("/profile")
+async def profile_status():
+    """Whether profiling is running, and where the last profile was written."""
+    return profiler.stats()
+
+
+@router.delete("/profile")
+async def stop_profile():
+    """Stops profiling now and writes the profile."""
+    output = await asyncio.to_thread(profiler.stop)
+    return {"success": True, "output": str(output) if output else None}
@@ -1,114 +1,165 @@
-import os
-import uuid 
-import base64
-import requests
-import dotenv
-
-from urllib.parse import urljoin
+import json
+import asyncio
+import logging
 
 from fastapi import Request, APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import StreamingResponse
 
-from src.api.models.generate import NameRequest, BioRequest
-from src.api.utils import get_local_image_path
-from src.api.config import settings, TEMPLATE_DIR, UPLOAD_DIR, ENV_DIR
+from src.api.models.generate import NameRequest, BioRequest, BioBatchRequest
+from src.api import services
+from src.api.store import image_store
+from src.api.static import pages
+from src.api.config import settings, UPLOAD_DIR
 
-if ENV_DIR.exists():
-    dotenv.load_dotenv(ENV_DIR)
-    VPS_URL = os.getenv("VPS_URL")
-    if not VPS_URL:
-        raise RuntimeError("VPS_URL is not set. Please configure your .env file.")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-templates = Jinja2Templates(directory=TEMPLATE_DIR)
-
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 
 @router.get("/name")
 async def render_name_page(request: Request):
     """Renders the name generation page."""
-    return templates.TemplateResponse("generation.html", {"request": request})
+    return pages.response(request.headers, "generation.html")
 
 
 @router.post("/name")
 async def generate_character_name(request_data: NameRequest):
     """Generates a name based on the request image."""
+    name = await name_for(request_data)
+    return {"success": True, "name": name}
 
-    # Construct file paths
-    img_path = get_local_image_path(request_data.imageSrc)
 
-    # Ensure the image file exists
-    if not os.path.exists(img_path):
+async def name_for(request_data: NameRequest) -> str:
+    # Resolve the image through the upload store index
+    image = image_store.resolve(request_data.imageSrc)
+    if image is None:
         raise HTTPException(status_code=404, detail="Image file not found")
-    
-    try:
-        with open(img_path, "rb") as img_file:
-            encoded_image = base64.b64encode(img_file.read()).decode()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error decoding an image: {str(e)}")
 
     if settings.testing:
-        return JSONResponse(content={"success": True, "name": "Test Name"})
-    
-    # Send request to Inference container
-    payload = {
-        "type": "name",
-        "image": encoded_image,
-        "diversity": request_data.diversity,
-        "min_name_length": request_data.min_name_length,
-        "max_name_length": request_data.max_name_length
-    }
-    response = requests.post(
-        urljoin(VPS_URL, "generate"),
-        json=payload
+        return "Test Name"
+
+    # Send the raw image to Inference container (unless the result is cached)
+    return await services.generate_name(
+        image,
+        diversity=request_data.diversity,
+        min_name_length=request_data.min_name_length,
+        max_name_length=request_data.max_name_length,
+        seed=request_data.seed,
+        no_cache=request_data.no_cache
     )
 
-    # Check response
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Inference function failed")
 
-    result = response.json()
+@router.post("/bio")
+async def generate_character_bio(request_data: BioRequest):
+    """Generates a bio based on the request name."""
+    bio = await bio_for(request_data)
+    return {"success": True, "bio": bio}
 
-    name = result.get("name", None)
-    if name:
-        return {"success": True, "name": name}
-    else:
-        raise HTTPException(status_code=500, detail="Name generation failed")
 
+async def bio_for(request_data: BioRequest) -> str:
+    if settings.testing:
+        return "Test Bio"
+
+    # Send request to Inference container (unless the result is cached)
+    return await services.generate_bio(
+        request_data.name,
+        diversity=request_data.diversity,
+        max_bio_length=request_data.max_bio_length,
+        seed=request_data.seed,
+        no_cache=request_data.no_cache
+    )
 
 
-@router.post("/bio")
-async def generate_character_bio(request_data: BioRequest):
-    """Generates a bio based on the request name."""
+async def batch_bios(items: list, concurrency: int):
+    """Generates the bios of `items`, `concurrency` at a time, yielding an NDJSON line as each completes."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(index: int, item: BioRequest) -> dict:
+        async with semaphore:
+            try:
+                return {"index": index, "success": True, "bio": await bio_for(item)}
+            except HTTPException as e:
+                return {"index": index, "success": False, "status": e.status_code, "detail": e.detail}
+            except Exception:
+                logger.exception(f"Batch bio item {index} failed")
+                return {"index": index, "success": False, "status": 500, "detail": "Internal server error"}
+
+    tasks = [asyncio.create_task(generate(index, item)) for index, item in enumerate(items)]
+    try:
+        for completed in asyncio.as_completed(tasks):
+            yield json.dumps(await completed) + "\n"
+    finally:
+        # Also runs when the client disconnects: drop the items not generated yet
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.post("/bio/batch")
+async def generate_character_bios(request_data: BioBatchRequest):
+    """Generates bios for many names, streaming each result as an NDJSON line as soon as it is ready."""
+    if len(request_data.items) > settings.bio_batch_max_items:
+        raise HTTPException(status_code=413, detail=f"At most {settings.bio_batch_max_items} items per batch")
+
+    return StreamingResponse(
+        batch_bios(request_data.items, settings.bio_batch_concurrency),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Formats a Server-Sent Event with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def relay_bio(first: str, chunks):
+    """Relays bio chunks as `data` events, then a `done` event with the whole bio."""
+    bio = [first]
+    try:
+        yield sse_event({"token": first})
+        async for chunk in chunks:
+            bio.append(chunk)
+            yield sse_event({"token": chunk})
+    except HTTPException as e:
+        yield sse_event({"detail": e.detail}, event="error")
+        return
+    finally:
+        # Also runs when the client disconnects, which closes the upstream stream
+        await chunks.aclose()
+    yield sse_event({"bio": "".join(bio)}, event="done")
+
+
+async def testing_bio_chunks():
+    for chunk in ("Test ", "Bio"):
+        yield chunk
+
+
+def bio_chunks(request_data: BioRequest):
+    """The bio for the request, chunk by chunk as the backend produces it."""
     if settings.testing:
-        return JSONResponse(content={"success": True, "bio": "Test Bio"})
-    
-    # Send request to Inference container
-    payload = {
-        "type": "bio",
-        "name": request_data.name,
-        "diversity": request_data.diversity,
-        "max_bio_length": request_data.max_bio_length,
-        "nsfw_on": False
-    }
-    url = urljoin(VPS_URL, "generate")
-    response = requests.post(
-        url,
-        json=payload
+        return testing_bio_chunks()
+    return services.stream_bio(
+        request_data.name,
+        diversity=request_data.diversity,
+        max_bio_length=request_data.max_bio_length,
+        seed=request_data.seed,
+        no_cache=request_data.no_cache
     )
 
-    # Check response
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Inference function failed")
 
-    result = response.json()
+@router.post("/bio/stream")
+async def stream_character_bio(request_data: BioRequest):
+    """Streams a bio based on the request name as Server-Sent Events."""
+    chunks = bio_chunks(request_data)
 
-    bio = result.get("bio", None)
-    if bio:
-        return {"success": True, "bio": bio}
-    else:
-        raise HTTPException(status_code=500, detail="Bio generation failed")
\ No newline at end of file
+    # Wait for the first chunk so that failures before it keep their status code
+    first = await anext(chunks)
+    return StreamingResponse(
+        relay_bio(first, chunks),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
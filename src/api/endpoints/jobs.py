@@ -0,0 +1,51 @@
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from src.api.metrics import TimedJSONResponse
+from src.api.models.generate import ImageRequest
+from src.api.endpoints.page import save_original
+from src.api import services
+
+router = APIRouter()
+
+
+@router.post("/convert_to_anime", status_code=202)
+async def submit_anime_job(request_data: ImageRequest):
+    """Queues an AnimeGAN2 conversion of a Base64 image and returns the job id right away."""
+    _, original = await save_original(request_data.image)
+
+    # Identical images share one job
+    job = await services.submit_anime_job(original, no_cache=request_data.no_cache)
+
+    return TimedJSONResponse(status_code=202, content={**job.as_dict(), "statusUrl": f"/jobs/{job.id}"})
+
+
+@router.get("/stats")
+async def job_stats():
+    """Queue depth and job counters."""
+    return {"anime": services.anime_jobs.stats()}
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Returns the status of a job, and its result once done."""
+    job = services.anime_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
+
+@router.websocket("/{job_id}/ws")
+async def watch_job(websocket: WebSocket, job_id: str):
+    """Pushes the status of a job on every change until it is finished."""
+    await websocket.accept()
+    job = services.anime_jobs.get(job_id)
+    if job is None:
+        await websocket.close(code=4404, reason="Job not found")
+        return
+
+    try:
+        async for state in services.anime_jobs.watch(job):
+            await websocket.send_json(state)
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
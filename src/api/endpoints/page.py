@@ -1,157 +1,125 @@
-import os
-import uuid 
 import base64
-import requests
-import dotenv
 import logging
 
 logger = logging.getLogger(__name__)
 
-from urllib.parse import urljoin
-
-from fastapi import Request, APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import Request, APIRouter, HTTPException
 
+from src.api.metrics import TimedJSONResponse
 from src.api.models.generate import ImageRequest
-from src.api.utils import validate_image, clean_old_images, get_local_image_path
-from src.api.config import settings, TEMPLATE_DIR, UPLOAD_DIR, UPLOAD_EXTENSIONS, MAX_CONTENT_LENGTH, ENV_DIR
+from src.api.utils import validate_image_file
+from src.api.uploads import ImageUploadParser, StreamedUpload, BROKEN_FILE
+from src.api.store import StoredImage, image_store
+from src.api.executor import io_pool, cpu_pool
+from src.api.retention import image_janitor
+from src.api.static import pages
+from src.api import services
+from src.api.config import settings, UPLOAD_DIR, UPLOAD_EXTENSIONS
 
 router = APIRouter()
 
-templates = Jinja2Templates(directory=TEMPLATE_DIR)
-
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-if ENV_DIR.exists():
-    dotenv.load_dotenv(ENV_DIR)
-    VPS_URL = os.getenv("VPS_URL")
-    if not VPS_URL:
-        raise RuntimeError("VPS_URL is not set. Please configure your .env file.")
-
 
 @router.get("/")
 @router.post("/")
 async def render(request: Request):
     """Render the generation.html template."""
-    return templates.TemplateResponse("generation.html", {"request": request})
+    return pages.response(request.headers, "generation.html")
 
 
 @router.get("/upload_image")
 async def upload_image_page(request: Request):
     """Renders the image upload page."""
-    return templates.TemplateResponse("generation.html", {"request": request})
+    return pages.response(request.headers, "generation.html")
 
 
-@router.post("/upload_image")
-async def upload_image(file: UploadFile = File(...)):
+@router.post("/upload_image", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+})
+async def upload_image(request: Request):
     """Saves the uploaded image and returns it to the client."""
-    # Secure filename & validate extension
-    file_ext = os.path.splitext(file.filename)[1].lower()
+    # Stream the body into the store, rejecting bad extensions, sizes and magic numbers early
+    upload = await ImageUploadParser(request).parse()
 
-    if file_ext not in UPLOAD_EXTENSIONS:
-        raise HTTPException(status_code=415, detail="Wrong extension: only .jpg, .png, .gif files are allowed")
-    
-    filename = f"{uuid.uuid4().hex}{file_ext}"
+    image = await accept_upload(upload)
 
-    # Validate image integrity
-    image_bytes = await file.read()  # Read image content
-
-    # Check file size (assuming 2MB limit)
-    if len(image_bytes) > MAX_CONTENT_LENGTH:
-        raise HTTPException(status_code=413, detail="File is too large. Only .jpg, .png, .gif up to 2MB are allowed.")
-
-    if validate_image(image_bytes) not in UPLOAD_EXTENSIONS:
-        raise HTTPException(status_code=415, detail="Broken file: only valid .jpg, .png, .gif files are allowed. Please check your image and try again.")
+    # Generate URL (assuming FastAPI serves static files from /static/)
+    image_url = image.url
 
-    # Delete old images (except example.jpg)
-    clean_old_images(exclude=["example.jpg", "me_20250627.jpg"])
+    logger.info(f"Returning JSON: {{'success': True, 'imgUrl': '{image_url}'}}")
 
-    # Save the file
-    save_path = UPLOAD_DIR / filename
-    with open(save_path, "wb") as f:
-        f.write(image_bytes)
+    return TimedJSONResponse(content={"success": True, "imgUrl": image_url})
 
-    # Generate URL (assuming FastAPI serves static files from /static/)
-    image_url = f"/static/images/{filename}"
 
-    logger.info(f"Returning JSON: {{'success': True, 'imgUrl': '{image_url}'}}")
+async def accept_upload(upload: StreamedUpload) -> StoredImage:
+    """Validates an uploaded file and adds it to the store."""
+    try:
+        # Delete expired images (except the bundled examples)
+        await image_janitor.maybe_sweep()
 
-    return JSONResponse(content={"success": True, "imgUrl": image_url})
+        # Identical bytes are already stored (and validated): reuse the existing file
+        if image_store.get(upload.pending.digest) is None:
+            # Validate image integrity off the event loop
+            detected_ext = await cpu_pool.run("validate_image", validate_image_file, upload.path)
+            if detected_ext not in UPLOAD_EXTENSIONS:
+                raise HTTPException(status_code=415, detail=BROKEN_FILE)
+    except BaseException:
+        # Broken, shed, cancelled or disconnected: don't leave the temporary file behind
+        upload.pending.discard()
+        raise
 
+    return upload.pending.commit()
 
-@router.post("/convert_to_anime")
-async def convert_to_anime(request_data: ImageRequest):
-    """Receives a Base64 image, processes it with AnimeGAN2, saves the output, and returns the new URL."""
 
-    # Decode Base64 input to raw image bytes
+async def save_original(image: str) -> tuple:
+    """Decodes a Base64 image and stores it, returning the raw bytes and the stored image."""
     try:
-        image_bytes = base64.b64decode(request_data.image)
+        image_bytes = await cpu_pool.run("b64decode", base64.b64decode, image)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid Base64 image: {str(e)}")
 
-    # Generate a unique filename for the input image
-    original_filename = f"original_{uuid.uuid4().hex}.png"
-    original_image_path = UPLOAD_DIR / original_filename
-
-    # Save the uploaded image
     try:
-        with open(original_image_path, "wb") as f:
-            f.write(image_bytes)
+        pending = await io_pool.run("image_write", image_store.write_bytes, image_bytes, ".png", "original_")
+        original = pending.commit()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving uploaded image: {str(e)}")
+    return image_bytes, original
 
-    if settings.testing:
-        return JSONResponse(content={"success": True, "animeImgUrl": f"static/images/{original_filename}"})
-
-    # Encode the saved image as Base64 to send to inference
-    with open(original_image_path, "rb") as img_file:
-        encoded_image = base64.b64encode(img_file.read()).decode()
 
-    # Send request to Inference container
-    payload = {
-        "image": encoded_image
-    }
-
-    # AnimeGAN2 PyTorch implementation sourced from:
-    # https://github.com/bryandlee/animegan2-pytorch
+@router.post("/convert_to_anime")
+async def convert_to_anime(request_data: ImageRequest):
+    """Receives a Base64 image, processes it with AnimeGAN2, saves the output, and returns the new URL."""
 
-    response = requests.post(
-        urljoin(VPS_URL, "convert_to_anime"),
-        json=payload
-    )
+    # Decode the Base64 input and save it under its content hash
+    image_bytes, original = await save_original(request_data.image)
 
-    # Check response
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Anime conversion failed")
+    anime_image_url = await anime_url(image_bytes, original, no_cache=request_data.no_cache)
 
-    result = response.json()
-    anime_image_base64 = result.get("anime_image", None)
-    
-    if not anime_image_base64:
-        raise HTTPException(status_code=500, detail="Anime conversion failed")
+    return TimedJSONResponse(content={"success": True, "animeImgUrl": anime_image_url})
 
-    # Decode Base64 back into image bytes
-    try:
-        anime_image_bytes = base64.b64decode(anime_image_base64)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error decoding anime image: {str(e)}")
 
-    # Generate a unique filename for the anime output image
-    anime_filename = f"anime_{uuid.uuid4().hex}.png"
-    anime_image_path = UPLOAD_DIR / anime_filename
+async def anime_url(image_bytes: bytes, original: StoredImage, no_cache: bool = False) -> str:
+    """Converts a saved original to anime and returns the URL of the result."""
+    if settings.testing:
+        return f"static/images/{original.filename}"
 
-    # Save the anime image
-    try:
-        with open(anime_image_path, "wb") as f:
-            f.write(anime_image_bytes)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error saving anime image: {str(e)}")
+    # Send the raw bytes to Inference container (unless the result is cached)
+    anime = await services.convert_to_anime(image_bytes, original, no_cache=no_cache)
 
-    # Clean up old images
-    clean_old_images(exclude=["example.jpg", "me_20250627.jpg", original_filename, anime_filename])
+    # Clean up expired images
+    await image_janitor.maybe_sweep()
 
     # Generate public URL for the anime image
-    anime_image_url = f"static/images/{anime_filename}"
-
-    return JSONResponse(content={"success": True, "animeImgUrl": anime_image_url})
\ No newline at end of file
+    return f"static/images/{anime.filename}"
@@ -0,0 +1,214 @@
+"""WebSocket session channel for the generation UI.
+
+One connection carries the upload, name, bio and anime operations as JSON
+messages, instead of a request each. Every operation message has a
+client-chosen `id` and a `type`, plus the fields of the matching REST
+request body:
+
+    {"id": 1, "type": "upload", "filename": "me.png", "image": "<base64>"}
+    {"id": 2, "type": "name", "imageSrc": "static/images/...", "diversity": 1.0, ...}
+    {"id": 3, "type": "bio", "name": "Jane", "diversity": 1.0, "max_bio_length": 200}
+    {"id": 4, "type": "anime", "image": "<base64>"}
+    {"id": 3, "type": "cancel"}
+
+Operations run concurrently and the server pushes, tagged with the `id`:
+`progress` messages (a `stage`, or a bio `token`), then one of `result`
+(the same fields as the REST response), `error` (`status` and `detail`, as
+the REST error would have) or `cancelled`. Cancelling an operation stops
+its backend call; closing the connection cancels all of them.
+
+Operations go through the same validation and inference code as the REST
+routes, so both behave alike.
+"""
+import json
+import base64
+import asyncio
+import logging
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, ValidationError
+
+from src.api.models.generate import ImageRequest, NameRequest, BioRequest
+from src.api.models.session import UploadMessage
+from src.api.endpoints.generate import name_for, bio_chunks
+from src.api.endpoints.page import accept_upload, anime_url, save_original
+from src.api.uploads import receive_image_bytes, TOO_LARGE
+from src.api.executor import cpu_pool
+from src.api import metrics
+from src.api.config import settings, MAX_CONTENT_LENGTH
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class Session:
+    """The operations of one session channel connection, keyed by their ids."""
+
+    def __init__(self, websocket: WebSocket, max_operations: int):
+        self.websocket = websocket
+        self.max_operations = max_operations
+        self.operations = {}  # id -> asyncio.Task
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict):
+        if self.closed:
+            return
+        try:
+            async with self._send_lock:
+                await self.websocket.send_json(message)
+        except (WebSocketDisconnect, RuntimeError):
+            self.closed = True  # the client went away; the receive loop cleans up
+
+    async def error(self, op_id, status_code: int, detail):
+        await self.send({"id": op_id, "type": "error", "status": status_code, "detail": detail})
+
+    async def progress(self, op_id, **fields):
+        await self.send({"id": op_id, "type": "progress", **fields})
+
+    async def handle(self, message):
+        """Starts or cancels an operation."""
+        if not isinstance(message, dict):
+            await self.error(None, 400, "Expected a JSON object")
+            return
+        op_id, op_type = message.get("id"), message.get("type")
+        if not isinstance(op_id, (str, int)) or isinstance(op_id, bool):
+            await self.error(None, 400, "Every message needs a string or integer `id`")
+            return
+
+        if op_type == "cancel":
+            task = self.operations.get(op_id)
+            if task is None:
+                await self.error(op_id, 404, "No such operation in progress")
+            else:
+                task.cancel()
+            return
+
+        if op_type not in OPERATIONS:
+            await self.error(op_id, 400, f"Unknown message type: {op_type}")
+            return
+        if op_id in self.operations:
+            await self.error(op_id, 409, "An operation with this id is in progress")
+            return
+        if len(self.operations) >= self.max_operations:
+            await self.error(op_id, 429, "Too many operations in progress on this connection")
+            return
+
+        model, run = OPERATIONS[op_type]
+        try:
+            request_data = model.model_validate(message)
+        except ValidationError as e:
+            await self.error(op_id, 422, json.loads(e.json(include_url=False)))
+            return
+        self.operations[op_id] = asyncio.create_task(self._run(op_id, op_type, run, request_data))
+
+    async def _run(self, op_id, op_type: str, run, request_data: BaseModel):
+        try:
+            result = await run(self, op_id, request_data)
+        except asyncio.CancelledError:
+            metrics.session_operations.inc(type=op_type, outcome="cancelled")
+            if self.closed:
+                raise
+            await self.send({"id": op_id, "type": "cancelled"})
+        except HTTPException as e:
+            metrics.session_operations.inc(type=op_type, outcome="error")
+            await self.error(op_id, e.status_code, e.detail)
+        except Exception:
+            logger.exception(f"Session {op_type} operation failed")
+            metrics.session_operations.inc(type=op_type, outcome="error")
+            await self.error(op_id, 500, "Internal server error")
+        else:
+            metrics.session_operations.inc(type=op_type, outcome="result")
+            await self.send({"id": op_id, "type": "result", **result})
+        finally:
+            self.operations.pop(op_id, None)
+
+    async def close(self):
+        """Cancels the operations still running, once the client is gone."""
+        self.closed = True
+        tasks = list(self.operations.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_upload(session: Session, op_id, request_data: UploadMessage) -> dict:
+    # Base64 takes 4 characters per 3 bytes: refuse oversized images before decoding them
+    if len(request_data.image) > (MAX_CONTENT_LENGTH + 2) // 3 * 4:
+        raise HTTPException(status_code=413, detail=TOO_LARGE)
+    try:
+        data = await cpu_pool.run("b64decode", base64.b64decode, request_data.image)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid Base64 image: {str(e)}")
+
+    upload = await receive_image_bytes(request_data.filename, data)
+    image = None
+    try:
+        await session.progress(op_id, stage="validating")
+        image = await accept_upload(upload)
+    finally:
+        # Cancelled or failed before the commit: drop the temporary file
+        if image is None:
+            upload.pending.discard()
+    return {"success": True, "imgUrl": image.url}
+
+
+async def run_name(session: Session, op_id, request_data: NameRequest) -> dict:
+    return {"success": True, "name": await name_for(request_data)}
+
+
+async def run_bio(session: Session, op_id, request_data: BioRequest) -> dict:
+    chunks = bio_chunks(request_data)
+    bio = []
+    try:
+        async for chunk in chunks:
+            bio.append(chunk)
+            await session.progress(op_id, token=chunk)
+    finally:
+        # Also runs on cancellation, which closes the upstream stream
+        await chunks.aclose()
+    return {"success": True, "bio": "".join(bio)}
+
+
+async def run_anime(session: Session, op_id, request_data: ImageRequest) -> dict:
+    image_bytes, original = await save_original(request_data.image)
+    await session.progress(op_id, stage="converting")
+    return {"success": True, "animeImgUrl": await anime_url(image_bytes, original, no_cache=request_data.no_cache)}
+
+
+# Message type -> (request model, operation)
+OPERATIONS = {
+    "upload": (UploadMessage, run_upload),
+    "name": (NameRequest, run_name),
+    "bio": (BioRequest, run_bio),
+    "anime": (ImageRequest, run_anime),
+}
+
+
+@router.websocket("/session")
+async def session_channel(websocket: WebSocket):
+    """Runs generation operations sent as messages, pushing their progress and results."""
+    await websocket.accept()
+    if not settings.session_channel:
+        await websocket.close(code=4404, reason="Session channel disabled")
+        return
+
+    session = Session(websocket, settings.session_max_operations)
+    metrics.session_connections.inc()
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                await session.error(None, 400, "Invalid JSON")
+                continue
+            await session.handle(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+        metrics.session_connections.dec()
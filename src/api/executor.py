@@ -0,0 +1,130 @@
+import time
+import asyncio
+import logging
+from typing import Optional
+from functools import partial
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from fastapi import HTTPException
+
+from src.api.config import settings
+from src.api.metrics import observe_task
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(fn, *args, **kwargs):
+    """Runs `fn` in the worker, returning when it started along with its result."""
+    return time.time(), fn(*args, **kwargs)
+
+
+class TaskTiming:
+    """Counters of one kind of pool task: queue wait and run time, in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def record(self, wait: float, run: float):
+        self.count += 1
+        self.wait_total += wait
+        self.run_total += run
+        self.run_max = max(self.run_max, run)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_wait": self.wait_total / self.count if self.count else 0.0,
+            "mean_run": self.run_total / self.count if self.count else 0.0,
+            "max_run": self.run_max,
+        }
+
+
+class WorkerPool:
+    """Bounded executor for blocking work that must stay off the event loop.
+
+    At most `max_workers` tasks run at once and `max_queue` more may wait;
+    beyond that `run()` sheds the call with a 503 instead of letting the
+    backlog grow. Queue wait and run time are recorded per task label.
+
+    A "process" pool sidesteps the GIL for pure-Python CPU work, but only
+    takes picklable functions and arguments, and pays for copying them
+    between processes.
+    """
+
+    def __init__(self, name: str, kind: str = "thread", max_workers: int = 4, max_queue: int = 64):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+
+        self.pending = 0
+        self.rejected = 0
+        self.timings = {}  # label -> TaskTiming
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._executor
+
+    async def run(self, label: str, fn, *args, **kwargs):
+        """Runs `fn(*args, **kwargs)` in the pool and returns its result.
+
+        Raises:
+            HTTPException: 503 if the pool's queue is full.
+        """
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server is busy, try again later", headers={"Retry-After": "1"})
+
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        future = self.executor.submit(partial(_timed, fn, *args, **kwargs))
+        # Counted until the worker is done with it, even when the caller stops waiting first
+        self.pending += 1
+        future.add_done_callback(lambda _: self._finished(loop))
+        started, result = await asyncio.wrap_future(future)
+
+        finished = time.time()
+        self.timings.setdefault(label, TaskTiming()).record(max(started - submitted, 0.0), finished - started)
+        observe_task(label, finished - submitted)
+        return result
+
+    def _finished(self, loop: asyncio.AbstractEventLoop):
+        """Done callback of a task, called in a worker (or the pool's management) thread."""
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass  # the loop is closed, nobody is counting anymore
+
+    def _release(self):
+        self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "tasks": {label: timing.as_dict() for label, timing in self.timings.items()},
+        }
+
+
+# File reads and writes
+io_pool = WorkerPool("io", max_workers=settings.executor_io_workers, max_queue=settings.executor_queue)
+
+# Image decoding/validation and base64 of large payloads
+cpu_pool = WorkerPool("cpu", kind=settings.executor_cpu_kind, max_workers=settings.executor_cpu_workers,
+                      max_queue=settings.executor_queue)
@@ -0,0 +1,150 @@
+import hmac
+import time
+import uuid
+import hashlib
+import secrets
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from src.api.config import settings
+
+# Identity of the client behind the current request, set by ClientIdentityMiddleware
+current_client: ContextVar[str] = ContextVar("current_client", default="anonymous")
+# Browser session of the current request (its client identity until a session cookie comes back)
+current_session: ContextVar[str] = ContextVar("current_session", default="anonymous")
+
+# Signs the session cookies when no CLIENT_COOKIE_SECRET is configured (cookies then last until a restart)
+_process_secret = secrets.token_bytes(32)
+
+SESSION_COOKIE_MAX_AGE = 365 * 24 * 3600
+
+
+def _signature(session: str) -> str:
+    secret = settings.client_cookie_secret.encode("utf-8") if settings.client_cookie_secret else _process_secret
+    return hmac.new(secret, session.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def new_session_cookie() -> str:
+    """A fresh session id with its signature, as issued to clients."""
+    session = uuid.uuid4().hex
+    return f"{session}.{_signature(session)}"
+
+
+def verified_session(value: Optional[str]) -> Optional[str]:
+    """The session id of a cookie this server issued, None for missing or forged ones."""
+    session, _, signature = (value or "").partition(".")
+    if session and hmac.compare_digest(signature, _signature(session)):
+        return session
+    return None
+
+
+def client_id(conn: HTTPConnection) -> str:
+    """Identifies a client by its IP address, for its token bucket and share of the queues.
+
+    Session cookies don't count here: anyone can collect as many of them as
+    they like, and with them as many buckets and queue shares.
+    """
+    if conn.client is not None:
+        return f"ip:{conn.client.host}"
+    return "anonymous"
+
+
+def session_id(conn: HTTPConnection) -> Optional[str]:
+    """Identifies a browser session by the signed session cookie, None without a valid one.
+
+    Only cookies issued (and signed) by the server count.
+    """
+    session = verified_session(conn.cookies.get(settings.client_cookie))
+    return f"session:{session}" if session else None
+
+
+class ClientIdentityMiddleware:
+    """ASGI middleware exposing the client identity to the inference layer.
+
+    Fair scheduling and rate limiting key on `current_client`, the client
+    address; per-user state such as speculative bios keys on
+    `current_session`, so users sharing an address don't take each other's.
+    HTTP responses to clients without a valid session cookie issue one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        conn = HTTPConnection(scope)
+        identity = client_id(conn)
+        session = session_id(conn)
+        if scope["type"] == "http" and session is None:
+            cookie = new_session_cookie()
+
+            async def send_with_cookie(message):
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append("set-cookie", f"{settings.client_cookie}={cookie}; Path=/; "
+                                                 f"Max-Age={SESSION_COOKIE_MAX_AGE}; HttpOnly; SameSite=Lax")
+                await send(message)
+        else:
+            send_with_cookie = send
+
+        client_token = current_client.set(identity)
+        session_token = current_session.set(session or identity)
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            current_session.reset(session_token)
+            current_client.reset(client_token)
+
+
+class BucketStore(ABC):
+    """Token-bucket state per client.
+
+    The in-memory store only limits the process it lives in; a store
+    shared between workers (e.g. backed by Redis) can be swapped in.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        """Takes `cost` tokens from the bucket `key`, refilled at `rate` per second up to `burst`.
+
+        Returns:
+            float: 0 if the tokens were taken, else seconds until they would be available.
+        """
+
+
+class MemoryBucketStore(BucketStore):
+    """Buckets in process memory; the least recently used are dropped beyond `max_keys`."""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+
+        if tokens >= cost:
+            tokens -= cost
+            wait = 0.0
+        else:
+            wait = (cost - tokens) / rate
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+bucket_store = MemoryBucketStore()
@@ -0,0 +1,412 @@
+import json
+import time
+import base64
+import asyncio
+import logging
+import importlib.util
+from typing import Optional
+
+import httpx
+
+from fastapi import HTTPException
+
+from src.api.config import settings
+from src.api.backends import BackendPool, RetryBudget
+from src.api.executor import io_pool, cpu_pool
+
+logger = logging.getLogger(__name__)
+
+# Form field the image is sent in; an older backend's validation error names it when the body isn't JSON
+IMAGE_FIELD = "image"
+
+# Statuses a backend without the batch endpoint answers with
+NO_BATCH_STATUS = {404, 405}
+
+
+def b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+async def encode_image(image: bytes) -> str:
+    """Base64-encodes an image in the CPU pool."""
+    return await cpu_pool.run("b64encode", b64encode, image)
+
+
+def build_pool(urls: list) -> BackendPool:
+    """Builds a backend pool configured from settings."""
+    return BackendPool(
+        urls,
+        strategy=settings.inference_balance,
+        max_retries=settings.inference_max_retries,
+        retry_budget=RetryBudget(ratio=settings.inference_retry_ratio),
+        hedge_delay=settings.inference_hedge_delay,
+        failure_threshold=settings.inference_failure_threshold,
+        cooldown=settings.inference_breaker_cooldown,
+        probe_path=settings.inference_probe_path,
+        probe_interval=settings.inference_probe_interval,
+    )
+
+
+class InferenceClient:
+    """Async client for the inference service, shared for the lifetime of the app.
+
+    A single pooled httpx.AsyncClient is created lazily on first use, so
+    keep-alive connections are reused across requests instead of opening
+    a fresh TCP/TLS connection per call. Requests are routed across the
+    configured backends by a BackendPool. Call `start()` on startup to
+    enable background health probing and `aclose()` on shutdown.
+
+    Images are sent as raw bytes (multipart or application/octet-stream)
+    and anime results are streamed straight to disk. In "auto" transport
+    mode a backend that rejects binary bodies is spoken to in
+    base64-in-JSON instead, for `inference_fallback_ttl` seconds before
+    binary is tried again.
+    """
+
+    def __init__(self, urls: Optional[list] = None, pool: Optional[BackendPool] = None, transport: Optional[str] = None):
+        self._urls = urls
+        self._pool = pool
+        self._transport = transport
+        self._json_only = {}  # path -> when to try binary bodies again, after the backend rejected one
+        self._batch_retry_at = 0.0  # while in the future, batches are sent as single calls
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def transport(self) -> str:
+        return self._transport or settings.inference_transport
+
+    @property
+    def pool(self) -> BackendPool:
+        if self._pool is None:
+            urls = self._urls
+            if urls is None:
+                urls = [url.strip() for url in (settings.vps_url or "").split(",") if url.strip()]
+            if not urls:
+                raise HTTPException(status_code=500, detail="Inference service is not configured")
+            self._pool = build_pool(urls)
+        return self._pool
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = settings.inference_http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("inference_http2 is enabled but the `h2` package is not installed, falling back to HTTP/1.1")
+            http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.inference_pool_size,
+                max_keepalive_connections=settings.inference_keepalive,
+            ),
+            timeout=httpx.Timeout(
+                settings.inference_read_timeout,
+                connect=settings.inference_connect_timeout,
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def post(self, path: str, payload: dict, error_detail: str = "Inference function failed", hedge: bool = False) -> dict:
+        """Sends a JSON payload to the inference service and returns the decoded response."""
+        response = await self.pool.post(self.client, path, hedge=hedge, json=payload)
+        return self._decode(response, error_detail)
+
+    @staticmethod
+    def _decode(response: httpx.Response, error_detail: str) -> dict:
+        if response.status_code != 200:
+            raise HTTPException(status_code=502, detail=error_detail)
+        return response.json()
+
+    async def _post_image(self, path: str, binary: dict, payload, stream: bool = False) -> httpx.Response:
+        """Posts an image in the configured transport, falling back to base64-in-JSON for old backends.
+
+        :param binary: request arguments (content/files/data/headers) for the binary transport
+        :param payload: async callable returning the JSON payload, only built when needed
+        """
+        if self.transport != "json" and not self._sends_json(path):
+            response = await self.pool.post(self.client, path, stream=stream, **binary)
+            if self.transport == "binary" or not await self._rejects_binary(response):
+                return response
+
+            await response.aclose()
+            logger.warning(f"Inference backend rejected a binary body on /{path} (status {response.status_code}), falling back to JSON")
+            self._json_only[path] = time.monotonic() + settings.inference_fallback_ttl
+
+        return await self.pool.post(self.client, path, stream=stream, json=await payload())
+
+    def _sends_json(self, path: str) -> bool:
+        """Whether binary bodies to `path` were rejected recently, so base64-in-JSON is sent."""
+        retry_at = self._json_only.get(path)
+        if retry_at is None:
+            return False
+        if retry_at <= time.monotonic():
+            del self._json_only[path]
+            return False
+        return True
+
+    @staticmethod
+    async def _rejects_binary(response: httpx.Response) -> bool:
+        """Whether the backend answered like an older one that only understands base64-in-JSON.
+
+        That is a 415, or a 422 naming the image field; any other error
+        (a bad image, a missing route) is the call's own failure.
+        """
+        if response.status_code == 415:
+            return True
+        if response.status_code != 422:
+            return False
+        try:
+            await response.aread()
+            errors = response.json().get("detail")
+        except (httpx.HTTPError, ValueError, AttributeError):
+            return False
+        return isinstance(errors, list) and any(
+            isinstance(error, dict) and IMAGE_FIELD in (error.get("loc") or []) for error in errors
+        )
+
+    @staticmethod
+    def _name_params(diversity: float, min_name_length: int, max_name_length: int, seed: Optional[int] = None) -> dict:
+        params = {
+            "type": "name",
+            "diversity": diversity,
+            "min_name_length": min_name_length,
+            "max_name_length": max_name_length
+        }
+        if seed is not None:
+            params["seed"] = seed
+        return params
+
+    @staticmethod
+    def _bio_params(name: str, diversity: float, max_bio_length: int, seed: Optional[int] = None) -> dict:
+        payload = {
+            "type": "bio",
+            "name": name,
+            "diversity": diversity,
+            "max_bio_length": max_bio_length,
+            "nsfw_on": False
+        }
+        if seed is not None:
+            payload["seed"] = seed
+        return payload
+
+    async def generate_name(self, image: bytes, diversity: float, min_name_length: int, max_name_length: int,
+                            content_type: str = "application/octet-stream", seed: Optional[int] = None) -> str:
+        """Generates a character name from raw image bytes.
+
+        A `seed` makes the backend's sampling deterministic.
+        """
+        params = self._name_params(diversity, min_name_length, max_name_length, seed)
+        binary = {"data": params, "files": {IMAGE_FIELD: ("image", image, content_type)}}
+
+        async def payload():
+            return {**params, "image": await encode_image(image)}
+
+        response = await self._post_image("generate", binary, payload)
+        result = self._decode(response, "Inference function failed")
+
+        name = result.get("name", None)
+        if not name:
+            raise HTTPException(status_code=502, detail="Name generation failed")
+        return name
+
+    async def generate_bio(self, name: str, diversity: float, max_bio_length: int, seed: Optional[int] = None) -> str:
+        """Generates a character bio for the given name.
+
+        A `seed` makes the backend's sampling deterministic.
+        """
+        payload = self._bio_params(name, diversity, max_bio_length, seed)
+        result = await self.post("generate", payload, hedge=settings.inference_hedge_bio)
+
+        bio = result.get("bio", None)
+        if not bio:
+            raise HTTPException(status_code=502, detail="Bio generation failed")
+        return bio
+
+    async def stream_bio(self, name: str, diversity: float, max_bio_length: int, seed: Optional[int] = None):
+        """Streams a character bio for the given name, yielding text chunks as they are generated.
+
+        The backend is asked for Server-Sent Events; one that answers with a
+        plain JSON result is relayed as a single chunk. Closing the generator
+        early closes the upstream connection, which stops the generation.
+        """
+        payload = {**self._bio_params(name, diversity, max_bio_length, seed), "stream": True}
+        response = await self.pool.post(
+            self.client, "generate", stream=True, json=payload,
+            headers={"Accept": "text/event-stream, application/json"},
+        )
+
+        try:
+            if response.status_code != 200:
+                raise HTTPException(status_code=502, detail="Inference function failed")
+
+            if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                await response.aread()
+                bio = response.json().get("bio", None)
+                if not bio:
+                    raise HTTPException(status_code=502, detail="Bio generation failed")
+                yield bio
+                return
+
+            event = "message"
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    if event == "error":
+                        raise HTTPException(status_code=502, detail="Bio generation failed")
+                    token = json.loads(data).get("token")
+                    if token:
+                        yield token
+                elif not line:
+                    event = "message"
+
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Reading the bio stream failed: {e!r}")
+            raise HTTPException(status_code=502, detail="Bio generation failed")
+        finally:
+            await response.aclose()
+
+    async def _unbatched(self, call, items: list) -> list:
+        """Runs a batch as concurrent single calls, for backends without the batch endpoint."""
+        return await asyncio.gather(*(call(**item) for item in items), return_exceptions=True)
+
+    @property
+    def _batch_supported(self) -> bool:
+        """False for `inference_fallback_ttl` seconds after the backend answered without a batch endpoint."""
+        return time.monotonic() >= self._batch_retry_at
+
+    def _batch_results(self, response: httpx.Response, field: str, count: int, error_detail: str) -> list:
+        if response.status_code in NO_BATCH_STATUS:
+            logger.warning("Inference backend has no batch endpoint, sending batched items one by one")
+            self._batch_retry_at = time.monotonic() + settings.inference_fallback_ttl
+            return None
+
+        results = self._decode(response, "Inference function failed").get("results")
+        if not isinstance(results, list) or len(results) != count:
+            raise HTTPException(status_code=502, detail="Inference function failed")
+        # A malformed item only fails its own caller
+        return [
+            (result.get(field) if isinstance(result, dict) else None) or HTTPException(status_code=502, detail=error_detail)
+            for result in results
+        ]
+
+    async def generate_name_batch(self, items: list) -> list:
+        """Generates names for several images in one backend call.
+
+        :param items: dicts of `generate_name` keyword arguments
+        :return: a name or an HTTPException per item, in order
+        """
+        if len(items) == 1 or not self._batch_supported:
+            return await self._unbatched(self.generate_name, items)
+
+        params = [
+            self._name_params(item["diversity"], item["min_name_length"], item["max_name_length"], item.get("seed"))
+            for item in items
+        ]
+        binary = {
+            "data": {"type": "name", "items": json.dumps(params)},
+            "files": [
+                (IMAGE_FIELD, (f"image{i}", item["image"], item.get("content_type", "application/octet-stream")))
+                for i, item in enumerate(items)
+            ],
+        }
+
+        async def payload():
+            images = await asyncio.gather(*(encode_image(item["image"]) for item in items))
+            return {"type": "name", "items": [
+                {**item_params, "image": image} for item_params, image in zip(params, images)
+            ]}
+
+        response = await self._post_image("generate/batch", binary, payload)
+
+        results = self._batch_results(response, "name", len(items), "Name generation failed")
+        if results is None:
+            return await self._unbatched(self.generate_name, items)
+        return results
+
+    async def generate_bio_batch(self, items: list) -> list:
+        """Generates bios for several names in one backend call.
+
+        :param items: dicts of `generate_bio` keyword arguments
+        :return: a bio or an HTTPException per item, in order
+        """
+        if len(items) == 1 or not self._batch_supported:
+            return await self._unbatched(self.generate_bio, items)
+
+        payload = {"type": "bio", "items": [
+            self._bio_params(item["name"], item["diversity"], item["max_bio_length"], item.get("seed")) for item in items
+        ]}
+        response = await self.pool.post(self.client, "generate/batch", json=payload)
+
+        results = self._batch_results(response, "bio", len(items), "Bio generation failed")
+        if results is None:
+            return await self._unbatched(self.generate_bio, items)
+        return results
+
+    async def convert_to_anime(self, image: bytes, out):
+        """Runs AnimeGAN2 on raw image bytes and streams the resulting image into `out`.
+
+        :param out: writable binary file-like object; on error it may hold a partial result
+        """
+        # AnimeGAN2 PyTorch implementation sourced from:
+        # https://github.com/bryandlee/animegan2-pytorch
+        binary = {
+            "content": image,
+            "headers": {"Content-Type": "application/octet-stream", "Accept": "image/png, application/json"},
+        }
+
+        async def payload():
+            return {"image": await encode_image(image)}
+
+        response = await self._post_image("convert_to_anime", binary, payload, stream=True)
+
+        try:
+            if response.status_code != 200:
+                raise HTTPException(status_code=502, detail="Anime conversion failed")
+
+            if response.headers.get("content-type", "").startswith("image/"):
+                # Binary result: write it out as it arrives, no full-buffer copy
+                async for chunk in response.aiter_bytes():
+                    await io_pool.run("anime_write", out.write, chunk)
+                return
+
+            # Legacy base64-in-JSON result
+            await response.aread()
+            anime_image = (await cpu_pool.run("json_decode", json.loads, response.content)).get("anime_image", None)
+            if not anime_image:
+                raise HTTPException(status_code=502, detail="Anime conversion failed")
+            try:
+                anime_image_bytes = await cpu_pool.run("b64decode", base64.b64decode, anime_image)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=502, detail=f"Error decoding anime image: {str(e)}")
+            await io_pool.run("anime_write", out.write, anime_image_bytes)
+
+        except httpx.HTTPError as e:
+            logger.error(f"Reading the anime conversion result failed: {e!r}")
+            raise HTTPException(status_code=502, detail="Anime conversion failed")
+        finally:
+            await response.aclose()
+
+    def start(self):
+        """Starts background health probing of the backends (needs a running event loop)."""
+        if settings.vps_url or self._urls or self._pool:
+            self.pool.start_probing(self.client)
+
+    async def aclose(self):
+        if self._pool is not None:
+            await self._pool.stop_probing()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+inference_client = InferenceClient()
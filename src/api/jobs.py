@@ -0,0 +1,242 @@
+import time
+import uuid
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+from src.api.config import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised by a JobQueue that cannot accept more jobs."""
+
+
+class JobQueue(ABC):
+    """Queue feeding job ids to the workers.
+
+    Only job ids go through the queue (job state stays with the manager),
+    so a broker-backed implementation just has to move strings.
+    """
+
+    @abstractmethod
+    async def put(self, job_id: str):
+        """Enqueues a job id, raising JobQueueFull when there is no room."""
+
+    @abstractmethod
+    async def get(self) -> str:
+        """Waits for and removes the next job id."""
+
+    @abstractmethod
+    def depth(self) -> int:
+        """Number of job ids waiting in the queue."""
+
+
+class MemoryJobQueue(JobQueue):
+    """In-process queue, bound to the event loop that first waits on it."""
+
+    def __init__(self, max_size: int = 0):
+        self._queue = asyncio.Queue(maxsize=max_size)
+
+    async def put(self, job_id: str):
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            raise JobQueueFull()
+
+    async def get(self) -> str:
+        return await self._queue.get()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+
+class Job:
+    """A unit of background work and its outcome."""
+
+    def __init__(self, key: str, payload):
+        self.id = uuid.uuid4().hex
+        self.key = key  # identical work shares a key, e.g. the input content hash
+        self.payload = payload
+        self.status = QUEUED
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def _update(self, status: str):
+        self.status = status
+        # Wake up the current watchers; later ones wait on a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def as_dict(self) -> dict:
+        job = {"success": self.status != FAILED, "jobId": self.id, "status": self.status}
+        if self.status == DONE:
+            job.update(self.result or {})
+        elif self.status == FAILED:
+            job["detail"] = self.error
+        return job
+
+
+class JobManager:
+    """Runs jobs from a queue on a bounded pool of worker tasks.
+
+    Submitting work that is already queued, running or done (same key)
+    returns the existing job instead of doing it twice, unless `reusable`
+    says a done job's result is gone. Finished jobs stay available for
+    `result_ttl` seconds. Workers are started with `start()`
+    (needs a running event loop) or on the first submission.
+    """
+
+    def __init__(self, handler: Callable[[Job], Awaitable[dict]], queue: Optional[JobQueue] = None,
+                 workers: Optional[int] = None, result_ttl: Optional[float] = None, name: str = "jobs",
+                 reusable: Optional[Callable[[Job], bool]] = None):
+        self.handler = handler
+        self.reusable = reusable  # whether a done job's result can still be handed out
+        self.queue = queue or MemoryJobQueue(settings.job_queue_size)
+        self.workers = workers or settings.job_workers
+        self._result_ttl = result_ttl
+        self.name = name
+
+        self._jobs = {}  # id -> Job
+        self._by_key = {}  # key -> id of the latest job for that key
+        self._finished = OrderedDict()  # id -> finished_at, oldest first
+        self._tasks = []
+
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def result_ttl(self) -> float:
+        return self._result_ttl if self._result_ttl is not None else settings.job_result_ttl
+
+    def _expire(self, now: Optional[float] = None):
+        deadline = (time.time() if now is None else now) - self.result_ttl
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > deadline:
+                break
+            del self._finished[job_id]
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def find(self, key: str) -> Optional[Job]:
+        """Returns the live job for `key`, if any; failed jobs and stale results don't count."""
+        self._expire()
+        job = self._jobs.get(self._by_key.get(key))
+        if job is None or job.status == FAILED:
+            return None
+        if job.status == DONE and self.reusable is not None and not self.reusable(job):
+            return None
+        return job
+
+    async def submit(self, key: str, payload=None, deduplicate: bool = True) -> Job:
+        """Queues a job, or returns the existing one for the same key (unless `deduplicate` is off).
+
+        Raises:
+            HTTPException: 503 if the queue is full.
+        """
+        job = self.find(key) if deduplicate else None
+        if job is not None:
+            self.deduplicated += 1
+            return job
+
+        job = Job(key, payload)
+        self._jobs[job.id] = job
+        self._by_key[key] = job.id
+        try:
+            await self.queue.put(job.id)
+        except JobQueueFull:
+            del self._jobs[job.id]
+            if self._by_key.get(key) == job.id:
+                del self._by_key[key]
+            raise HTTPException(status_code=503, detail="Too many pending jobs, try again later",
+                                headers={"Retry-After": "5"})
+
+        self.submitted += 1
+        self.start()
+        return job
+
+    async def watch(self, job: Job):
+        """Yields the job's state now and after every change, until it is finished."""
+        while True:
+            changed = job._changed
+            yield job.as_dict()
+            if job.finished:
+                return
+            await changed.wait()
+
+    async def _run(self, job: Job):
+        job._update(RUNNING)
+        try:
+            job.result = await self.handler(job)
+            self.completed += 1
+            status = DONE
+        except HTTPException as e:
+            job.error = e.detail
+            self.failed += 1
+            status = FAILED
+        except Exception as e:
+            logger.exception(f"{self.name}: job {job.id} failed: {e}")
+            job.error = "Internal server error."
+            self.failed += 1
+            status = FAILED
+
+        job.payload = None
+        job.finished_at = time.time()
+        self._finished[job.id] = job.finished_at
+        job._update(status)
+
+    async def _worker(self):
+        while True:
+            job = self._jobs.get(await self.queue.get())
+            if job is not None and job.status == QUEUED:
+                await self._run(job)
+
+    def start(self):
+        """Starts the worker tasks (needs a running event loop)."""
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        self._expire()
+        return {
+            "queue_depth": self.queue.depth(),
+            "running": sum(job.status == RUNNING for job in self._jobs.values()),
+            "workers": len(self._tasks),
+            "jobs": len(self._jobs),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,172 @@
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+from typing import Optional
+from logging.handlers import QueueHandler, QueueListener
+
+from src.api.config import settings
+
+_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line, escaping the message properly."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes only a fraction of the records below WARNING from high-volume loggers.
+
+    `rates` maps logger names to the fraction of their records to keep,
+    e.g. {"httpx": 0.1} keeps every tenth record of "httpx" and its child
+    loggers. Warnings and errors always pass.
+    """
+
+    def __init__(self, rates: Optional[dict] = None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._every = {}  # logger name -> keep one record out of this many (0: all, -1: none)
+        self._counts = {}
+        self.dropped = 0
+
+    def _every_for(self, name: str) -> int:
+        every = self._every.get(name)
+        if every is None:
+            rate, logger_name = None, name
+            while rate is None and logger_name:
+                rate = self.rates.get(logger_name)
+                logger_name = logger_name.rpartition(".")[0]
+            if rate is None or rate >= 1:
+                every = 0
+            elif rate <= 0:
+                every = -1  # drop all
+            else:
+                every = round(1 / rate)
+            self._every[name] = every
+        return every
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        every = self._every_for(record.name)
+        if every == 0:
+            return True
+        if every > 0:
+            count = self._counts.get(record.name, 0)
+            self._counts[record.name] = count + 1
+            if count % every == 0:
+                return True
+        self.dropped += 1
+        return False
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking or raising when the queue is full."""
+
+    def __init__(self, queue: queue.Queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback while their arguments are still current, but
+        # keep them apart (unlike QueueHandler) so the traceback stays a field of its own
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _formatter.formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # waits for room in a full queue, the listener is draining it
+
+
+class QueueLogging:
+    """Moves the handlers of a logger behind a queue drained by a background thread.
+
+    Logging calls only put the record on the queue; formatting and the
+    (possibly slow) console and file writes happen on the listener
+    thread, off the event loop. `stop()` drains the queue and puts the
+    handlers back in place, so nothing logged before it is lost.
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None, queue_size: int = 10000,
+                 sample_rates: Optional[dict] = None):
+        self.logger = logger or logging.getLogger()
+        self.queue_size = queue_size
+        self.sampling = SamplingFilter(sample_rates)
+
+        self._lock = threading.Lock()
+        self._handler: Optional[BoundedQueueHandler] = None
+        self._listener: Optional[_Listener] = None
+        self._handlers = []
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None
+
+    def start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._handlers = list(self.logger.handlers)
+            records = queue.Queue(self.queue_size)
+            self._handler = BoundedQueueHandler(records)
+            self._handler.addFilter(self.sampling)
+            self._listener = _Listener(records, *self._handlers, respect_handler_level=True)
+
+            for handler in self._handlers:
+                self.logger.removeHandler(handler)
+            self.logger.addHandler(self._handler)
+            self._listener.start()
+
+    def stop(self):
+        """Writes out the queued records and logs synchronously from then on."""
+        with self._lock:
+            if self._listener is None:
+                return
+            self.logger.removeHandler(self._handler)
+            self._listener.stop()
+            self._listener = None
+            for handler in self._handlers:
+                self.logger.addHandler(handler)
+                handler.flush()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self._handler.queue.qsize() if self.running else 0,
+            "dropped_full": self._handler.dropped if self._handler else 0,
+            "dropped_sampled": self.sampling.dropped,
+        }
+
+
+log_pipeline = QueueLogging(queue_size=settings.log_queue_size, sample_rates=settings.log_sample_rates)
+atexit.register(log_pipeline.stop)
@@ -0,0 +1,316 @@
+import time
+import logging
+from bisect import bisect_left
+from typing import Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.responses import JSONResponse
+
+from src.api.config import settings
+from src.api.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; inference calls take up to a minute, file and CPU stages milliseconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage durations of the current request, for its Server-Timing header (set by MetricsMiddleware)
+request_stages: ContextVar[Optional[dict]] = ContextVar("request_stages", default=None)
+
+# Worker pool task label -> request stage it is part of
+TASK_STAGES = {
+    "upload_write": "disk_io",
+    "image_read": "disk_io",
+    "image_write": "disk_io",
+    "anime_write": "disk_io",
+    "image_delete": "disk_io",
+    "cache_read": "disk_io",
+    "cache_write": "disk_io",
+    "validate_image": "validation",
+    "normalize_image": "validation",
+    "image_signature": "validation",
+    "b64encode": "base64",
+    "b64decode": "base64",
+    "json_decode": "serialization",
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """A metric family with a fixed set of label names, in the Prometheus text format.
+
+    Values are plain numbers in a dict keyed by label values: updating one
+    is a dict lookup, so instrumenting hot paths costs next to nothing.
+    Updates must come from the event loop thread.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> value
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def clear(self):
+        self._values.clear()
+
+    def _samples(self) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Counts observations into fixed buckets, with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]  # per-bucket counts, sum
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def get(self, **labels) -> dict:
+        """Count and sum of the observations with these labels."""
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": sum(state[0]), "sum": state[1]}
+
+    def _samples(self) -> list:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics exposed on /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "ficbot_http_requests_total", "HTTP requests handled, by route, method and status code.",
+    ("route", "method", "status")))
+http_request_seconds = registry.register(Histogram(
+    "ficbot_http_request_duration_seconds", "Time to handle an HTTP request, by route and method.",
+    ("route", "method")))
+http_requests_in_flight = registry.register(Gauge(
+    "ficbot_http_requests_in_flight", "HTTP requests being handled."))
+stage_seconds = registry.register(Histogram(
+    "ficbot_stage_duration_seconds",
+    "Time spent per request stage: body_read, validation, disk_io, base64, queue, inference, serialization.",
+    ("stage",)))
+upstream_requests_in_flight = registry.register(Gauge(
+    "ficbot_upstream_requests_in_flight", "Requests in flight to each inference backend.", ("backend",)))
+upstream_errors = registry.register(Counter(
+    "ficbot_upstream_errors_total",
+    "Failed inference backend requests, by HTTP status (or timeout/error when there was no response).",
+    ("status",)))
+upload_store_bytes = registry.register(Gauge(
+    "ficbot_upload_store_bytes", "Size of the images in the upload store."))
+upload_store_images = registry.register(Gauge(
+    "ficbot_upload_store_images", "Number of images in the upload store."))
+admission_in_flight = registry.register(Gauge(
+    "ficbot_admission_in_flight", "Inference calls holding an admission slot, by endpoint.", ("endpoint",)))
+admission_waiting = registry.register(Gauge(
+    "ficbot_admission_waiting", "Inference calls queued for an admission slot, by endpoint.", ("endpoint",)))
+executor_pending = registry.register(Gauge(
+    "ficbot_executor_pending", "Tasks running or queued in each worker pool.", ("pool",)))
+session_connections = registry.register(Gauge(
+    "ficbot_session_connections", "Open WebSocket session channel connections."))
+session_operations = registry.register(Counter(
+    "ficbot_session_operations_total",
+    "Session channel operations, by type and outcome (result, error, cancelled).",
+    ("type", "outcome")))
+
+
+def observe_stage(name: str, seconds: float):
+    stage_seconds.observe(seconds, stage=name)
+    stages = request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+def observe_task(label: str, seconds: float):
+    """Records a worker pool task under the request stage its label belongs to."""
+    name = TASK_STAGES.get(label)
+    if name is not None:
+        observe_stage(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Times the block as request stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse whose rendering is timed as the "serialization" stage."""
+
+    def render(self, content) -> bytes:
+        with stage("serialization"):
+            return super().render(content)
+
+
+def route_label(scope, root_path: str = "") -> str:
+    """The route template a request matched (e.g. "/jobs/{job_id}"), keeping label values few."""
+    route = scope.get("route")
+    if route is not None:
+        template = getattr(route, "path", "unmatched")
+        # A route of an included router may only know its path relative to the router's prefix
+        try:
+            matched = route.url_path_for(route.name, **scope.get("path_params", {}))
+        except Exception:
+            return template
+        path = scope.get("path", "")
+        return path[:len(path) - len(matched)] + template if path.endswith(matched) else template
+    if scope.get("root_path", "") != root_path:
+        return scope["root_path"]  # a mounted app, e.g. the static files
+    return "unmatched"
+
+
+def server_timing(stages: dict, total: float) -> str:
+    """Server-Timing header value listing the stage durations and the total, in milliseconds."""
+    metrics = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()]
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting HTTP requests and timing them and their body reads.
+
+    Responses get a `Server-Timing` header with the time the request spent
+    in each stage so far. While the profiler runs for a number of
+    requests, the requests it sees start are counted towards it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        root_path = scope.get("root_path", "")
+        profiled = profiler.active
+        status = 500
+        body_read: Optional[float] = None
+        stages = {}
+        token = request_stages.set(stages)
+
+        async def timed_receive():
+            nonlocal body_read
+            start = time.perf_counter()
+            message = await receive()
+            if message["type"] == "http.request":
+                body_read = (body_read or 0.0) + time.perf_counter() - start
+            return message
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.server_timing:
+                    timings = {"body_read": body_read, **stages} if body_read is not None else stages
+                    value = server_timing(timings, time.perf_counter() - start)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode())]}
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, timed_receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_stages.reset(token)
+            http_requests_in_flight.dec()
+            route = route_label(scope, root_path)
+            http_requests.inc(route=route, method=scope["method"], status=str(status))
+            http_request_seconds.observe(elapsed, route=route, method=scope["method"])
+            if body_read is not None:
+                observe_stage("body_read", body_read)
+            if profiled:
+                profiler.request_done()
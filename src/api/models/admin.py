@@ -0,0 +1,8 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+class ProfileRequest(BaseModel):
+    requests: Optional[int] = Field(None, ge=1)  # stop after this many requests
+    seconds: Optional[float] = Field(None, gt=0)  # stop after this long (capped by profile_max_seconds)
+    interval_ms: float = Field(5.0, ge=1, le=1000)  # time between stack samples
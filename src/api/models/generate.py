@@ -1,16 +1,27 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 class ImageRequest(BaseModel):
     image: str  # base64 encoded image
+    no_cache: bool = False  # skip the result cache lookup
 
 class NameRequest(BaseModel):
     imageSrc: str
     diversity: float
     min_name_length: int
     max_name_length: int
+    seed: Optional[int] = None  # deterministic sampling, makes the result cacheable
+    no_cache: bool = False  # skip the result cache lookup
 
 
 class BioRequest(BaseModel):
     name: str
     diversity: float
-    max_bio_length: int
\ No newline at end of file
+    max_bio_length: int
+    seed: Optional[int] = None  # deterministic sampling, makes the result cacheable
+    no_cache: bool = False  # skip the result cache lookup
+
+
+class BioBatchRequest(BaseModel):
+    items: list[BioRequest] = Field(min_length=1)
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+
+class UploadMessage(BaseModel):
+    filename: str  # its extension must be one of the allowed ones, like a form upload's
+    image: str  # base64 encoded image
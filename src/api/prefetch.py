@@ -0,0 +1,121 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class BioPrefetcher:
+    """Speculatively generates the bio for a name as soon as the name is generated.
+
+    The UI almost always asks for the bio of the name it just got, so the
+    bio generation is started right away with the client's last-used bio
+    parameters. A matching bio request within `ttl` seconds takes the
+    result, or waits for the generation still in flight; each speculative
+    bio is served at most once. At most `max_inflight` speculative
+    generations run at a time, and unclaimed ones are cancelled on expiry.
+    """
+
+    def __init__(self, generate: Callable[[str, float, int], Awaitable[str]], max_inflight: int = 2,
+                 ttl: float = 60.0, default_params: tuple = (1.0, 200), max_clients: int = 10000):
+        self.generate = generate
+        self.max_inflight = max_inflight
+        self.ttl = ttl
+        self.default_params = default_params
+        self.max_clients = max_clients
+
+        self._tasks = OrderedDict()  # (client, name, diversity, max_bio_length) -> (expires_at, task), oldest first
+        self._params = OrderedDict()  # client -> (diversity, max_bio_length) of its last bio request
+        self._running = set()  # generations not finished yet, including claimed ones
+
+        self.started = 0
+        self.skipped = 0  # not started, too much speculative work in flight
+        self.hits = 0  # served a finished bio
+        self.attached = 0  # waited for a bio still being generated
+        self.misses = 0
+        self.wasted = 0  # expired unclaimed
+
+    @property
+    def inflight(self) -> int:
+        return len(self._running)
+
+    def remember(self, client: str, diversity: float, max_bio_length: int):
+        """Records the bio parameters a client used, for its next speculative bio."""
+        self._params[client] = (diversity, max_bio_length)
+        self._params.move_to_end(client)
+        while len(self._params) > self.max_clients:
+            self._params.popitem(last=False)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._tasks:
+            key, (expires_at, task) = next(iter(self._tasks.items()))
+            if expires_at > now:
+                break
+            del self._tasks[key]
+            task.cancel()
+            self._running.discard(task)  # its slot is free once cancelled
+            self.wasted += 1
+
+    def start(self, client: str, name: str):
+        """Starts generating the bio the client will likely ask for next (needs a running event loop)."""
+        self._expire()
+        key = (client, name, *self._params.get(client, self.default_params))
+        if key in self._tasks:
+            return
+        if self.inflight >= self.max_inflight:
+            self.skipped += 1
+            return
+
+        task = asyncio.create_task(self.generate(*key[1:]))
+        self._running.add(task)
+        task.add_done_callback(self._finished)
+        self._tasks[key] = (time.monotonic() + self.ttl, task)
+        self.started += 1
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        task.cancelled() or task.exception()  # failures are misses, not errors
+
+    async def take(self, client: str, name: str, diversity: float, max_bio_length: int) -> Optional[str]:
+        """Returns the speculative bio for these parameters, if there is a usable one."""
+        self._expire()
+        entry = self._tasks.pop((client, name, diversity, max_bio_length), None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        _, task = entry
+        if task.done() and (task.cancelled() or task.exception() is not None):
+            self.misses += 1
+            return None
+        if task.done():
+            self.hits += 1
+        else:
+            self.attached += 1
+
+        try:
+            # Shielded: a caller that goes away leaves the generation running
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        except Exception as e:
+            logger.debug(f"Speculative bio failed: {e!r}")
+            return None
+
+    def stats(self) -> dict:
+        served = self.hits + self.attached
+        return {
+            "started": self.started,
+            "skipped": self.skipped,
+            "hits": self.hits,
+            "attached": self.attached,
+            "misses": self.misses,
+            "wasted": self.wasted,
+            "inflight": self.inflight,
+            "hit_rate": served / (served + self.misses) if served + self.misses else 0.0,
+        }
@@ -0,0 +1,132 @@
+import sys
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+from collections import Counter
+
+from src.api.config import settings, INSTANCE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread on demand, for flame graphs.
+
+    While running, a background thread takes a snapshot of all thread
+    stacks every `interval` seconds and counts identical stacks. When it
+    stops, after the given number of requests or seconds, the counts are
+    written to `output_dir` in the collapsed stack format
+    ("thread;outer;...;inner count" per line) read by flamegraph.pl,
+    speedscope and similar tools.
+
+    Nothing is sampled while the profiler is off: there is no thread and
+    the only cost left is checking `active` once per request.
+    """
+
+    def __init__(self, output_dir: Path, max_seconds: float = 300.0):
+        self.output_dir = Path(output_dir)
+        self.max_seconds = max_seconds
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stacks = Counter()
+        self._requests_left: Optional[int] = None
+        self._deadline = 0.0
+
+        self.samples = 0
+        self.last_output: Optional[Path] = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def start(self, requests: Optional[int] = None, seconds: Optional[float] = None, interval: float = 0.005) -> bool:
+        """Profiles the next `requests` requests, or the next `seconds` seconds, whichever ends first.
+
+        Returns:
+            bool: False if the profiler is already running.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._stop.clear()
+            self._stacks = Counter()
+            self.samples = 0
+            self._requests_left = requests
+            self._deadline = time.monotonic() + min(seconds or self.max_seconds, self.max_seconds)
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Profiling started ({requests or 'any'} requests, {seconds or self.max_seconds}s)")
+        return True
+
+    def request_done(self):
+        """Counts a finished request towards the requested number."""
+        with self._lock:
+            if self._requests_left is None:
+                return
+            self._requests_left -= 1
+            if self._requests_left <= 0:
+                self._stop.set()
+
+    def stop(self) -> Optional[Path]:
+        """Stops profiling now and returns the path of the written profile."""
+        thread = self._thread
+        if thread is None:
+            return self.last_output
+        self._stop.set()
+        thread.join()
+        return self.last_output
+
+    def _run(self, interval: float):
+        own = threading.get_ident()
+        try:
+            while not self._stop.wait(interval) and time.monotonic() < self._deadline:
+                self._sample(own)
+        finally:
+            self._write()
+            with self._lock:
+                self._thread = None
+
+    def _sample(self, own: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self._stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _write(self):
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            path = self.output_dir / f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() // 1_000_000 % 1000:03d}.folded"
+            with open(path, "w") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError:
+            logger.exception("Could not write the profile")
+            return
+        self.last_output = path
+        logger.info(f"Profile of {self.samples} samples written to {path}")
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "samples": self.samples,
+            "requests_left": self._requests_left if self.active else None,
+            "output": str(self.last_output) if self.last_output else None,
+        }
+
+
+profiler = SamplingProfiler(INSTANCE_DIR / "profiles", max_seconds=settings.profile_max_seconds)
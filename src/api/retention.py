@@ -0,0 +1,174 @@
+import time
+import asyncio
+import logging
+from typing import Optional
+from collections import Counter
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+
+from src.api.config import settings
+from src.api.executor import io_pool
+from src.api.store import ImageStore, image_store
+
+logger = logging.getLogger(__name__)
+
+# Bundled images that are never evicted
+PROTECTED_IMAGES = ("example.jpg", "me_20250627.jpg")
+
+
+class ImageJanitor:
+    """Evicts stored images by age (TTL) and by total size (byte quota, LRU).
+
+    Works off the store's index, which is kept in least-recently-used order:
+    expired images and eviction candidates are always at the front, so a
+    sweep only looks at the images it evicts (plus any pinned ones) instead
+    of listing and stat-ing the whole upload directory.
+
+    The index is updated on the event loop; the evicted files are deleted
+    in the io worker pool.
+
+    Images can be pinned while a request is using them so they are not
+    deleted underneath it; the bundled examples are pinned permanently.
+    """
+
+    def __init__(self, store: ImageStore = image_store, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+                 interval: Optional[float] = None, protected=PROTECTED_IMAGES):
+        self.store = store
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._interval = interval
+        self.protected = set(protected)
+        self._pins = Counter()
+        self._last_sweep = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._undeleted = []  # evicted images whose files are still to be deleted
+        self.evicted = 0
+
+    @property
+    def ttl(self) -> float:
+        if self._ttl is not None:
+            return self._ttl
+        return 2 if settings.testing else settings.image_ttl  # shorter timeout for testing
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes if self._max_bytes is not None else settings.image_quota_bytes
+
+    @property
+    def interval(self) -> float:
+        if self._interval is not None:
+            return self._interval
+        return 1 if settings.testing else settings.image_sweep_interval
+
+    def is_pinned(self, filename: str) -> bool:
+        return filename in self.protected or self._pins[filename] > 0
+
+    def pin(self, *filenames: str):
+        """Keeps the given images from being evicted until they are unpinned."""
+        self._pins.update(filenames)
+
+    def unpin(self, *filenames: str):
+        self._pins.subtract(filenames)
+        for filename in filenames:
+            if self._pins[filename] <= 0:
+                del self._pins[filename]
+
+    @contextmanager
+    def pinned(self, *filenames: str):
+        """Keeps the given images from being evicted inside the block."""
+        self.pin(*filenames)
+        try:
+            yield
+        finally:
+            self.unpin(*filenames)
+
+    async def sweep(self, now: Optional[float] = None) -> list:
+        """Evicts expired images, then least recently used ones while over quota.
+
+        Returns:
+            list: Filenames of the evicted images.
+        """
+        evicted = self._evict_candidates(now)
+
+        # Files of an earlier sweep that was shed are retried along with these
+        images, self._undeleted = self._undeleted + evicted, []
+        if images:
+            try:
+                await io_pool.run("image_delete", self.store.unlink, images)
+            except BaseException as e:
+                # Shed or cancelled: retry with the next sweep (files deleted already are skipped)
+                self._undeleted = images
+                if not isinstance(e, HTTPException):
+                    raise
+
+        evicted = [image.filename for image in evicted]
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} images, {self.store.total_bytes} bytes stored")
+        return evicted
+
+    def _evict_candidates(self, now: Optional[float] = None) -> list:
+        """Drops the images to evict from the index, returning them."""
+        now = time.time() if now is None else now
+        self._last_sweep = time.monotonic()
+
+        # TTL: the index is in last-access order, stop at the first live image
+        deadline = now - self.ttl
+        evicted = []
+        for image in self.store:
+            if image.last_access > deadline:
+                break
+            if not self.is_pinned(image.filename):
+                evicted.append(image)
+
+        # Byte quota: then least recently used images until we fit
+        excess = self.store.total_bytes - sum(image.size for image in evicted) - self.max_bytes
+        if excess > 0:
+            expired = {image.filename for image in evicted}
+            for image in self.store:
+                if excess <= 0:
+                    break
+                if image.filename not in expired and not self.is_pinned(image.filename):
+                    evicted.append(image)
+                    excess -= image.size
+
+        # Only the candidates were collected; the index changes after the walk
+        for image in evicted:
+            self.store.evict(image.filename)
+        self.evicted += len(evicted)
+        return evicted
+
+    async def maybe_sweep(self) -> list:
+        """Sweeps if the last sweep is more than `interval` ago.
+
+        Called on writes so retention holds even when the background task
+        isn't running; cheap when a sweep happened recently.
+        """
+        if time.monotonic() - self._last_sweep < self.interval:
+            return []
+        return await self.sweep()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Image retention sweep failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Starts sweeping in the background (needs a running event loop)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+image_janitor = ImageJanitor()
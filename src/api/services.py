@@ -0,0 +1,357 @@
+"""Inference operations shared by the HTTP routes.
+
+Each operation checks the result cache before calling the inference client.
+Name and bio generation sample from a model, so their results are only
+cached when the request carries a `seed` (or `cache_unseeded` is set).
+Anime conversion is deterministic and always cacheable; near-duplicates of
+converted images (by perceptual hash) reuse the earlier result too.
+
+Concurrent identical cache misses share a single backend call. Backend
+calls hold a slot of the endpoint's admission limiter, so a spike is
+queued or shed instead of piling onto the backend. Name and bio calls can
+also be micro-batched: concurrent requests of the same type are sent to
+the backend in one call (see batching.py).
+Bios can also be streamed chunk by chunk with `stream_bio`, and can be
+generated speculatively right after the name (see prefetch.py).
+
+Anime conversion can also run as a background job (`submit_anime_job`),
+processed by the `anime_jobs` worker pool.
+"""
+import mimetypes
+import logging
+from typing import Optional
+
+from PIL import Image
+
+from fastapi import HTTPException
+
+from src.api.config import settings
+from src.api.cache import result_cache, cache_key
+from src.api.admission import limiters
+from src.api.fairness import current_client, current_session
+from src.api.batching import MicroBatcher
+from src.api.prefetch import BioPrefetcher
+from src.api.singleflight import SingleFlight
+from src.api.executor import io_pool, cpu_pool
+from src.api.utils import normalize_image, ImageTooLarge
+from src.api.similarity import anime_index, image_signature
+from src.api.uploads import BROKEN_FILE
+from src.api.jobs import Job, JobManager
+from src.api.store import StoredImage, image_store
+from src.api.retention import image_janitor
+from src.api.inference import inference_client
+
+logger = logging.getLogger(__name__)
+
+# Coalesces concurrent identical inference calls, keyed like the result cache
+flights = SingleFlight()
+
+# Looked up at call time so the batchers always use the current client
+name_batcher = MicroBatcher(
+    lambda items: inference_client.generate_name_batch(items),
+    max_batch_size=settings.batch_max_size,
+    max_wait=settings.batch_max_wait_ms / 1000,
+    name="name",
+)
+bio_batcher = MicroBatcher(
+    lambda items: inference_client.generate_bio_batch(items),
+    max_batch_size=settings.batch_max_size,
+    max_wait=settings.batch_max_wait_ms / 1000,
+    name="bio",
+)
+
+
+def sampling_cacheable(seed: Optional[int]) -> bool:
+    """Whether a sampled (name/bio) result may be served from the cache."""
+    return seed is not None or settings.cache_unseeded
+
+
+def read_file(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def read_image(image: StoredImage) -> bytes:
+    """Reads a stored image off the event loop, keeping it pinned against eviction meanwhile."""
+    try:
+        with image_janitor.pinned(image.filename):
+            return await io_pool.run("image_read", read_file, image.path)
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        image_store.forget(image.filename)
+        raise HTTPException(status_code=404, detail="Image file not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading an image: {str(e)}")
+
+
+async def normalized_image(image: StoredImage) -> StoredImage:
+    """Returns the variant of a stored image that is sent to the name model.
+
+    The variant (first frame, RGB, downscaled, JPEG) is stored next to the
+    original and indexed by the store as its variant for the current size and
+    quality, so it is made only once while it is kept.
+    """
+    if not settings.normalize_images:
+        return image
+
+    variant = f"normalized-{settings.normalize_size}-{settings.normalize_quality}"
+    cached = image_store.get_variant(image.digest, variant)
+    if cached is not None:
+        return cached
+
+    try:
+        with image_janitor.pinned(image.filename):
+            data = await cpu_pool.run("normalize_image", normalize_image, image.path, settings.normalize_size,
+                                      settings.normalize_max_pixels, settings.normalize_quality)
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        image_store.forget(image.filename)
+        raise HTTPException(status_code=404, detail="Image file not found")
+    except (ImageTooLarge, Image.DecompressionBombError):
+        raise HTTPException(status_code=413, detail="Image dimensions are too large")
+    except Exception as e:
+        logger.warning(f"Could not normalize {image.filename}: {e!r}")
+        raise HTTPException(status_code=415, detail=BROKEN_FILE)
+
+    pending = await io_pool.run("image_write", image_store.write_bytes, data, ".jpg", "normalized_")
+    normalized = pending.commit()
+    image_store.set_variant(image.digest, variant, normalized)
+    return normalized
+
+
+async def fetch_name(image: StoredImage, diversity: float, min_name_length: int, max_name_length: int,
+                     seed: Optional[int] = None) -> str:
+    """Generates a name on the backend, bypassing the caches."""
+    # A small RGB JPEG instead of the upload as is
+    image = await normalized_image(image)
+    item = {
+        "image": await read_image(image),
+        "diversity": diversity,
+        "min_name_length": min_name_length,
+        "max_name_length": max_name_length,
+        "content_type": mimetypes.guess_type(image.filename)[0] or "application/octet-stream",
+        "seed": seed
+    }
+    async with limiters["name"].slot():
+        if settings.batch_name:
+            return await name_batcher.submit(item)
+        return await inference_client.generate_name(**item)
+
+
+async def generate_name(image: StoredImage, diversity: float, min_name_length: int, max_name_length: int,
+                        seed: Optional[int] = None, no_cache: bool = False) -> str:
+    """Generates a character name for a stored image."""
+    key = cache_key("name", image=image.digest, diversity=diversity, min_name_length=min_name_length,
+                    max_name_length=max_name_length, seed=seed)
+    cacheable = sampling_cacheable(seed)
+    name = await result_cache.get(key) if cacheable and not no_cache else None
+    if name is None:
+        # Identical requests in flight at the same time share one backend call
+        name = await flights.do(key, lambda: fetch_name(image, diversity, min_name_length, max_name_length, seed))
+        if cacheable:
+            await result_cache.set(key, name)
+
+    # The bio for this name is likely requested next, whether the name was cached or not
+    if settings.prefetch_bio:
+        bio_prefetcher.start(current_session.get(), name)
+    return name
+
+
+async def generate_bio(name: str, diversity: float, max_bio_length: int,
+                       seed: Optional[int] = None, no_cache: bool = False) -> str:
+    """Generates a character bio for a name."""
+    key = cache_key("bio", name=name, diversity=diversity, max_bio_length=max_bio_length, seed=seed)
+    cacheable = sampling_cacheable(seed)
+    if cacheable and not no_cache:
+        bio = await result_cache.get(key)
+        if bio is not None:
+            return bio
+
+    bio = await prefetched_bio(name, diversity, max_bio_length, seed, no_cache)
+    if bio is None:
+        bio = await flights.do(key, lambda: fetch_bio(name, diversity, max_bio_length, seed))
+    if cacheable:
+        await result_cache.set(key, bio)
+    return bio
+
+
+async def fetch_bio(name: str, diversity: float, max_bio_length: int, seed: Optional[int] = None) -> str:
+    """Generates a bio on the backend, bypassing the caches."""
+    item = {"name": name, "diversity": diversity, "max_bio_length": max_bio_length, "seed": seed}
+    async with limiters["bio"].slot():
+        return await call_bio(item)
+
+
+async def call_bio(item: dict) -> str:
+    if settings.batch_bio:
+        return await bio_batcher.submit(item)
+    return await inference_client.generate_bio(**item)
+
+
+async def fetch_speculative_bio(name: str, diversity: float, max_bio_length: int) -> str:
+    """Generates a bio nobody asked for yet, only if a bio slot is idle (else 503, counted as a miss)."""
+    item = {"name": name, "diversity": diversity, "max_bio_length": max_bio_length, "seed": None}
+    async with limiters["bio"].spare_slot():
+        return await call_bio(item)
+
+
+# Looked up at call time, like the batchers
+bio_prefetcher = BioPrefetcher(
+    lambda name, diversity, max_bio_length: fetch_speculative_bio(name, diversity, max_bio_length),
+    max_inflight=settings.prefetch_max_inflight,
+    ttl=settings.prefetch_ttl,
+    default_params=(settings.prefetch_default_diversity, settings.prefetch_default_max_bio_length),
+)
+
+
+async def prefetched_bio(name: str, diversity: float, max_bio_length: int,
+                         seed: Optional[int] = None, no_cache: bool = False) -> Optional[str]:
+    """Takes the speculative bio for this request, if any, and remembers the client's parameters."""
+    if not settings.prefetch_bio:
+        return None
+    client = current_session.get()
+    bio_prefetcher.remember(client, diversity, max_bio_length)
+    if seed is not None or no_cache:
+        return None  # speculative bios are unseeded samples
+    return await bio_prefetcher.take(client, name, diversity, max_bio_length)
+
+
+async def stream_bio(name: str, diversity: float, max_bio_length: int,
+                     seed: Optional[int] = None, no_cache: bool = False):
+    """Streams a character bio for a name; a cached bio is yielded as one chunk."""
+    key = cache_key("bio", name=name, diversity=diversity, max_bio_length=max_bio_length, seed=seed)
+    cacheable = sampling_cacheable(seed)
+    if cacheable and not no_cache:
+        bio = await result_cache.get(key)
+        if bio is not None:
+            yield bio
+            return
+
+    bio = await prefetched_bio(name, diversity, max_bio_length, seed, no_cache)
+    if bio is not None:
+        yield bio
+        return
+
+    # Only a stream that ran to completion is cached
+    chunks = []
+    async with limiters["bio"].slot():
+        async for chunk in inference_client.stream_bio(name, diversity, max_bio_length, seed):
+            chunks.append(chunk)
+            yield chunk
+
+    bio = "".join(chunks)
+    if not bio:
+        raise HTTPException(status_code=502, detail="Bio generation failed")
+    if cacheable:
+        await result_cache.set(key, bio)
+
+
+async def image_signature_of(image_bytes: bytes) -> Optional[tuple]:
+    """Perceptual signature for the near-duplicate index, None if the image can't be read."""
+    try:
+        return await cpu_pool.run("image_signature", image_signature, image_bytes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.debug(f"No perceptual signature: {e!r}")
+        return None
+
+
+async def convert_to_anime(image_bytes: bytes, original: StoredImage, no_cache: bool = False,
+                           shed: bool = True) -> StoredImage:
+    """Converts an image with AnimeGAN2 and returns the stored result.
+
+    With `shed=False` the call waits for an admission slot instead of being rejected when busy.
+    """
+    key = cache_key("anime", image=original.digest)
+    if not no_cache:
+        filename = await result_cache.get(key)
+        cached = image_store.get_by_name(filename) if filename else None
+        if cached is not None:
+            image_store.touch(cached)
+            return cached
+        if filename:
+            await result_cache.delete(key)  # the stored result has been evicted since
+
+    return await flights.do(key, lambda: fetch_anime(image_bytes, original, no_cache, shed))
+
+
+async def fetch_anime(image_bytes: bytes, original: StoredImage, no_cache: bool = False,
+                      shed: bool = True) -> StoredImage:
+    """Converts an image on the backend unless a near-duplicate was converted already."""
+    key = cache_key("anime", image=original.digest)
+
+    # Re-saved, recompressed or slightly cropped copies of a converted image reuse its result
+    signature = await image_signature_of(image_bytes) if settings.phash_enabled else None
+    if signature is not None and not no_cache:
+        filename = anime_index.find(signature)
+        cached = image_store.get_by_name(filename) if filename else None
+        if cached is not None:
+            image_store.touch(cached)
+            await result_cache.set(key, cached.filename)
+            return cached
+        if filename:
+            anime_index.discard(filename)
+
+    # The result is streamed into the store
+    output = image_store.create(".png", prefix="anime_")
+    try:
+        with image_janitor.pinned(original.filename):
+            async with limiters["anime"].slot(shed=shed):
+                await inference_client.convert_to_anime(image_bytes, output)
+            anime = output.commit()
+    except OSError as e:
+        output.discard()
+        raise HTTPException(status_code=500, detail=f"Error saving anime image: {str(e)}")
+    except BaseException:
+        output.discard()
+        raise
+
+    await result_cache.set(key, anime.filename)
+    if signature is not None:
+        anime_index.add(signature, anime.filename)
+    return anime
+
+
+async def run_anime_job(job: Job) -> dict:
+    """Job handler: converts the job's original image and returns the result URL."""
+    original = job.payload["original"]
+    current_client.set(job.payload["client"])  # queue fairly among the job owners
+    try:
+        if settings.testing:
+            return {"animeImgUrl": f"static/images/{original.filename}"}
+        # Jobs are already queued: wait for a slot rather than being shed
+        anime = await convert_to_anime(await read_image(original), original, no_cache=job.payload["no_cache"], shed=False)
+    finally:
+        image_janitor.unpin(original.filename)  # pinned on submission
+
+    await image_janitor.maybe_sweep()
+    return {"animeImgUrl": f"static/images/{anime.filename}"}
+
+
+def anime_result_available(job: Job) -> bool:
+    """Whether the image of a finished conversion job is still stored (retention may have removed it)."""
+    return image_store.resolve(job.result["animeImgUrl"]) is not None
+
+
+anime_jobs = JobManager(lambda job: run_anime_job(job), name="anime", reusable=anime_result_available)
+
+
+async def submit_anime_job(original: StoredImage, no_cache: bool = False) -> Job:
+    """Queues the anime conversion of a stored image, deduplicated by its content hash unless `no_cache`."""
+    job = None if no_cache else anime_jobs.find(original.digest)
+    if job is not None:
+        return await anime_jobs.submit(original.digest)
+
+    await limiters["anime"].throttle()
+
+    # Keep the original around while the job waits in the queue
+    image_janitor.pin(original.filename)
+    try:
+        payload = {"original": original, "no_cache": no_cache, "client": current_client.get()}
+        return await anime_jobs.submit(original.digest, payload, deduplicate=not no_cache)
+    except BaseException:
+        image_janitor.unpin(original.filename)
+        raise
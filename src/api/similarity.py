@@ -0,0 +1,163 @@
+import io
+import logging
+from typing import Optional
+from collections import OrderedDict
+
+from PIL import Image, ImageStat
+
+from src.api.cache import CacheStats
+from src.api.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def image_signature(data: bytes, hash_size: int = 8) -> tuple:
+    """
+    Perceptual signature of an image: a difference hash (dHash) and its mean colour.
+
+    The dHash survives re-saving, recompression, resizing and small crops.
+    The mean colour tells apart images the hash alone can't, e.g. flat ones.
+    This is CPU bound, call it off the event loop.
+
+    Returns:
+        tuple: (hash as a `hash_size`² bit int, (r, g, b) mean colour)
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.seek(0)
+        image.draft("RGB", (64, 64))
+        image = image.convert("RGB")
+        mean = tuple(round(channel) for channel in ImageStat.Stat(image.resize((16, 16))).mean)
+
+        # One byte per pixel in "L" mode, row by row
+        pixels = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS).tobytes()
+
+    phash = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            phash = (phash << 1) | (left > right)
+    return phash, mean
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Metric tree over hashes for nearest-neighbour search by Hamming distance.
+
+    Nodes can't be removed from a BK-tree, so removals only mark the hash
+    dead; the tree is rebuilt from the live hashes once most are dead.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, {distance: child node}]
+        self._live = set()
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._live)
+
+    def add(self, phash: int):
+        if phash in self._live:
+            return
+        self._live.add(phash)
+        if self._root is None:
+            self._root = [phash, {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming(phash, node[0])
+            if distance == 0:
+                self._dead -= 1  # a dead node comes back to life
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [phash, {}]
+                return
+            node = child
+
+    def remove(self, phash: int):
+        if phash not in self._live:
+            return
+        self._live.discard(phash)
+        self._dead += 1
+        if self._dead > len(self._live):
+            self._rebuild()
+
+    def _rebuild(self):
+        live, self._live = self._live, set()
+        self._root = None
+        self._dead = 0
+        for phash in live:
+            self.add(phash)
+
+    def nearest(self, phash: int, max_distance: int) -> list:
+        """Live hashes within `max_distance`, closest first."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(phash, node[0])
+            if distance <= max_distance and node[0] in self._live:
+                found.append((distance, node[0]))
+            # Triangle inequality: only these subtrees can hold matches
+            for edge, child in node[1].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return [match for _, match in sorted(found)]
+
+
+class NearDuplicateIndex:
+    """Maps perceptual signatures of recent inputs to results, for reuse on near-duplicates.
+
+    Bounded to `max_entries`, evicting the least recently used. A lookup
+    matches an entry within `max_distance` bits of the hash whose mean
+    colour is also within `max_color_distance` per channel.
+    """
+
+    def __init__(self, max_entries: int = 4096, max_distance: int = 6, max_color_distance: int = 12):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_color_distance = max_color_distance
+        self.stats = CacheStats()
+        self._tree = BKTree()
+        self._entries = OrderedDict()  # hash -> (mean colour, value), least recently used first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, signature: tuple) -> Optional[str]:
+        phash, color = signature
+        for match in self._tree.nearest(phash, self.max_distance):
+            match_color, value = self._entries[match]
+            if all(abs(a - b) <= self.max_color_distance for a, b in zip(color, match_color)):
+                self._entries.move_to_end(match)
+                self.stats.hits += 1
+                return value
+        self.stats.misses += 1
+        return None
+
+    def add(self, signature: tuple, value):
+        phash, color = signature
+        self._entries[phash] = (color, value)
+        self._entries.move_to_end(phash)
+        self._tree.add(phash)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._tree.remove(evicted)
+            self.stats.evictions += 1
+
+    def discard(self, value):
+        """Drops the entries pointing to `value`, e.g. a result that was deleted."""
+        for phash in [phash for phash, (_, entry) in self._entries.items() if entry == value]:
+            del self._entries[phash]
+            self._tree.remove(phash)
+
+
+anime_index = NearDuplicateIndex(
+    max_entries=settings.phash_max_entries,
+    max_distance=settings.phash_max_distance,
+)
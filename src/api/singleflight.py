@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls into one upstream call.
+
+    The first caller for a key starts the call as a task of its own; callers
+    arriving while it is in flight wait for the same task and all get its
+    result (or exception). A caller that goes away (e.g. a client that
+    disconnected) only stops waiting; the call is cancelled once nobody is
+    waiting for it anymore.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> task
+        self._waiters = Counter()
+
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: str, call: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda task: self._done(key, task))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters[key] == 1:
+                task.cancel()  # the last waiter is gone
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if self._waiters[key] <= 0:
+                del self._waiters[key]
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every waiter has gone
+
+    def stats(self) -> dict:
+        return {"inflight": len(self._calls), "calls": self.calls, "coalesced": self.coalesced}
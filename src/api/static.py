@@ -0,0 +1,228 @@
+import os
+import gzip
+import hashlib
+import logging
+import mimetypes
+from pathlib import Path
+from typing import Optional
+
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Scope
+
+from src.api.config import settings, STATIC_DIR, TEMPLATE_DIR
+
+try:
+    import brotli  # optional, for `br` variants
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+COMPRESSIBLE_TYPES = {
+    "application/javascript", "application/json", "application/manifest+json", "application/xml",
+    "image/svg+xml", "image/vnd.microsoft.icon", "image/x-icon",
+}
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+def compressible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def compress(content: bytes) -> dict:
+    """gzip and, if installed, brotli variants of `content`, keeping only those that save space."""
+    variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(content, quality=11)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(content) * 0.9}
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """The best content coding the client accepts among `available`, else "identity"."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.strip()] = quality
+
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an entity tag."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class CachedAsset:
+    """A file or rendered page held in memory, with precompressed variants."""
+
+    def __init__(self, content: bytes, media_type: str, precompress: bool = True):
+        self.media_type = media_type
+        self.digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        self.variants = {"identity": content}
+        if precompress and compressible(media_type):
+            self.variants.update(compress(content))
+
+    @property
+    def size(self) -> int:
+        return sum(len(data) for data in self.variants.values())
+
+    def etag(self, encoding: str) -> str:
+        # Every variant is a representation of its own, with an entity tag of its own
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+    def response(self, headers: Headers, cache_control: str) -> Response:
+        """The variant the request accepts, or a 304 if the client already has it."""
+        encoding = choose_encoding(headers.get("accept-encoding", ""), self.variants)
+        response_headers = {"ETag": self.etag(encoding), "Cache-Control": cache_control}
+        if len(self.variants) > 1:
+            response_headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(headers.get("if-none-match", ""), response_headers["ETag"]):
+            return Response(status_code=304, headers=response_headers)
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type=self.media_type, headers=response_headers)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles serving the site's assets from memory.
+
+    `load()` reads every file up to `max_file_bytes` (outside the `exclude`d
+    directories, e.g. the uploads) with its gzip/brotli variants, so a hit
+    costs no disk access or compression. Other files, and range requests,
+    are served from disk as usual.
+
+    `url()` gives an asset's URL fingerprinted with a hash of its content;
+    requests carrying the current fingerprint are cacheable forever
+    (`immutable`), others for `max_age` seconds. Responses carry ETags and
+    answer a matching If-None-Match with 304.
+    """
+
+    def __init__(self, directory: Path, exclude: tuple = (), max_file_bytes: int = 2 * 1024 * 1024,
+                 max_age: int = 3600, precompress: bool = True, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.root = Path(directory)
+        self.exclude = exclude
+        self.max_file_bytes = max_file_bytes
+        self.max_age = max_age
+        self.precompress = precompress
+        self.assets: Optional[dict] = None  # path relative to root -> CachedAsset
+        self._digests = {}  # path -> ((mtime, size), digest) of files not held in memory
+
+    def load(self):
+        assets = {}
+        for path in sorted(self.root.rglob("*")):
+            relative = path.relative_to(self.root)
+            if not path.is_file() or relative.parts[0] in self.exclude or path.stat().st_size > self.max_file_bytes:
+                continue
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            assets[relative.as_posix()] = CachedAsset(path.read_bytes(), media_type, self.precompress)
+        self.assets = assets
+        logger.info(f"Cached {len(assets)} static files, {sum(a.size for a in assets.values())} bytes with variants")
+
+    def fingerprint(self, path: str) -> Optional[str]:
+        """Short hash of a static file's content, None if there is no such file."""
+        if self.assets is None:
+            self.load()
+        asset = self.assets.get(path)
+        if asset is not None:
+            return asset.digest[:12]
+
+        try:
+            stat = os.stat(self.root / path)
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._digests.get(path)
+        if cached is None or cached[0] != version:
+            with open(self.root / path, "rb") as f:
+                cached = self._digests[path] = (version, hashlib.file_digest(f, "blake2b").hexdigest()[:12])
+        return cached[1]
+
+    def url(self, path: str) -> str:
+        """Relative URL of a static file, fingerprinted so that it can be cached for good."""
+        fingerprint = self.fingerprint(path)
+        return f"static/{path}?v={fingerprint}" if fingerprint else f"static/{path}"
+
+    def cache_control(self, path: str, scope: Scope) -> str:
+        query = scope.get("query_string", b"").decode("latin-1")
+        version = dict(param.partition("=")[::2] for param in query.split("&")).get("v")
+        if version and version == self.fingerprint(path):
+            return IMMUTABLE
+        return f"public, max-age={self.max_age}" if self.max_age else "no-cache"
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if self.assets is None:
+            self.load()
+        path = Path(path).as_posix()
+        headers = Headers(scope=scope)
+
+        asset = self.assets.get(path)
+        if asset is not None and scope["method"] in ("GET", "HEAD") and "range" not in headers:
+            return asset.response(headers, self.cache_control(path, scope))
+
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = self.cache_control(path, scope)
+        return response
+
+
+class PageCache:
+    """Pages rendered once from their templates and served from memory.
+
+    Only for templates whose output doesn't depend on the request. Pages
+    are served with `no-cache`: browsers revalidate them, and get a 304
+    while the page is unchanged.
+    """
+
+    def __init__(self, templates: Jinja2Templates, precompress: bool = True):
+        self.templates = templates
+        self.precompress = precompress
+        self._pages = {}  # template name -> CachedAsset
+
+    def get(self, name: str) -> CachedAsset:
+        page = self._pages.get(name)
+        if page is None:
+            content = self.templates.get_template(name).render().encode("utf-8")
+            page = self._pages[name] = CachedAsset(content, "text/html", self.precompress)
+        return page
+
+    def load(self, *names: str):
+        for name in names:
+            self.get(name)
+
+    def response(self, headers: Headers, name: str) -> Response:
+        return self.get(name).response(headers, "no-cache")
+
+
+static_files = CachedStaticFiles(
+    STATIC_DIR,
+    exclude=("images",),  # uploads and generated images come and go
+    max_file_bytes=settings.static_cache_max_file_bytes,
+    max_age=settings.static_max_age,
+    precompress=settings.static_precompress,
+)
+
+templates = Jinja2Templates(directory=TEMPLATE_DIR)
+templates.env.globals["static_url"] = static_files.url
+
+pages = PageCache(templates, precompress=settings.static_precompress)
@@ -0,0 +1,311 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urlparse
+
+from src.api.config import UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_URL_PREFIX = "static/images/"
+
+
+def content_digest() -> "hashlib.blake2b":
+    """Hash used to address stored images (128 bits, same length as a uuid4 hex)."""
+    return hashlib.blake2b(digest_size=16)
+
+
+class StoredImage:
+    """An image file in the upload directory, addressed by its content hash."""
+
+    def __init__(self, digest: str, filename: str, size: int, upload_dir: Path = UPLOAD_DIR, stored_at: Optional[float] = None):
+        self.digest = digest
+        self.filename = filename
+        self.size = size
+        self.path = upload_dir / filename
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.last_access = self.stored_at
+
+    def __repr__(self):
+        return f"StoredImage({self.filename!r}, size={self.size})"
+
+    @property
+    def url(self) -> str:
+        return f"/{UPLOAD_URL_PREFIX}{self.filename}"
+
+
+class PendingImage:
+    """An image being written to the store chunk by chunk.
+
+    Data goes to a hidden temporary file in the upload directory while the
+    content hash is computed on the fly. `commit()` moves it into place under
+    its content address, or drops it if identical bytes are already stored.
+    """
+
+    def __init__(self, store: "ImageStore", ext: str, prefix: str = ""):
+        self.store = store
+        self.ext = ext
+        self.prefix = prefix
+        self.size = 0
+        self.path = store.upload_dir / f".{uuid.uuid4().hex}.part"
+        store._partial.add(self.path.name)
+        self._hash = content_digest()
+        self._file = open(self.path, "wb")
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def write_chunks(self, chunks: list):
+        for chunk in chunks:
+            self.write(chunk)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def commit(self) -> StoredImage:
+        self.close()
+        try:
+            return self.store._commit(self.path, self.digest, self.size, self.ext, self.prefix)
+        finally:
+            self.store._partial.discard(self.path.name)
+
+    def discard(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+        self.store._partial.discard(self.path.name)
+
+
+class ImageStore:
+    """Content-addressed store for uploaded and generated images.
+
+    Keeps an in-memory index from content hash to stored file (and from
+    filename back to the entry), so identical bytes are stored once and
+    image URLs are resolved without touching the filesystem. The index is
+    built from the upload directory at startup (`scan()` in a worker
+    thread, then `load()`), or else on first use.
+
+    Entries are kept in least-recently-used order, which is also expiry
+    order for a fixed TTL, so retention policies only ever look at the
+    front of the index (see src/api/retention.py).
+    """
+
+    def __init__(self, upload_dir: Path = UPLOAD_DIR):
+        self.upload_dir = upload_dir
+        self._by_digest = {}
+        self._duplicates = {}  # digest -> names of other files with that content (left by older versions)
+        self._by_name = OrderedDict()  # filename -> StoredImage, least recently used first
+        self._total_bytes = 0
+        self._loaded = False
+        self._partial = set()  # names of the temporary files being written by this process
+        self._variants = {}  # (source digest, variant) -> filename of the derived image
+        self._variant_keys = {}  # filename of a derived image -> its key in _variants
+        self._unlinking = set()  # names of evicted files not deleted yet, see `evict()`
+        self._unlink_lock = threading.Lock()
+
+    def scan(self) -> list:
+        """Reads and hashes the files already in the upload directory, oldest first.
+
+        Blocking: run it off the event loop, then pass the result to `load()`.
+        """
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self._purge_partial()
+        files = [path for path in self.upload_dir.iterdir() if path.is_file() and not path.name.startswith(".")]
+        images = []
+        for path in sorted(files, key=lambda path: path.stat().st_mtime):
+            digest = content_digest()
+            with open(path, "rb") as f:
+                while chunk := f.read(64 * 1024):
+                    digest.update(chunk)
+            stat = path.stat()
+            images.append(StoredImage(digest.hexdigest(), path.name, stat.st_size, self.upload_dir, stored_at=stat.st_mtime))
+        return images
+
+    def load(self, images: list):
+        """Builds the index from `scan()` results (once)."""
+        if self._loaded:
+            return
+        self._loaded = True
+        for image in images:
+            self._index(image)
+
+    def _load(self):
+        """Indexes the upload directory on first use, if the app didn't at startup."""
+        if not self._loaded:
+            self.load(self.scan())
+
+    def _purge_partial(self):
+        """Deletes temporary upload files left behind by an earlier process."""
+        for path in self.upload_dir.glob(".*.part"):
+            if path.name not in self._partial:
+                path.unlink(missing_ok=True)
+
+    def _index(self, image: StoredImage):
+        if self._by_digest.setdefault(image.digest, image) is not image:
+            self._duplicates.setdefault(image.digest, set()).add(image.filename)
+        self._by_name[image.filename] = image
+        self._total_bytes += image.size
+
+    def __len__(self):
+        self._load()
+        return len(self._by_name)
+
+    def __iter__(self):
+        """Iterates over stored images, least recently used first.
+
+        Lazily, off the live index: don't add, touch or remove images before
+        the iteration is done.
+        """
+        self._load()
+        return iter(self._by_name.values())
+
+    @property
+    def total_bytes(self) -> int:
+        self._load()
+        return self._total_bytes
+
+    def touch(self, image: StoredImage):
+        """Marks an image as just used, moving it to the back of the LRU order."""
+        image.last_access = time.time()
+        if image.filename in self._by_name:
+            self._by_name.move_to_end(image.filename)
+
+    def get(self, digest: str) -> Optional[StoredImage]:
+        self._load()
+        return self._by_digest.get(digest)
+
+    def get_by_name(self, filename: str) -> Optional[StoredImage]:
+        self._load()
+        return self._by_name.get(filename)
+
+    def get_variant(self, digest: str, variant: str) -> Optional[StoredImage]:
+        """The stored image derived from the image `digest` as `variant` (e.g. a resized copy), if any."""
+        image = self.get_by_name(self._variants.get((digest, variant)))
+        if image is not None:
+            self.touch(image)
+        return image
+
+    def set_variant(self, digest: str, variant: str, image: StoredImage):
+        """Remembers `image` as the `variant` of the image `digest`, until it is evicted."""
+        key = (digest, variant)
+        self._variants[key] = image.filename
+        self._variant_keys[image.filename] = key
+
+    def resolve(self, image_src: str) -> Optional[StoredImage]:
+        """Looks up the stored image an `imgUrl`/`animeImgUrl` (absolute or relative) points to."""
+        path = urlparse(image_src).path.lstrip("/")
+        if not path.startswith(UPLOAD_URL_PREFIX):
+            return None
+        image = self.get_by_name(path[len(UPLOAD_URL_PREFIX):])
+        if image is not None:
+            self.touch(image)
+        return image
+
+    def create(self, ext: str, prefix: str = "") -> PendingImage:
+        """Starts writing a new image; finish with `commit()` or `discard()`."""
+        self._load()
+        return PendingImage(self, ext, prefix)
+
+    def add_bytes(self, data: bytes, ext: str, prefix: str = "") -> StoredImage:
+        """Stores an in-memory image, returning the existing entry for known content."""
+        digest = content_digest()
+        digest.update(data)
+        existing = self.get(digest.hexdigest())
+        if existing is not None:
+            return self._reuse(existing)
+        return self.write_bytes(data, ext, prefix).commit()
+
+    def write_bytes(self, data: bytes, ext: str, prefix: str = "") -> PendingImage:
+        """Writes an in-memory image to a pending file, ready to `commit()`.
+
+        Only touches the file system, not the index, so it can run in a
+        worker thread; commit on the event loop.
+        """
+        pending = PendingImage(self, ext, prefix)
+        try:
+            pending.write(data)
+            pending.close()
+        except BaseException:
+            pending.discard()
+            raise
+        return pending
+
+    def _reuse(self, image: StoredImage) -> StoredImage:
+        self.touch(image)
+        return image
+
+    def _commit(self, tmp_path: Path, digest: str, size: int, ext: str, prefix: str) -> StoredImage:
+        existing = self.get(digest)
+        if existing is not None:
+            tmp_path.unlink(missing_ok=True)
+            return self._reuse(existing)
+
+        image = StoredImage(digest, f"{prefix}{digest}{ext}", size, self.upload_dir)
+        with self._unlink_lock:
+            # Stored again right after its eviction: the new file must not be deleted
+            self._unlinking.discard(image.filename)
+            os.replace(tmp_path, image.path)
+        self._index(image)
+        return image
+
+    def forget(self, filename: str) -> Optional[StoredImage]:
+        """Drops a file from the index (the caller deletes it)."""
+        image = self._by_name.pop(filename, None)
+        if image is not None:
+            self._total_bytes -= image.size
+        key = self._variant_keys.pop(filename, None)
+        if key is not None and self._variants.get(key) == filename:
+            del self._variants[key]
+        if image is None:
+            return None
+
+        duplicates = self._duplicates.get(image.digest)
+        if duplicates is not None:
+            duplicates.discard(filename)
+        if self._by_digest.get(image.digest) is image:
+            del self._by_digest[image.digest]
+            if duplicates:
+                # Another file with the same content takes over the digest
+                self._by_digest[image.digest] = self._by_name[duplicates.pop()]
+        if duplicates is not None and not duplicates:
+            del self._duplicates[image.digest]
+        return image
+
+    def delete(self, filename: str):
+        """Removes a file from the index and the upload directory."""
+        self.forget(filename)
+        (self.upload_dir / filename).unlink(missing_ok=True)
+
+    def evict(self, filename: str) -> Optional[StoredImage]:
+        """Drops a file from the index, leaving the file itself for `unlink()`."""
+        image = self.forget(filename)
+        if image is not None:
+            with self._unlink_lock:
+                self._unlinking.add(filename)
+        return image
+
+    def unlink(self, images: list):
+        """Deletes the files of evicted images, unless they have been stored again since.
+
+        Blocking: run it in a worker thread.
+        """
+        for image in images:
+            with self._unlink_lock:
+                if image.filename in self._unlinking:
+                    self._unlinking.discard(image.filename)
+                    image.path.unlink(missing_ok=True)
+
+
+image_store = ImageStore()
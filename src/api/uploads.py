@@ -0,0 +1,211 @@
+import os
+import logging
+from typing import Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import FormParserError
+
+from fastapi import Request, HTTPException
+from starlette.requests import ClientDisconnect
+
+from src.api.utils import sniff_image_format, SNIFF_LENGTH
+from src.api.store import ImageStore, PendingImage, image_store
+from src.api.executor import io_pool
+from src.api.config import UPLOAD_EXTENSIONS, MAX_CONTENT_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# Room for the multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+WRONG_EXTENSION = "Wrong extension: only .jpg, .png, .gif files are allowed"
+TOO_LARGE = "File is too large. Only .jpg, .png, .gif up to 2MB are allowed."
+BROKEN_FILE = "Broken file: only valid .jpg, .png, .gif files are allowed. Please check your image and try again."
+
+
+class StreamedUpload:
+    """An uploaded image written to the store, pending validation."""
+
+    def __init__(self, filename: str, pending: PendingImage, detected_ext: Optional[str]):
+        self.filename = filename
+        self.pending = pending
+        self.detected_ext = detected_ext
+
+    @property
+    def path(self):
+        return self.pending.path
+
+    @property
+    def size(self) -> int:
+        return self.pending.size
+
+
+class ImageUploadParser:
+    """Streams a single image file out of a multipart request body.
+
+    The body is fed to the parser chunk by chunk as it arrives. The file part
+    is written progressively into the image store (hashed on the way), with
+    a running size counter, so an upload over `max_size` or with a bad
+    extension or magic number is rejected as soon as that becomes known,
+    without buffering the whole body in memory.
+    """
+
+    def __init__(self, request: Request, field: str = "file", max_size: int = MAX_CONTENT_LENGTH, store: ImageStore = image_store):
+        self.request = request
+        self.field = field
+        self.max_size = max_size
+        self.store = store
+
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._in_file = False
+        self._pending = []  # file data from the last chunk, written after parser.write() returns
+
+        self.filename: Optional[str] = None
+        self.size = 0
+        self.head = b""  # first bytes of the file, for format sniffing
+        self.detected_ext: Optional[str] = None
+        self._pending_image: Optional[PendingImage] = None
+
+    # Parser callbacks (synchronous, called from inside parser.write())
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._in_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if options.get(b"name", b"").decode("latin-1") != self.field or b"filename" not in options:
+            return
+        if self.filename is not None:
+            raise HTTPException(status_code=400, detail="Only one file can be uploaded at a time")
+
+        self.filename = options[b"filename"].decode("utf-8", errors="replace")
+        if os.path.splitext(self.filename)[1].lower() not in UPLOAD_EXTENSIONS:
+            raise HTTPException(status_code=415, detail=WRONG_EXTENSION)
+        self._in_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._pending.append(data[start:end])
+
+    def on_part_end(self):
+        self._in_file = False
+
+    async def _write_pending(self):
+        chunks = []
+        for chunk in self._pending:
+            self.size += len(chunk)
+            if self.size > self.max_size:
+                raise HTTPException(status_code=413, detail=TOO_LARGE)
+
+            if len(self.head) < SNIFF_LENGTH:
+                self.head += chunk[:SNIFF_LENGTH - len(self.head)]
+                if len(self.head) >= SNIFF_LENGTH:
+                    self._sniff()
+
+            if self._pending_image is None:
+                self._pending_image = self.store.create(os.path.splitext(self.filename)[1].lower())
+            chunks.append(chunk)
+        self._pending.clear()
+
+        # The checks above reject bad uploads before anything is written
+        if chunks:
+            await io_pool.run("upload_write", self._pending_image.write_chunks, chunks)
+
+    def _sniff(self):
+        self.detected_ext = sniff_image_format(self.head)
+        if self.detected_ext not in UPLOAD_EXTENSIONS:
+            raise HTTPException(status_code=415, detail=BROKEN_FILE)
+
+    def _discard(self):
+        if self._pending_image is not None:
+            self._pending_image.discard()
+            self._pending_image = None
+
+    async def parse(self) -> StreamedUpload:
+        """Reads the request body and returns the uploaded file.
+
+        Raises HTTPException 413/415 as soon as the upload is known to be
+        too large or of the wrong type; the partial file is removed.
+        """
+        content_length = self.request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_size + MULTIPART_OVERHEAD:
+            raise HTTPException(status_code=413, detail=TOO_LARGE)
+
+        content_type, params = parse_options_header(self.request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+        parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        })
+
+        try:
+            async for chunk in self.request.stream():
+                parser.write(chunk)
+                await self._write_pending()
+            parser.finalize()
+            await self._write_pending()
+
+            if self.filename is None:
+                raise HTTPException(status_code=400, detail="No file uploaded")
+            if self.detected_ext is None:
+                self._sniff()  # files shorter than the sniff window
+        except ClientDisconnect:
+            self._discard()
+            raise HTTPException(status_code=400, detail="Upload interrupted")
+        except FormParserError:
+            self._discard()
+            raise HTTPException(status_code=400, detail="Invalid multipart data")
+        except BaseException:
+            self._discard()
+            raise
+
+        self._pending_image.close()
+        return StreamedUpload(self.filename, self._pending_image, self.detected_ext)
+
+
+async def receive_image_bytes(filename: str, data: bytes, max_size: int = MAX_CONTENT_LENGTH,
+                              store: ImageStore = image_store) -> StreamedUpload:
+    """Writes an image received in one piece (e.g. over a WebSocket) to the store.
+
+    Applies the same extension, size and magic number checks as
+    `ImageUploadParser`, with the same errors.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in UPLOAD_EXTENSIONS:
+        raise HTTPException(status_code=415, detail=WRONG_EXTENSION)
+    if len(data) > max_size:
+        raise HTTPException(status_code=413, detail=TOO_LARGE)
+    detected_ext = sniff_image_format(data[:SNIFF_LENGTH])
+    if detected_ext not in UPLOAD_EXTENSIONS:
+        raise HTTPException(status_code=415, detail=BROKEN_FILE)
+
+    pending = store.create(ext)
+    try:
+        await io_pool.run("upload_write", pending.write_chunks, [data])
+        pending.close()
+    except BaseException:
+        pending.discard()
+        raise
+    return StreamedUpload(filename, pending, detected_ext)
@@ -1,77 +1,83 @@
 import io
-import os
-import base64
-from datetime import datetime, timezone
 
-from urllib.parse import urlparse
 from PIL import Image
 
-from fastapi import HTTPException
 
-from src.api.config import settings, ROOT_DIR, UPLOAD_DIR
+# Leading bytes identifying the allowed image formats
+MAGIC_NUMBERS = {
+    b"\xff\xd8\xff": ".jpeg",
+    b"\x89PNG\r\n\x1a\n": ".png",
+    b"GIF87a": ".gif",
+    b"GIF89a": ".gif",
+}
+SNIFF_LENGTH = max(len(magic) for magic in MAGIC_NUMBERS)
 
 
-def get_local_image_path(imageSrc: str) -> str:
-    """Extracts the local file path from the provided imageSrc URL."""
-    parsed_url = urlparse(imageSrc)
-    file_path = parsed_url.path.lstrip("/")  # Remove leading slash to avoid absolute path issues
-    return ROOT_DIR / file_path
+def sniff_image_format(header: bytes) -> str:
+    """Detects the image format from the magic number at the start of the file.
 
+    Args:
+        header (bytes): The first bytes of the file (at least SNIFF_LENGTH for a reliable result).
 
-def encode_image_to_base64(img_path):
-    """Reads an image file and converts it to base64 encoding."""
-    if not os.path.exists(img_path):
-        raise HTTPException(status_code=404, detail="Image file not found")
-
-    with open(img_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode()
+    Returns:
+        str: The detected image extension (or None if not recognized).
+    """
+    for magic, ext in MAGIC_NUMBERS.items():
+        if header.startswith(magic):
+            return ext
+    return None
 
 
-def validate_image(image_bytes: bytes) -> str:
+def validate_image_file(img_path) -> str:
     """
-    Validates the uploaded image file.
+    Validates an image file on disk without loading it into memory first.
+
+    This is CPU and disk bound, call it off the event loop.
 
     Args:
-        image_bytes (bytes): The raw image data.
+        img_path: Path to the image file.
 
     Returns:
         str: The detected image format (or None if not detected).
     """
     try:
-        # Load the image from bytes
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Check if image is valid
-        image.verify()  # This detects broken/corrupt images
-
-        # Get detected format (Pillow uses uppercase, e.g., 'JPEG', 'PNG')
-        detected_format = image.format.lower()
-        detected_ext = f".{detected_format}"
-        return detected_ext
-
-    except Exception as e:
+        with Image.open(img_path) as image:
+            image.verify()  # This detects broken/corrupt images
+            return f".{image.format.lower()}"
+    except Exception:
         return None
-    
-def clean_old_images(exclude: list, max_age_seconds: int = 300):
 
-    """Removes all images older than 'max_age_seconds' from the upload folder, except for excluded ones.
 
-    :param exclude: List of filenames to exclude from deletion.
-    :param max_age_seconds: Maximum age of files to keep (default: 5 minutes)
+class ImageTooLarge(ValueError):
+    """Raised for images whose pixel count could exhaust memory when decoded."""
 
+
+def normalize_image(img_path, size: int, max_pixels: int, quality: int = 90) -> bytes:
     """
-    if settings.testing:
-        max_age_seconds = 2  # Set a shorter timeout for testing
+    Prepares an image for the name model: first frame only, RGB, downscaled
+    to fit `size` x `size` (aspect ratio kept, never upscaled), as JPEG.
 
-    now = datetime.now(timezone.utc).timestamp()
-    
-    for file in UPLOAD_DIR.glob("*"):
-        if file.name not in exclude:
-            file_age = now - file.stat().st_mtime  # Calculate file age
-            
-            if file_age > max_age_seconds:  # Only delete old files
-                file.unlink()  # Delete the file
+    This is CPU bound, call it off the event loop.
 
+    Args:
+        img_path: Path to the image file.
+        size (int): Longest side of the result, in pixels.
+        max_pixels (int): Images with more pixels are refused before decoding.
+        quality (int): JPEG quality of the result.
 
-if __name__ == '__main__':
-    print(get_local_image_path("https://127.0.0.1:8000/static/images/example.jpg"))
+    Returns:
+        bytes: The normalized JPEG image.
+    """
+    with Image.open(img_path) as image:
+        # Decompression bomb guard: the header is read, the pixel data isn't yet
+        if image.width * image.height > max_pixels:
+            raise ImageTooLarge(f"{image.width}x{image.height} exceeds {max_pixels} pixels")
+
+        image.seek(0)  # first frame of animations
+        image.draft("RGB", (size, size))  # JPEG decodes straight at a reduced scale
+        image = image.convert("RGB")
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue()
@@ -1,27 +1,73 @@
-from src.api.config import LOGGING_CONFIG
+from src.api.config import LOGGING_CONFIG, INSTANCE_DIR
 
 import logging
 import logging.config
 logging.config.dictConfig(LOGGING_CONFIG)
 
+# Console and file writes happen on a background thread, off the event loop
+from src.api.logs import log_pipeline
+log_pipeline.start()
+
 logger = logging.getLogger(__name__)
 
 import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
 
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import PlainTextResponse
+
+from src.api.endpoints import generate, page, jobs, admin, session
+from src.api.inference import inference_client
+from src.api.retention import image_janitor
+from src.api.services import anime_jobs, bio_prefetcher, flights
+from src.api.admission import limiters
+from src.api.fairness import ClientIdentityMiddleware
+from src.api.cache import result_cache
+from src.api.similarity import anime_index
+from src.api.executor import io_pool, cpu_pool
+from src.api.store import image_store
+from src.api.profiling import profiler
+from src.api.static import static_files, pages
+from src.api import metrics
+from src.api.metrics import MetricsMiddleware, TimedJSONResponse
+
 
-from src.api.endpoints import generate, page
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_pipeline.start()
+    # Read the static files and render the pages once, up front
+    static_files.load()
+    pages.load("generation.html")
+    # Index the upload directory without blocking the event loop
+    image_store.load(await io_pool.run("image_index", image_store.scan))
+    inference_client.start()
+    image_janitor.start()
+    anime_jobs.start()
+    yield
+    await anime_jobs.stop()
+    await image_janitor.stop()
+    # Release pooled connections to the inference service
+    await inference_client.aclose()
+    io_pool.shutdown()
+    cpu_pool.shutdown()
+    profiler.stop()
+    # Write out the queued log records
+    log_pipeline.stop()
 
 # Initialize FastAPI app
-app = FastAPI(title="Ficbot API", version="1.1")
+app = FastAPI(title="Ficbot API", version="1.1", lifespan=lifespan, default_response_class=TimedJSONResponse)
+
+# Tell clients apart for fair scheduling and rate limiting of inference calls
+app.add_middleware(ClientIdentityMiddleware)
+# Request counts and latencies for /metrics (outermost, so it sees every response)
+app.add_middleware(MetricsMiddleware)
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.exception(f"Unhandled exception: {exc}")
-    return JSONResponse(
+    return TimedJSONResponse(
         status_code=500,
         content={"detail": "Internal server error."}
     )
@@ -29,24 +75,51 @@ async def global_exception_handler(request: Request, exc: Exception):
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     logger.error(f"HTTPException: {exc.detail} (status {exc.status_code})")
-    return JSONResponse(
+    return TimedJSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail}
+        content={"detail": exc.detail},
+        headers=exc.headers
     )
 
 # Ensure the instance folder exists
-instance_path = os.path.join(os.getcwd(), "instance")
-os.makedirs(instance_path, exist_ok=True)
+os.makedirs(INSTANCE_DIR, exist_ok=True)
 
 # Include endpoints
 app.include_router(page.router, prefix="", tags=["page"])
 app.include_router(generate.router, prefix="/generate", tags=["generate"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+app.include_router(session.router, prefix="", tags=["session"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"], include_in_schema=False)
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-static_path = os.path.join(current_dir, "static")
-app.mount("/static", StaticFiles(directory=static_path), name="static")
+# Static files from memory, precompressed, with ETags and long-lived caching of fingerprinted URLs
+app.mount("/static", static_files, name="static")
 
 @app.get("/health", status_code=200)
 def health_check():
     """Root endpoint for API health check."""
     return {"status": "ok"}
+
+@app.get("/stats", status_code=200)
+async def stats():
+    """Admission (in-flight, queued, shed, queue wait), cache, worker pool, prefetch, coalescing and logging counters."""
+    return {
+        "admission": {name: limiter.stats() for name, limiter in limiters.items()},
+        "cache": {**result_cache.stats(), "anime_near_duplicates": {**anime_index.stats.as_dict(), "entries": len(anime_index)}},
+        "executor": {"io": io_pool.stats(), "cpu": cpu_pool.stats()},
+        "prefetch": bio_prefetcher.stats(),
+        "coalescing": flights.stats(),
+        "logging": log_pipeline.stats(),
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Request, stage, upstream and upload store metrics in the Prometheus text format."""
+    # On the event loop, like every update of the metrics and of the state read here
+    metrics.upload_store_bytes.set(image_store.total_bytes)
+    metrics.upload_store_images.set(len(image_store))
+    for name, limiter in limiters.items():
+        metrics.admission_in_flight.set(limiter.inflight, endpoint=name)
+        metrics.admission_waiting.set(limiter.waiting, endpoint=name)
+    for pool in (io_pool, cpu_pool):
+        metrics.executor_pending.set(pool.pending, pool=pool.name)
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,268 @@
+"""Stand-in for the ficbot-backend inference service.
+
+Mimics the `/generate` and `/convert_to_anime` endpoints with canned
+results, so the API layer can be exercised against real HTTP backends
+without the models. Images are accepted both as raw bytes (multipart or
+application/octet-stream) and as base64-in-JSON. Behaviour can be changed
+at runtime through `POST /control`, e.g. `{"delay": 0.5}`, `{"status": 500}`,
+`{"json_only": true}` to act like a backend without binary transport,
+`{"no_batch": true}` to act like one without `/generate/batch` or
+`{"no_stream": true}` to answer streamed bio requests with plain JSON.
+
+For load tests, `latency` draws the delay of every inference call from a
+distribution (`{"dist": "lognormal", "median": 0.05, "sigma": 0.5}`,
+`"uniform"` with `low`/`high` or `"exponential"` with `mean`),
+`error_rate` fails that fraction of calls with `error_status`, and
+`bio_words`/`anime_bytes` set the size of the results.
+
+Run standalone with:
+    uvicorn tests.backend:app --port 9000
+"""
+import os
+import re
+import math
+import sys
+import json
+import time
+import base64
+import random
+import socket
+import asyncio
+import unittest
+import subprocess
+
+import httpx
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from src.api.inference import InferenceClient
+
+app = FastAPI(title="Ficbot stand-in backend")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+state = {
+    "delay": float(os.getenv("STANDIN_DELAY", 0)),  # seconds added to every inference call
+    "status": int(os.getenv("STANDIN_STATUS", 200)),  # status returned by inference calls
+    "healthy": True,
+    "json_only": False,  # reject binary bodies like an older backend
+    "no_batch": False,  # answer /generate/batch with 404 like an older backend
+    "requests": 0,
+    "batch_sizes": [],  # size of every batched call received
+    "no_stream": False,  # ignore `"stream": true` on bio requests like an older backend
+    "token_delay": 0.0,  # seconds between streamed bio tokens
+    "streams_completed": 0,
+    "streams_cancelled": 0,  # streams the client disconnected from
+    "transport": None,  # transport of the last inference call
+    "latency": None,  # distribution of an extra delay per inference call, see above
+    "error_rate": 0.0,  # fraction of inference calls failed with `error_status`
+    "error_status": 500,
+    "bio_words": 0,  # words of filler appended to bios
+    "anime_bytes": 0,  # size of anime results, 0 echoes the input image
+}
+
+rng = random.Random(int(os.getenv("STANDIN_SEED", 0)))
+
+
+def sample_latency() -> float:
+    latency = state["latency"]
+    if not latency:
+        return 0.0
+    dist = latency.get("dist", "fixed")
+    if dist == "lognormal":
+        return rng.lognormvariate(math.log(latency["median"]), latency.get("sigma", 0.5))
+    if dist == "uniform":
+        return rng.uniform(latency["low"], latency["high"])
+    if dist == "exponential":
+        return rng.expovariate(1 / latency["mean"])
+    return latency.get("value", 0.0)
+
+
+async def respond(content):
+    state["requests"] += 1
+    delay = state["delay"] + sample_latency()
+    if delay:
+        await asyncio.sleep(delay)
+    if state["status"] != 200:
+        return JSONResponse(status_code=state["status"], content={"detail": "Stand-in failure"})
+    if state["error_rate"] and rng.random() < state["error_rate"]:
+        return JSONResponse(status_code=state["error_status"], content={"detail": "Stand-in failure"})
+    if isinstance(content, bytes):
+        return Response(content=content, media_type="image/png")
+    if isinstance(content, StreamingResponse):
+        return content
+    return JSONResponse(content=content)
+
+
+def unsupported_binary(request: Request):
+    is_json = request.headers.get("content-type", "").startswith("application/json")
+    state["transport"] = "json" if is_json else "binary"
+    if not is_json and state["json_only"]:
+        return JSONResponse(status_code=415, content={"detail": "Unsupported media type"})
+
+
+def result(payload: dict) -> dict:
+    if payload.get("type") == "bio":
+        return {"bio": f"{payload['name']} is a stand-in character." + " Filler." * state["bio_words"]}
+    return {"name": "Stand-in Name"}
+
+
+async def stream_tokens(text: str):
+    try:
+        for token in re.findall(r"\S+\s*", text):
+            yield f"data: {json.dumps({'token': token})}\n\n"
+            await asyncio.sleep(state["token_delay"])
+        yield "data: [DONE]\n\n"
+        state["streams_completed"] += 1
+    except asyncio.CancelledError:
+        state["streams_cancelled"] += 1
+        raise
+
+
+@app.post("/generate")
+async def generate(request: Request):
+    if rejected := unsupported_binary(request):
+        return rejected
+    if state["transport"] == "json":
+        payload = await request.json()
+    else:
+        payload = dict(await request.form())
+
+    if payload.get("stream") and payload.get("type") == "bio" and not state["no_stream"]:
+        bio = result(payload)["bio"]
+        return await respond(StreamingResponse(stream_tokens(bio), media_type="text/event-stream"))
+    return await respond(result(payload))
+
+
+@app.post("/convert_to_anime")
+async def convert_to_anime(request: Request):
+    if rejected := unsupported_binary(request):
+        return rejected
+    if state["transport"] == "json":
+        payload = await request.json()
+        if state["anime_bytes"]:
+            return await respond({"anime_image": base64.b64encode(anime_result()).decode("utf-8")})
+        return await respond({"anime_image": payload["image"]})
+    body = await request.body()
+    return await respond(anime_result() if state["anime_bytes"] else body)
+
+
+def anime_result() -> bytes:
+    return PNG_SIGNATURE + b"\0" * (state["anime_bytes"] - len(PNG_SIGNATURE))
+
+
+@app.post("/generate/batch")
+async def generate_batch(request: Request):
+    if state["no_batch"]:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    if rejected := unsupported_binary(request):
+        return rejected
+    if state["transport"] == "json":
+        payload = await request.json()
+        items = payload["items"]
+    else:
+        form = await request.form()
+        items = json.loads(form["items"])
+        if len(form.getlist("image")) != len(items):
+            return JSONResponse(status_code=422, content={"detail": "One image per item expected"})
+
+    state["batch_sizes"].append(len(items))
+    return await respond({"results": [result(item) for item in items]})
+
+
+@app.get("/health")
+async def health():
+    if not state["healthy"]:
+        return JSONResponse(status_code=503, content={"status": "unhealthy"})
+    return {"status": "ok"}
+
+
+@app.post("/control")
+async def control(payload: dict):
+    state.update(payload)
+    return state
+
+
+@app.get("/stats")
+async def stats():
+    return state
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StandInBackend:
+    """Runs the stand-in backend in a separate uvicorn process."""
+
+    def __init__(self, **env):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}/"
+        self.env = {f"STANDIN_{key.upper()}": str(value) for key, value in env.items()}
+        self.process = None
+
+    def start(self, timeout: float = 10.0):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "tests.backend:app", "--port", str(self.port), "--log-level", "warning"],
+            env={**os.environ, **self.env},
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                httpx.get(self.url + "health", timeout=0.5)
+                return self
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"Stand-in backend did not start on port {self.port}")
+
+    def control(self, **options) -> dict:
+        return httpx.post(self.url + "control", json=options).json()
+
+    def stats(self) -> dict:
+        return httpx.get(self.url + "stats").json()
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+class StandInTestCase(unittest.IsolatedAsyncioTestCase):
+    """Tests against one stand-in backend, started once for the test case.
+
+    Every test gets an inference client for the backend in `self.client`.
+    Patches started with `patch` are stopped, and the client closed, after
+    each test.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.backend = StandInBackend().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.backend.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = self.inference_client()
+        self.patches = []
+
+    def inference_client(self) -> InferenceClient:
+        return InferenceClient(urls=[self.backend.url])
+
+    def patch(self, *patches):
+        for patch in patches:
+            patch.start()
+            self.patches.append(patch)
+
+    async def asyncTearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        await self.client.aclose()
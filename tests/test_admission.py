@@ -0,0 +1,208 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from src.api import admission
+from src.api.admission import AdmissionLimiter
+from src.api.config import settings
+from src.api.fairness import ClientIdentityMiddleware, MemoryBucketStore, current_client, current_session
+
+
+class TestAdmissionLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.release = asyncio.Event()
+        self.running = 0
+        self.peak = 0
+
+    async def call(self, limiter: AdmissionLimiter, shed: bool = True):
+        async with limiter.slot(shed=shed) as waited:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await self.release.wait()
+            self.running -= 1
+            return waited
+
+    async def test_concurrency_is_capped_and_queue_drains(self):
+        limiter = AdmissionLimiter("test", max_concurrent=2, max_queue=10)
+        calls = [asyncio.create_task(self.call(limiter)) for _ in range(6)]
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(limiter.stats()["inflight"], 2)
+        self.assertEqual(limiter.stats()["waiting"], 4)
+
+        self.release.set()
+        waits = await asyncio.gather(*calls)
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertTrue(all(wait > 0 for wait in waits[2:]))
+        self.assertEqual(limiter.stats()["inflight"], 0)
+        self.assertGreater(limiter.stats()["max_wait"], 0)
+
+    async def test_full_queue_is_shed_with_retry_after(self):
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=1)
+        calls = [asyncio.create_task(self.call(limiter)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self.call(limiter)
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertGreaterEqual(int(ctx.exception.headers["Retry-After"]), 1)
+
+        # Unshed calls wait regardless of the queue bound
+        unshed = asyncio.create_task(self.call(limiter, shed=False))
+        await asyncio.sleep(0.05)
+        self.release.set()
+        await asyncio.gather(*calls, unshed)
+        self.assertEqual(limiter.stats()["rejected"], 1)
+        self.assertEqual(limiter.stats()["admitted"], 3)
+
+    async def test_queue_timeout_and_cancelled_waiters(self):
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=5, queue_timeout=0.05)
+        holder = asyncio.create_task(self.call(limiter))
+        await asyncio.sleep(0)
+
+        with self.assertRaises(HTTPException):
+            await self.call(limiter)
+        self.assertEqual(limiter.stats()["timed_out"], 1)
+
+        abandoned = asyncio.create_task(self.call(limiter, shed=False))
+        await asyncio.sleep(0.01)
+        abandoned.cancel()
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.stats()["waiting"], 0)
+
+        self.release.set()
+        await holder
+        self.assertEqual(limiter.stats()["inflight"], 0)
+
+    async def test_slot_handed_over_as_the_wait_times_out(self):
+        """A slot passed on in the same loop iteration as the queue timeout is released, not leaked."""
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=10, queue_timeout=1)
+        await limiter._acquire(shed=True)
+
+        async def racing_wait_for(future, timeout):
+            limiter._release()  # the holder hands its slot to the waiter...
+            raise asyncio.TimeoutError  # ...just as the wait times out
+
+        with mock.patch.object(admission.asyncio, "wait_for", racing_wait_for):
+            with self.assertRaises(HTTPException) as ctx:
+                await limiter._acquire(shed=True)
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(limiter.stats()["inflight"], 0)
+
+
+class TestFairScheduling(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.release = asyncio.Event()
+        self.order = []
+
+    async def call(self, limiter: AdmissionLimiter, client: str):
+        current_client.set(client)
+        async with limiter.slot():
+            self.order.append(client)
+            await self.release.wait()
+
+    async def test_clients_are_served_in_turn(self):
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=20, max_client_queue=10)
+        calls = [asyncio.create_task(self.call(limiter, "heavy")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        calls += [asyncio.create_task(self.call(limiter, "light")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(limiter.stats()["waiting_clients"], 2)
+
+        self.release.set()
+        await asyncio.gather(*calls)
+        self.assertEqual(self.order, ["heavy", "heavy", "light", "heavy", "light", "heavy", "heavy"])
+
+    async def test_per_client_queue_share(self):
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=20, max_client_queue=2)
+        calls = [asyncio.create_task(self.call(limiter, "heavy")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self.call(limiter, "heavy")
+        self.assertEqual(ctx.exception.status_code, 503)
+
+        calls.append(asyncio.create_task(self.call(limiter, "light")))  # others still get in line
+        await asyncio.sleep(0.01)
+        self.assertEqual(limiter.stats()["waiting"], 3)
+        self.release.set()
+        await asyncio.gather(*calls)
+
+    async def test_token_bucket_rate_limit(self):
+        buckets = MemoryBucketStore()
+        limiter = AdmissionLimiter("test", max_concurrent=0, max_queue=0, rate=1.0, burst=3, cost=2,
+                                   buckets=buckets)
+        self.release.set()
+        await self.call(limiter, "a")
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self.call(limiter, "a")
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertEqual(ctx.exception.headers["Retry-After"], "1")
+
+        await self.call(limiter, "b")  # buckets are per client
+        self.assertEqual(limiter.stats()["throttled"], 1)
+        self.assertEqual(len(buckets), 2)
+
+    async def test_bucket_refill(self):
+        buckets = MemoryBucketStore(max_keys=1)
+        self.assertEqual(await buckets.take("a", 1, rate=100, burst=1), 0)
+        self.assertGreater(await buckets.take("a", 1, rate=100, burst=1), 0)
+        await asyncio.sleep(0.02)
+        self.assertEqual(await buckets.take("a", 1, rate=100, burst=1), 0)
+
+        await buckets.take("b", 1, rate=100, burst=1)
+        self.assertEqual(len(buckets), 1)  # least recently used bucket dropped
+
+
+class TestClientIdentity(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(ClientIdentityMiddleware)
+        app.get("/whoami")(lambda: {"client": current_client.get(), "session": current_session.get()})
+
+        limiter = AdmissionLimiter("test", max_concurrent=0, max_queue=10, rate=0.001, burst=1.0,
+                                   buckets=MemoryBucketStore())
+
+        @app.get("/limited")
+        async def limited():
+            await limiter.throttle()
+            return {}
+
+        self.client = TestClient(app)
+
+    def test_issued_cookie_identifies_the_session(self):
+        first = self.client.get("/whoami")
+        self.assertEqual(first.json(), {"client": "ip:testclient", "session": "ip:testclient"})
+        self.assertIn(settings.client_cookie, first.cookies)
+
+        second = self.client.get("/whoami")  # sends the cookie back
+        self.assertEqual(second.json()["client"], "ip:testclient")
+        self.assertTrue(second.json()["session"].startswith("session:"))
+        self.assertNotIn("set-cookie", second.headers)
+
+    def test_made_up_cookies_are_ignored(self):
+        self.client.cookies.set(settings.client_cookie, "0123456789abcdef.0123456789abcdef")
+        response = self.client.get("/whoami")
+        self.assertEqual(response.json()["session"], "ip:testclient")
+        self.assertIn("set-cookie", response.headers)
+
+    def test_rotating_cookies_shares_one_bucket(self):
+        cookies = []
+        for _ in range(3):
+            self.client.cookies.clear()
+            cookies.append(self.client.get("/whoami").cookies[settings.client_cookie])
+
+        statuses = []
+        for cookie in cookies:
+            self.client.cookies.set(settings.client_cookie, cookie)
+            statuses.append(self.client.get("/limited").status_code)
+        self.assertEqual(statuses, [200, 429, 429])
+
@@ -1,12 +1,21 @@
+import io
 import os
 import unittest
 import time
 import base64
+import asyncio
+from unittest import mock
 
+from PIL import Image
+
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 
 from src.main import app
 from src.api.config import settings, UPLOAD_DIR
+from src.api.endpoints import page
+from src.api.store import image_store
+from src.api.uploads import StreamedUpload
 
 from tests.config import current_dir
 
@@ -24,6 +33,12 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), {"status": "ok"})
 
+    def test_stats_endpoint(self):
+        """Test the stats endpoint reports admission control per inference endpoint."""
+        response = client.get("/stats")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["admission"]), {"name", "bio", "anime"})
+
 
     def test_upload_image_endpoint(self):
         """Test the image upload endpoint with a valid image."""
@@ -46,10 +61,11 @@ class TestAPI(unittest.TestCase):
 
         time.sleep(3)  # for testing image timeout is 2 seconds
 
-        img2_path = os.path.join(current_dir, "files/sample.jpg")
-        with open(img2_path, "rb") as image:
-            files = {"file": ("sample.jpg", image, "image/jpeg")}
-            response = client.post("/upload_image/", files=files)
+        # A different image: identical bytes would resolve to the same stored file
+        image = io.BytesIO()
+        Image.new("RGB", (32, 32), color=(255, 0, 0)).save(image, format="PNG")
+        files = {"file": ("red.png", image.getvalue(), "image/png")}
+        response = client.post("/upload_image/", files=files)
 
         self.assertEqual(response.status_code, 200)
         self.assertIn("imgUrl", response.json())
@@ -60,6 +76,23 @@ class TestAPI(unittest.TestCase):
         self.assertFalse(img1_path.exists())  # old file is now removed since it is older than 2 seconds
 
 
+    def test_upload_image_deduplication(self):
+        """Test that uploading identical bytes twice returns the same stored image."""
+
+        image = io.BytesIO()
+        Image.new("RGB", (32, 32), color=(0, 128, 255)).save(image, format="PNG")
+
+        urls = []
+        for _ in range(2):
+            files = {"file": ("blue.png", image.getvalue(), "image/png")}
+            response = client.post("/upload_image", files=files)
+            self.assertEqual(response.status_code, 200)
+            urls.append(response.json()["imgUrl"])
+
+        self.assertEqual(urls[0], urls[1])
+        self.assertTrue((UPLOAD_DIR / urls[0].split("/")[-1]).exists())
+
+
     def test_upload_image_wrong_extension(self):
         """Test uploading a file with an invalid extension."""
 
@@ -86,6 +119,16 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(response.json()["detail"], "Broken file: only valid .jpg, .png, .gif files are allowed. Please check your image and try again.")
 
 
+    def test_upload_validation_shed(self):
+        """An upload whose validation is shed leaves no temporary file behind."""
+        pending = image_store.write_bytes(b"not validated yet", ".png")
+        upload = StreamedUpload("shed.png", pending, ".png")
+
+        with mock.patch.object(page.cpu_pool, "run", side_effect=HTTPException(status_code=503, detail="Server busy")):
+            with self.assertRaises(HTTPException):
+                asyncio.run(page.accept_upload(upload))
+        self.assertFalse(pending.path.exists())
+
     def test_upload_image_too_large(self):
         """Test uploading a file that is too large."""
 
@@ -98,6 +141,29 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 413)
         self.assertEqual(response.json()["detail"], "File is too large. Only .jpg, .png, .gif up to 2MB are allowed.")
 
+
+    def test_upload_image_too_large_streamed(self):
+        """Test that a chunked upload without Content-Length is cut off once it crosses the limit."""
+
+        img_path = os.path.join(current_dir, "files/large.jpg")
+
+        def body():
+            yield b'--boundary\r\nContent-Disposition: form-data; name="file"; filename="large.jpg"\r\n'
+            yield b'Content-Type: image/jpeg\r\n\r\n'
+            with open(img_path, "rb") as image:
+                while chunk := image.read(64 * 1024):
+                    yield chunk
+            yield b'\r\n--boundary--\r\n'
+
+        response = client.post(
+            "/upload_image",
+            content=body(),
+            headers={"Content-Type": "multipart/form-data; boundary=boundary"}
+        )
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(list(UPLOAD_DIR.glob(".*.part")), [])  # partial file is removed
+
     
     def test_generate_character_name(self):
         """Test the name generation API with valid parameters."""
@@ -143,6 +209,22 @@ class TestAPI(unittest.TestCase):
         self.assertIn("bio", response.json())
         self.assertIsInstance(response.json()["bio"], str)
 
+    def test_stream_character_bio(self):
+        """Test the streaming bio API: token events followed by a done event."""
+
+        payload = {
+            "name": "Jane Doe",
+            "diversity": 1.2,
+            "max_bio_length": 200
+        }
+        response = client.post("generate/bio/stream", json=payload)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = response.text.strip().split("\n\n")
+        self.assertEqual(events[0], 'data: {"token": "Test "}')
+        self.assertEqual(events[-1], 'event: done\ndata: {"bio": "Test Bio"}')
+
 
     def test_animefy_character_image(self):
         """Test animefication API with valid parameters"""
@@ -156,3 +238,33 @@ class TestAPI(unittest.TestCase):
         response = client.post("/convert_to_anime", json={"image": base64_image})
         assert response.status_code == 200
         assert "animeImgUrl" in response.json()
+
+    def test_animefy_character_image_job(self):
+        """Test the anime conversion job API: submit, poll and watch over a WebSocket"""
+
+        img_path = os.path.join(current_dir, "files/sample.jpg")
+        with open(img_path, "rb") as image:
+            base64_image = base64.b64encode(image.read()).decode('utf-8')
+
+        # The lifespan starts the job workers
+        with TestClient(app) as job_client:
+            response = job_client.post("/jobs/convert_to_anime", json={"image": base64_image})
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()["jobId"]
+
+            # Identical images share one job
+            response = job_client.post("/jobs/convert_to_anime", json={"image": base64_image})
+            self.assertEqual(response.json()["jobId"], job_id)
+
+            with job_client.websocket_connect(f"/jobs/{job_id}/ws") as websocket:
+                state = websocket.receive_json()
+                while state["status"] not in ("done", "failed"):
+                    state = websocket.receive_json()
+            self.assertEqual(state["status"], "done")
+
+            response = job_client.get(f"/jobs/{job_id}")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("animeImgUrl", response.json())
+
+            self.assertEqual(job_client.get("/jobs/unknown").status_code, 404)
+            self.assertEqual(job_client.get("/jobs/stats").json()["anime"]["queue_depth"], 0)
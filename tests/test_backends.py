@@ -0,0 +1,240 @@
+import time
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import httpx
+
+from fastapi import HTTPException
+
+from src.api.backends import BackendPool, RetryBudget, OPEN, CLOSED
+from src.api.config import settings
+from src.api.inference import InferenceClient
+from src.api.metrics import upstream_errors
+
+from tests.backend import StandInBackend, StandInTestCase
+
+
+class TestBackendPool(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.backends = [StandInBackend().start(), StandInBackend().start()]
+
+    @classmethod
+    def tearDownClass(cls):
+        for backend in cls.backends:
+            backend.stop()
+
+    def setUp(self):
+        for backend in self.backends:
+            backend.control(delay=0, status=200, healthy=True, json_only=False, requests=0, token_delay=0.0)
+
+    def make_client(self, **options) -> InferenceClient:
+        options.setdefault("retry_budget", RetryBudget(ratio=1.0))
+        pool = BackendPool([backend.url for backend in self.backends], **options)
+        return InferenceClient(pool=pool)
+
+    async def test_requests_spread_across_backends(self):
+        """Concurrent requests go to the least-loaded backend."""
+        for backend in self.backends:
+            backend.control(delay=0.2)
+        client = self.make_client()
+
+        names = await asyncio.gather(*(client.generate_name("", 1.0, 3, 6) for _ in range(10)))
+        await client.aclose()
+
+        self.assertEqual(names, ["Stand-in Name"] * 10)
+        self.assertEqual([backend.stats()["requests"] for backend in self.backends], [5, 5])
+
+    async def test_failover_and_ejection(self):
+        """A failing backend is retried elsewhere and ejected by the circuit breaker."""
+        self.backends[0].control(status=500)
+        client = self.make_client(failure_threshold=2, cooldown=60)
+        errors = upstream_errors.get(status="500")
+
+        for _ in range(5):
+            bio = await client.generate_bio("Jane", 1.0, 100)
+            self.assertEqual(bio, "Jane is a stand-in character.")
+        await client.aclose()
+
+        failing = client.pool.backends[0]
+        self.assertEqual(failing.state, OPEN)
+        self.assertEqual(self.backends[0].stats()["requests"], 2)  # no traffic once ejected
+        self.assertEqual(upstream_errors.get(status="500") - errors, 2)
+
+    async def test_all_backends_failing(self):
+        """Upstream failures surface as 502, an empty pool as 503."""
+        for backend in self.backends:
+            backend.control(status=500)
+        client = self.make_client(failure_threshold=1)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await client.generate_bio("Jane", 1.0, 100)
+        self.assertEqual(ctx.exception.status_code, 502)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await client.generate_bio("Jane", 1.0, 100)
+        self.assertEqual(ctx.exception.status_code, 503)
+        await client.aclose()
+
+    async def test_hedged_request(self):
+        """A slow backend is raced by a second one after the hedge delay."""
+        client = self.make_client(hedge_delay=0.1)
+        slow, fast = client.pool.backends
+        fast.ewma_latency = 10.0  # make the slow backend the first pick
+        self.backends[0].control(delay=2)
+
+        start = time.monotonic()
+        await client.post("generate", {"type": "bio", "name": "Jane"}, hedge=True)
+        self.assertLess(time.monotonic() - start, 1)
+        await client.aclose()
+
+    async def test_cancelled_hedged_request(self):
+        """Cancelling the caller before the hedge delay also cancels the request in flight."""
+        client = self.make_client(hedge_delay=5)
+        for backend in self.backends:
+            backend.control(delay=1)
+
+        call = asyncio.create_task(client.post("generate", {"type": "bio", "name": "Jane"}, hedge=True))
+        await asyncio.sleep(0.2)
+        self.assertEqual(sum(backend.inflight for backend in client.pool.backends), 1)
+        call.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(sum(backend.inflight for backend in client.pool.backends), 0)
+        await client.aclose()
+
+    async def test_streamed_request_holds_its_backend(self):
+        """A streamed response keeps its backend busy until the body has been read."""
+        client = self.make_client()
+        for backend in self.backends:
+            backend.control(token_delay=0.05)
+
+        payload = {"type": "bio", "name": "Jane", "stream": True}
+        response = await client.pool.post(client.client, "generate", stream=True, json=payload)
+        busy = [backend for backend in client.pool.backends if backend.inflight]
+        self.assertEqual([backend.inflight for backend in busy], [1])
+        backend = busy[0]
+
+        lines = [line async for line in response.aiter_lines()]
+        self.assertIn("data: [DONE]", lines)
+        self.assertEqual(backend.inflight, 0)
+        self.assertGreaterEqual(backend.ewma_latency, 0.2)  # five tokens, the whole body
+        await client.aclose()
+
+    async def test_failed_stream_counts_as_a_backend_failure(self):
+        """A read error in the middle of a streamed body is recorded against its backend."""
+        class BrokenBody(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                yield b"data: {}\n\n"
+                raise httpx.ReadError("Connection lost")
+
+        pool = BackendPool(["http://backend/"], failure_threshold=1)
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, stream=BrokenBody()))
+        async with httpx.AsyncClient(transport=transport) as http_client:
+            response = await pool.post(http_client, "generate", stream=True, json={})
+            with self.assertRaises(httpx.ReadError):
+                await response.aread()
+            await response.aclose()
+
+        backend = pool.backends[0]
+        self.assertEqual(backend.inflight, 0)
+        self.assertEqual(backend.state, OPEN)
+
+    async def test_probe_ejects_and_restores(self):
+        """Background probing takes unhealthy backends out and puts them back."""
+        client = self.make_client(failure_threshold=1)
+        self.backends[0].control(healthy=False)
+
+        await client.pool.probe(client.client)
+        self.assertEqual(client.pool.backends[0].state, OPEN)
+
+        self.backends[0].control(healthy=True)
+        await client.pool.probe(client.client)
+        self.assertEqual(client.pool.backends[0].state, CLOSED)
+        await client.aclose()
+
+
+class TestImageTransport(StandInTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(Path(__file__).parent / "files/sample.jpg", "rb") as f:
+            cls.image = f.read()
+
+    def setUp(self):
+        super().setUp()
+        self.backend.control(json_only=False, status=200)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.save_path = Path(self.tmp_dir.name) / "anime.png"
+
+    def inference_client(self) -> InferenceClient:
+        return InferenceClient(urls=[self.backend.url], transport="auto")
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.tmp_dir.cleanup()
+
+    async def test_binary_transport(self):
+        """Images are sent as raw bytes and the anime result is streamed to disk."""
+        name = await self.client.generate_name(self.image, 1.0, 3, 6, content_type="image/jpeg")
+        self.assertEqual(name, "Stand-in Name")
+        self.assertEqual(self.backend.stats()["transport"], "binary")
+
+        with open(self.save_path, "wb") as out:
+            await self.client.convert_to_anime(self.image, out)
+        self.assertEqual(self.backend.stats()["transport"], "binary")
+        self.assertEqual(self.save_path.read_bytes(), self.image)
+
+    async def test_json_fallback(self):
+        """Backends that reject binary bodies are spoken to in base64-in-JSON."""
+        self.backend.control(json_only=True)
+
+        name = await self.client.generate_name(self.image, 1.0, 3, 6)
+        self.assertEqual(name, "Stand-in Name")
+        self.assertEqual(self.backend.stats()["transport"], "json")
+
+        with open(self.save_path, "wb") as out:
+            await self.client.convert_to_anime(self.image, out)
+        self.assertEqual(self.save_path.read_bytes(), self.image)
+        self.assertEqual(set(self.client._json_only), {"generate", "convert_to_anime"})
+
+    async def test_other_errors_keep_the_binary_transport(self):
+        """A failed call (e.g. a 404 or a 422 about another field) doesn't switch the transport."""
+        self.backend.control(status=404)
+        with self.assertRaises(HTTPException):
+            await self.client.generate_name(self.image, 1.0, 3, 6)
+        self.assertEqual(self.client._json_only, {})
+
+    async def test_validation_errors_naming_the_image_field(self):
+        rejects_binary = InferenceClient._rejects_binary
+        self.assertTrue(await rejects_binary(httpx.Response(415)))
+        self.assertTrue(await rejects_binary(httpx.Response(422, json={"detail": [{"loc": ["body", "image"]}]})))
+        self.assertFalse(await rejects_binary(httpx.Response(422, json={"detail": [{"loc": ["body", "diversity"]}]})))
+        self.assertFalse(await rejects_binary(httpx.Response(404, json={"detail": "Not Found"})))
+
+    async def test_json_fallback_expires(self):
+        """Binary bodies are tried again once the fallback has expired."""
+        self.backend.control(json_only=True)
+        with mock.patch.object(settings, "inference_fallback_ttl", 0):
+            await self.client.generate_name(self.image, 1.0, 3, 6)
+            self.backend.control(json_only=False)
+            await self.client.generate_name(self.image, 1.0, 3, 6)
+        self.assertEqual(self.backend.stats()["transport"], "binary")
+
+
+class TestRetryBudget(unittest.TestCase):
+
+    def test_budget_limits_retries(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0)
+        for _ in range(4):
+            budget.deposit()
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
@@ -0,0 +1,117 @@
+import asyncio
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import httpx
+
+from fastapi import HTTPException
+
+from src.api.batching import MicroBatcher
+from src.api.config import settings
+
+from tests.backend import StandInTestCase
+
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_items_share_a_batch(self):
+        sent = []
+
+        async def send(items):
+            sent.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(send, max_batch_size=4, max_wait=0.05)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+        self.assertEqual(results, [i * 2 for i in range(10)])
+        self.assertEqual([len(batch) for batch in sent], [4, 4, 2])
+        self.assertEqual(batcher.stats()["batches"], 3)
+
+    async def test_errors_reach_only_their_caller(self):
+        async def send(items):
+            return [HTTPException(status_code=502) if item == "bad" else item for item in items]
+
+        batcher = MicroBatcher(send, max_wait=0.01)
+        results = await asyncio.gather(batcher.submit("good"), batcher.submit("bad"), return_exceptions=True)
+
+        self.assertEqual(results[0], "good")
+        self.assertIsInstance(results[1], HTTPException)
+
+    async def test_cancelled_callers_are_not_sent(self):
+        sent = []
+
+        async def send(items):
+            sent.extend(items)
+            return items
+
+        batcher = MicroBatcher(send, max_wait=0.05)
+        abandoned = asyncio.create_task(batcher.submit("abandoned"))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+
+        self.assertEqual(await batcher.submit("kept"), "kept")
+        self.assertEqual(sent, ["kept"])
+
+
+class TestBatchedInference(StandInTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(Path(__file__).parent / "files/sample.jpg", "rb") as f:
+            cls.image = f.read()
+
+    def setUp(self):
+        super().setUp()
+        self.backend.control(no_batch=False, json_only=False, batch_sizes=[], requests=0)
+
+    async def test_bio_batch(self):
+        batcher = MicroBatcher(self.client.generate_bio_batch, max_wait=0.05)
+        names = [f"Character {i}" for i in range(6)]
+
+        bios = await asyncio.gather(*(
+            batcher.submit({"name": name, "diversity": 1.0, "max_bio_length": 100}) for name in names
+        ))
+
+        self.assertEqual(bios, [f"{name} is a stand-in character." for name in names])
+        self.assertEqual(self.backend.stats()["batch_sizes"], [6])
+
+    async def test_name_batch(self):
+        """Images are sent as one multipart batch, or base64 for JSON-only backends."""
+        items = [{"image": self.image, "diversity": 1.0, "min_name_length": 3, "max_name_length": 6}] * 3
+
+        for json_only in (False, True):
+            self.backend.control(json_only=json_only)
+            names = await self.client.generate_name_batch(items)
+            self.assertEqual(names, ["Stand-in Name"] * 3)
+            self.assertEqual(self.backend.stats()["transport"], "json" if json_only else "binary")
+
+        self.assertEqual(self.backend.stats()["batch_sizes"], [3, 3])
+
+    async def test_backend_without_batch_endpoint(self):
+        self.backend.control(no_batch=True)
+        items = [{"name": "Jane", "diversity": 1.0, "max_bio_length": 100}] * 3
+
+        bios = await self.client.generate_bio_batch(items)
+
+        self.assertEqual(bios, ["Jane is a stand-in character."] * 3)
+        self.assertEqual(self.backend.stats()["requests"], 3)
+
+    async def test_batch_endpoint_is_tried_again(self):
+        self.backend.control(no_batch=True)
+        items = [{"name": "Jane", "diversity": 1.0, "max_bio_length": 100}] * 3
+
+        with mock.patch.object(settings, "inference_fallback_ttl", 0):
+            await self.client.generate_bio_batch(items)
+            self.backend.control(no_batch=False)
+            await self.client.generate_bio_batch(items)
+        self.assertEqual(self.backend.stats()["batch_sizes"], [3])
+
+    def test_malformed_items_fail_alone(self):
+        response = httpx.Response(200, json={"results": [{"bio": "Jane is a stand-in character."}, "oops", {}]})
+        results = self.client._batch_results(response, "bio", 3, "Bio generation failed")
+
+        self.assertEqual(results[0], "Jane is a stand-in character.")
+        self.assertTrue(all(isinstance(result, HTTPException) and result.status_code == 502 for result in results[1:]))
@@ -0,0 +1,47 @@
+import unittest
+
+from benchmarks.loadgen import percentile, ScenarioResult
+from benchmarks.run import compare, parse_latency
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_percentile(self):
+        values = [i / 100 for i in range(1, 101)]
+        self.assertAlmostEqual(percentile(values, 50), 0.505)
+        self.assertAlmostEqual(percentile(values, 99), 0.9901)
+        self.assertEqual(percentile(values, 100), 1.0)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summary_counts_errors_apart(self):
+        result = ScenarioResult("name", concurrency=2)
+        for latency in (0.1, 0.2, 0.3):
+            result.record(200, latency)
+        result.record(503, 0.01)
+        result.record("error", 5.0)
+        result.elapsed = 1.5
+
+        summary = result.summary()
+        self.assertEqual((summary["requests"], summary["errors"]), (5, 2))
+        self.assertAlmostEqual(summary["throughput"], 2.0)
+        self.assertAlmostEqual(summary["p50_ms"], 200.0)
+        self.assertEqual(summary["statuses"], {"200": 3, "503": 1, "error": 1})
+
+    def test_compare_with_baseline(self):
+        baseline = {"scenarios": {"bio": {"p50_ms": 100, "p95_ms": 200, "p99_ms": 300, "throughput": 50}},
+                    "peak_rss_mb": 100}
+        same = {"bio": {"p50_ms": 110, "p95_ms": 190, "p99_ms": 320, "throughput": 45, "peak_rss_mb": 110}}
+        worse = {"bio": {"p50_ms": 100, "p95_ms": 300, "p99_ms": 300, "throughput": 30, "peak_rss_mb": 150}}
+
+        self.assertEqual(compare(same, baseline, tolerance=0.25), [])
+        self.assertEqual(compare(worse, baseline, tolerance=0.25),
+                         ["bio p95_ms: 200.0 -> 300.0", "bio throughput: 50.0 -> 30.0", "peak_rss_mb: 100.0 -> 150.0"])
+
+    def test_parse_latency(self):
+        self.assertEqual(parse_latency("lognormal:0.05"), {"dist": "lognormal", "median": 0.05, "sigma": 0.5})
+        self.assertEqual(parse_latency("uniform:0.01:0.1"), {"dist": "uniform", "low": 0.01, "high": 0.1})
+        self.assertIsNone(parse_latency("none"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import asyncio
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.api.config import settings
+from src.api.endpoints import generate
+from src.api.models.generate import BioRequest
+
+
+def items(*names: str) -> list:
+    return [{"name": name, "diversity": 1.0, "max_bio_length": 200} for name in names]
+
+
+class TestBioBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+        self.running = 0
+        self.most_running = 0
+
+    async def fake_bio(self, request_data: BioRequest) -> str:
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        try:
+            await asyncio.sleep(0.05 if request_data.name == "Slow" else 0.01)
+            if request_data.name == "Bad":
+                raise HTTPException(status_code=502, detail="Bio generation failed")
+            if request_data.name == "Broken":
+                raise ValueError("unexpected")
+            return f"Bio of {request_data.name}"
+        finally:
+            self.running -= 1
+
+    def post(self, body: dict) -> tuple:
+        with mock.patch.object(generate, "bio_for", self.fake_bio), \
+                mock.patch.object(settings, "bio_batch_concurrency", 2):
+            response = self.client.post("/generate/bio/batch", json=body)
+        return response, [json.loads(line) for line in response.text.splitlines()]
+
+    def test_results_stream_as_they_complete(self):
+        response, lines = self.post({"items": items("Slow", "Jane", "Bad", "Broken", "John")})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        by_index = {line["index"]: line for line in lines}
+        self.assertEqual(set(by_index), {0, 1, 2, 3, 4})
+        self.assertEqual(by_index[0], {"index": 0, "success": True, "bio": "Bio of Slow"})
+        self.assertEqual(by_index[2], {"index": 2, "success": False, "status": 502, "detail": "Bio generation failed"})
+        self.assertEqual(by_index[3]["status"], 500)
+        self.assertEqual(by_index[4]["bio"], "Bio of John")
+
+        # The slow first item doesn't hold back the others, and the cap holds
+        self.assertNotEqual(lines[0]["index"], 0)
+        self.assertEqual(self.most_running, 2)
+
+    def test_batch_limits(self):
+        self.assertEqual(self.post({"items": []})[0].status_code, 422)
+        self.assertEqual(self.post({"items": items("Jane", "John") + [{"name": "Nobody"}]})[0].status_code, 422)
+
+        with mock.patch.object(settings, "bio_batch_max_items", 2):
+            self.assertEqual(self.post({"items": items("A", "B", "C")})[0].status_code, 413)
+
+
+if __name__ == "__main__":
+    unittest.main()
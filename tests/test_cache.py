@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from src.api import services
+from src.api.cache import MemoryCache, DiskCache, ResultCache, cache_key
+
+from tests.backend import StandInTestCase
+
+
+class TestResultCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cache_key_is_canonical(self):
+        self.assertEqual(cache_key("bio", name="Jane", diversity=1.0), cache_key("bio", diversity=1.0, name="Jane"))
+        self.assertNotEqual(cache_key("bio", name="Jane", seed=1), cache_key("bio", name="Jane", seed=2))
+        self.assertNotEqual(cache_key("bio", name="Jane"), cache_key("name", name="Jane"))
+
+    def test_memory_lru_and_ttl(self):
+        cache = MemoryCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # "b" is now least recently used
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+
+        cache.set("d", 4, ttl=0)
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual(cache.stats.as_dict(), {"hits": 1, "misses": 2, "evictions": 3})
+
+    async def test_disk_tier_promotes_to_memory(self):
+        disk = DiskCache(self.tmp_dir.name)
+        await ResultCache(MemoryCache(), disk).set("key", "value")
+
+        cache = ResultCache(MemoryCache(), DiskCache(self.tmp_dir.name))  # e.g. after a restart
+        self.assertEqual(await cache.get("key"), "value")
+        self.assertEqual(cache.memory.get("key"), "value")
+        self.assertEqual(cache.stats()["disk"]["hits"], 1)
+
+    def test_disk_tier_expiry(self):
+        disk = DiskCache(self.tmp_dir.name)
+        disk.set("key", "value", ttl=-1)
+        self.assertIsNone(disk.get("key"))
+        self.assertEqual(disk.stats.evictions, 1)
+
+
+class TestCachedServices(StandInTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.control(requests=0)
+        self.cache = ResultCache(MemoryCache())
+        self.patch(
+            mock.patch.object(services, "inference_client", self.client),
+            mock.patch.object(services, "result_cache", self.cache),
+        )
+
+    async def test_seeded_bio_is_cached(self):
+        for _ in range(3):
+            bio = await services.generate_bio("Jane", 1.0, 100, seed=42)
+            self.assertEqual(bio, "Jane is a stand-in character.")
+        self.assertEqual(self.backend.stats()["requests"], 1)
+
+        await services.generate_bio("Jane", 1.0, 100, seed=42, no_cache=True)
+        self.assertEqual(self.backend.stats()["requests"], 2)
+
+    async def test_unseeded_bio_is_not_cached(self):
+        for _ in range(2):
+            await services.generate_bio("Jane", 1.0, 100)
+        self.assertEqual(self.backend.stats()["requests"], 2)
+        self.assertEqual(len(self.cache.memory), 0)
@@ -0,0 +1,66 @@
+import time
+import base64
+import asyncio
+import threading
+import unittest
+
+from fastapi import HTTPException
+
+from src.api.executor import WorkerPool
+
+
+class TestWorkerPool(unittest.IsolatedAsyncioTestCase):
+
+    async def test_runs_off_the_event_loop_with_timings(self):
+        pool = WorkerPool("test", max_workers=2)
+        loop_thread = threading.get_ident()
+
+        threads = await asyncio.gather(*(pool.run("sleep", lambda: time.sleep(0.05) or threading.get_ident())
+                                         for _ in range(4)))
+
+        self.assertNotIn(loop_thread, threads)
+        timing = pool.stats()["tasks"]["sleep"]
+        self.assertEqual(timing["count"], 4)
+        self.assertGreaterEqual(timing["mean_run"], 0.04)
+        self.assertGreater(timing["mean_wait"], 0)  # two of the four waited for a worker
+        pool.shutdown()
+
+    async def test_full_queue_is_shed(self):
+        pool = WorkerPool("test", max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = [asyncio.ensure_future(pool.run("block", release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await pool.run("block", release.wait)
+        self.assertEqual(ctx.exception.status_code, 503)
+
+        release.set()
+        await asyncio.gather(*running)
+        self.assertEqual(pool.stats()["rejected"], 1)
+        self.assertEqual(pool.stats()["pending"], 0)
+        pool.shutdown()
+
+    async def test_abandoned_task_counts_until_it_finishes(self):
+        """A task whose caller was cancelled keeps its place in the queue until the worker is done."""
+        pool = WorkerPool("test", max_workers=1, max_queue=0)
+        release = threading.Event()
+        self.addCleanup(release.set)  # never leave the worker blocked
+        call = asyncio.ensure_future(pool.run("block", release.wait))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(pool.stats()["pending"], 1)
+        with self.assertRaises(HTTPException):
+            await pool.run("block", release.wait)
+
+        release.set()
+        await asyncio.sleep(0.05)
+        self.assertEqual(pool.stats()["pending"], 0)
+        pool.shutdown()
+
+    async def test_process_pool(self):
+        pool = WorkerPool("test", kind="process", max_workers=1)
+        self.assertEqual(await pool.run("b64decode", base64.b64decode, "aGVsbG8="), b"hello")
+        pool.shutdown()
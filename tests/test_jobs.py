@@ -0,0 +1,131 @@
+import asyncio
+import unittest
+from collections import deque
+
+from fastapi import HTTPException
+
+from src.api.jobs import JobManager, JobQueue, JobQueueFull, MemoryJobQueue, DONE, FAILED
+
+
+class BrokerQueue(JobQueue):
+    """Stand-in for a broker-backed queue: a bounded FIFO polled by the workers."""
+
+    def __init__(self, max_size: int = 10):
+        self.items = deque()
+        self.max_size = max_size
+
+    async def put(self, job_id: str):
+        if len(self.items) >= self.max_size:
+            raise JobQueueFull()
+        self.items.append(job_id)
+
+    async def get(self) -> str:
+        while not self.items:
+            await asyncio.sleep(0.01)
+        return self.items.popleft()
+
+    def depth(self) -> int:
+        return len(self.items)
+
+
+class TestJobManager(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def handler(self, job):
+        self.calls.append(job.payload)
+        await self.release.wait()
+        if job.payload == "bad":
+            raise HTTPException(status_code=502, detail="Anime conversion failed")
+        return {"result": job.payload}
+
+    async def wait_finished(self, jobs: JobManager, job):
+        async for state in jobs.watch(job):
+            pass
+        return state
+
+    async def asyncTearDown(self):
+        await self.jobs.stop()
+
+    async def test_jobs_run_on_bounded_workers(self):
+        self.jobs = JobManager(self.handler, queue=MemoryJobQueue(), workers=2)
+        submitted = [await self.jobs.submit(f"key{i}", i) for i in range(5)]
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.jobs.stats()["queue_depth"], 3)
+        self.assertEqual(self.jobs.stats()["running"], 2)
+
+        self.release.set()
+        states = [await self.wait_finished(self.jobs, job) for job in submitted]
+        self.assertEqual([state["result"] for state in states], list(range(5)))
+        self.assertEqual(self.jobs.stats()["completed"], 5)
+
+    async def test_identical_work_is_deduplicated(self):
+        self.jobs = JobManager(self.handler, queue=MemoryJobQueue(), workers=1)
+        first = await self.jobs.submit("same", "a")
+        second = await self.jobs.submit("same", "a")
+        self.assertIs(first, second)
+
+        self.release.set()
+        await self.wait_finished(self.jobs, first)
+        self.assertIs(await self.jobs.submit("same", "a"), first)  # done results are reused too
+        self.assertEqual(self.calls, ["a"])
+        self.assertEqual(self.jobs.stats()["deduplicated"], 2)
+
+    async def test_stale_or_uncached_results_are_not_reused(self):
+        available = {"a": True}
+        self.jobs = JobManager(self.handler, queue=MemoryJobQueue(), workers=1,
+                               reusable=lambda job: available[job.result["result"]])
+        self.release.set()
+        first = await self.jobs.submit("same", "a")
+        await self.wait_finished(self.jobs, first)
+
+        # no_cache submissions start over, even while the result is there
+        second = await self.jobs.submit("same", "a", deduplicate=False)
+        self.assertIsNot(second, first)
+        await self.wait_finished(self.jobs, second)
+        self.assertIs(await self.jobs.submit("same", "a"), second)
+
+        # The result was deleted since: convert again
+        available["a"] = False
+        self.assertIsNone(self.jobs.find("same"))
+        self.assertIsNot(await self.jobs.submit("same", "a"), second)
+
+    async def test_failed_job_is_retried_on_resubmission(self):
+        self.jobs = JobManager(self.handler, queue=MemoryJobQueue(), workers=1)
+        self.release.set()
+        job = await self.jobs.submit("key", "bad")
+
+        state = await self.wait_finished(self.jobs, job)
+        self.assertEqual(state, {"success": False, "jobId": job.id, "status": FAILED,
+                                 "detail": "Anime conversion failed"})
+        self.assertIsNot(await self.jobs.submit("key", "bad"), job)
+
+    async def test_finished_jobs_expire(self):
+        self.jobs = JobManager(self.handler, queue=MemoryJobQueue(), workers=1, result_ttl=60)
+        self.release.set()
+        job = await self.jobs.submit("key", "a")
+        await self.wait_finished(self.jobs, job)
+
+        self.jobs._expire(now=job.finished_at + 30)
+        self.assertIs(self.jobs.get(job.id), job)
+        self.jobs._expire(now=job.finished_at + 61)
+        self.assertIsNone(self.jobs.get(job.id))
+        self.assertIsNone(self.jobs.find("key"))
+
+    async def test_broker_queue(self):
+        self.jobs = JobManager(self.handler, queue=BrokerQueue(max_size=1), workers=1)
+        job = await self.jobs.submit("key1", "a")
+        await asyncio.sleep(0.05)  # picked up by the worker
+        await self.jobs.submit("key2", "b")
+
+        with self.assertRaises(HTTPException) as ctx:
+            await self.jobs.submit("key3", "c")
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertIsNone(self.jobs.find("key3"))
+
+        self.release.set()
+        self.assertEqual((await self.wait_finished(self.jobs, job))["status"], DONE)
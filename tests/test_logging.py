@@ -0,0 +1,91 @@
+import json
+import logging
+import threading
+import unittest
+
+from src.api.logs import JsonFormatter, SamplingFilter, QueueLogging
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(JsonFormatter())
+        self.lines = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+        self.threads.add(threading.get_ident())
+
+
+class TestLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(f"tests.logging.{self.id()}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_json_is_escaped(self):
+        self.logger.info('Uploaded "a\\b.png"\nsecond line')
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            self.logger.exception("Failed %s", "upload")
+
+        first, second = (json.loads(line) for line in self.handler.lines)
+        self.assertEqual(first["message"], 'Uploaded "a\\b.png"\nsecond line')
+        self.assertEqual(second["message"], "Failed upload")
+        self.assertEqual(second["level"], "ERROR")
+        self.assertIn("ValueError: broken", second["exc_info"])
+
+    def test_sampling(self):
+        sampling = SamplingFilter({"tests.sampled": 0.25, "tests.sampled.quiet": 0})
+        records = [logging.LogRecord(name, level, __file__, 1, "message", None, None)
+                   for name, level in [("tests.sampled.child", logging.INFO)] * 8
+                   + [("tests.sampled", logging.WARNING), ("tests.sampled.quiet", logging.INFO), ("tests.other", logging.INFO)]]
+
+        kept = [record.name for record in records if sampling.filter(record)]
+
+        # One in four info records, every warning, no quiet ones, other loggers untouched
+        self.assertEqual(kept, ["tests.sampled.child"] * 2 + ["tests.sampled", "tests.other"])
+        self.assertEqual(sampling.dropped, 7)
+
+    def test_queue_logging(self):
+        pipeline = QueueLogging(self.logger, queue_size=100)
+        pipeline.start()
+        self.assertEqual(len(self.logger.handlers), 1)
+        self.assertIsNot(self.logger.handlers[0], self.handler)
+
+        for i in range(50):
+            self.logger.info("record %d", i)
+        pipeline.stop()
+
+        # Written by the listener thread, all of them, in order
+        self.assertEqual([json.loads(line)["message"] for line in self.handler.lines], [f"record {i}" for i in range(50)])
+        self.assertNotIn(threading.get_ident(), self.handler.threads)
+        self.assertEqual(self.logger.handlers, [self.handler])
+
+    def test_full_queue_drops(self):
+        pipeline = QueueLogging(self.logger, queue_size=5)
+        release = threading.Event()
+        self.handler.emit = lambda record, emit=self.handler.emit: release.wait() and emit(record)
+        pipeline.start()
+
+        for i in range(20):
+            self.logger.info("record %d", i)
+        dropped = pipeline.stats()["dropped_full"]
+        release.set()
+        pipeline.stop()
+
+        self.assertGreater(dropped, 0)
+        self.assertEqual(len(self.handler.lines), 20 - dropped)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.api.executor import WorkerPool
+from src.api.metrics import Counter, Histogram, stage, stage_seconds, http_requests
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+
+    def test_histogram_exposition(self):
+        histogram = Histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, route="/a")
+
+        lines = histogram.render().splitlines()
+        self.assertEqual(lines[:2], ["# HELP test_seconds Test.", "# TYPE test_seconds histogram"])
+        self.assertIn('test_seconds_bucket{route="/a",le="0.1"} 2', lines)  # buckets are upper-inclusive
+        self.assertIn('test_seconds_bucket{route="/a",le="1"} 3', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_sum{route="/a"} 3.65', lines)
+        self.assertIn('test_seconds_count{route="/a"} 4', lines)
+
+    def test_label_values_are_escaped(self):
+        counter = Counter("test_total", "Test.", ("status",))
+        counter.inc(status='a "b"\\c\n')
+        self.assertIn('test_total{status="a \\"b\\"\\\\c\\n"} 1', counter.render())
+
+    async def test_stages(self):
+        before = stage_seconds.get(stage="base64")["count"]
+        pool = WorkerPool("test")
+        await pool.run("b64encode", bytes.hex, b"image")
+        with stage("base64"):
+            pass
+        pool.shutdown()
+        self.assertEqual(stage_seconds.get(stage="base64")["count"] - before, 2)
+
+    def test_metrics_endpoint(self):
+        client = TestClient(app)
+        client.get("/health")
+        client.get("/jobs/unknown")
+
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertGreaterEqual(http_requests.get(route="/health", method="GET", status="200"), 1)
+        # Labelled by route template, not by path
+        self.assertIn('ficbot_http_requests_total{route="/jobs/{job_id}",method="GET",status="404"}', response.text)
+        self.assertIn("ficbot_upload_store_bytes ", response.text)
+        self.assertIn('ficbot_stage_duration_seconds_count{stage="serialization"}', response.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+from fastapi import HTTPException
+
+from src.api import services
+from src.api.cache import ResultCache, MemoryCache
+from src.api.store import ImageStore
+from src.api.utils import normalize_image, ImageTooLarge
+
+
+class TestNormalization(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ImageStore(Path(self.tmp_dir.name))
+        self.cache = ResultCache(MemoryCache(), enabled=False)  # the variant doesn't depend on it
+        self.patches = [
+            mock.patch.object(services, "image_store", self.store),
+            mock.patch.object(services, "result_cache", self.cache),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def add_image(self, image: Image.Image, ext: str = ".png", **save_args):
+        data = io.BytesIO()
+        image.save(data, format=ext.lstrip(".").replace("jpg", "jpeg").upper(), **save_args)
+        return self.store.add_bytes(data.getvalue(), ext)
+
+    def test_animated_gif_is_flattened_and_downscaled(self):
+        frames = [Image.new("P", (1000, 500), color) for color in (1, 2, 3)]
+        gif = self.add_image(frames[0], ".gif", save_all=True, append_images=frames[1:])
+
+        with Image.open(io.BytesIO(normalize_image(gif.path, 256, max_pixels=10 ** 7))) as result:
+            self.assertEqual(result.format, "JPEG")
+            self.assertEqual(result.mode, "RGB")
+            self.assertEqual(result.size, (256, 128))
+            self.assertEqual(getattr(result, "n_frames", 1), 1)
+
+    def test_small_images_are_not_upscaled(self):
+        image = self.add_image(Image.new("RGBA", (100, 80)))
+        with Image.open(io.BytesIO(normalize_image(image.path, 256, max_pixels=10 ** 7))) as result:
+            self.assertEqual(result.size, (100, 80))
+
+    def test_decompression_bomb_guard(self):
+        image = self.add_image(Image.new("1", (5000, 5000)))
+        with self.assertRaises(ImageTooLarge):
+            normalize_image(image.path, 256, max_pixels=10 ** 6)
+
+    async def test_normalized_variant_is_stored_once(self):
+        original = self.add_image(Image.new("RGB", (800, 800), "red"))
+
+        normalized = await services.normalized_image(original)
+        self.assertTrue(normalized.filename.startswith("normalized_"))
+        self.assertLess(normalized.size, original.size)
+        self.assertIs(await services.normalized_image(original), normalized)
+        self.assertEqual(len(self.store), 2)
+
+        # Re-created if the variant has been evicted meanwhile
+        self.store.delete(normalized.filename)
+        self.assertIsNotNone(self.store.get_by_name((await services.normalized_image(original)).filename))
+
+        # A variant of its own for other settings
+        with mock.patch.object(services.settings, "normalize_size", 128):
+            smaller = await services.normalized_image(original)
+        self.assertIsNot(smaller, normalized)
+        self.assertLess(smaller.size, normalized.size)
+
+    async def test_broken_image(self):
+        broken = self.store.add_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 100, ".png")
+        with self.assertRaises(HTTPException) as ctx:
+            await services.normalized_image(broken)
+        self.assertEqual(ctx.exception.status_code, 415)
@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from fastapi import HTTPException
+
+from src.api import services
+from src.api.config import settings
+from src.api.prefetch import BioPrefetcher
+from src.api.admission import AdmissionLimiter
+from src.api.cache import ResultCache, MemoryCache, cache_key
+from src.api.fairness import MemoryBucketStore, current_session
+
+from tests.backend import StandInTestCase
+
+
+class TestBioPrefetcher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.release = asyncio.Event()
+        self.generated = []
+
+    async def generate(self, name, diversity, max_bio_length):
+        self.generated.append((name, diversity, max_bio_length))
+        await self.release.wait()
+        return f"{name} bio"
+
+    async def test_bio_request_attaches_to_speculative_generation(self):
+        prefetcher = BioPrefetcher(self.generate)
+        prefetcher.remember("client", 1.5, 100)
+        prefetcher.start("client", "Jane")
+        await asyncio.sleep(0)
+
+        take = asyncio.create_task(prefetcher.take("client", "Jane", 1.5, 100))
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await take, "Jane bio")
+        self.assertEqual(self.generated, [("Jane", 1.5, 100)])
+
+        # Served once only; other parameters don't match
+        self.assertIsNone(await prefetcher.take("client", "Jane", 1.5, 100))
+        self.assertEqual(prefetcher.stats()["attached"], 1)
+        self.assertEqual(prefetcher.stats()["hit_rate"], 0.5)
+
+    async def test_speculative_work_is_capped_and_expires(self):
+        prefetcher = BioPrefetcher(self.generate, max_inflight=1, ttl=0.05)
+        prefetcher.start("a", "Jane")
+        prefetcher.start("b", "John")
+        self.assertEqual(prefetcher.stats()["skipped"], 1)
+
+        await asyncio.sleep(0.1)
+        self.assertIsNone(await prefetcher.take("a", "Jane", 1.0, 200))
+        self.assertEqual(prefetcher.stats()["wasted"], 1)
+        self.assertEqual(prefetcher.stats()["inflight"], 0)
+
+
+    async def test_claimed_generation_counts_until_it_finishes(self):
+        """A bio whose requester went away still counts towards the cap while it is generated."""
+        prefetcher = BioPrefetcher(self.generate, max_inflight=1)
+        prefetcher.start("a", "Jane")
+        take = asyncio.create_task(prefetcher.take("a", "Jane", 1.0, 200))
+        await asyncio.sleep(0)
+        take.cancel()
+        await asyncio.sleep(0)
+
+        prefetcher.start("b", "John")
+        self.assertEqual(prefetcher.stats()["inflight"], 1)
+        self.assertEqual(prefetcher.stats()["skipped"], 1)
+
+        self.release.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(prefetcher.stats()["inflight"], 0)
+
+
+class TestPrefetchedServices(StandInTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.control(requests=0)
+        self.prefetcher = BioPrefetcher(
+            lambda name, diversity, max_bio_length: services.fetch_bio(name, diversity, max_bio_length)
+        )
+        self.patch(
+            mock.patch.object(settings, "prefetch_bio", True),
+            mock.patch.object(services, "inference_client", self.client),
+            mock.patch.object(services, "result_cache", ResultCache(MemoryCache())),
+            mock.patch.object(services, "bio_prefetcher", self.prefetcher),
+        )
+        current_session.set("client")
+
+    async def test_bio_is_served_from_the_prefetch(self):
+        # The client's last-used parameters are remembered
+        await services.generate_bio("John", 0.8, 150)
+        self.prefetcher.start("client", "Jane")
+
+        self.assertEqual(await services.generate_bio("Jane", 0.8, 150), "Jane is a stand-in character.")
+        self.assertEqual(self.backend.stats()["requests"], 2)
+        self.assertEqual(self.prefetcher.stats()["hits"] + self.prefetcher.stats()["attached"], 1)
+
+    async def test_speculative_bio_uses_idle_capacity_only(self):
+        """Speculative bios neither queue for a slot nor spend the client's tokens."""
+        limiter = AdmissionLimiter("bio", max_concurrent=1, max_queue=4, rate=0.001, burst=2, cost=2,
+                                   buckets=MemoryBucketStore())
+        with mock.patch.dict(services.limiters, {"bio": limiter}):
+            self.assertEqual(await services.fetch_speculative_bio("Jane", 1.0, 100), "Jane is a stand-in character.")
+            # Its one real call still has the tokens for it
+            self.assertEqual(await services.generate_bio("John", 1.0, 100), "John is a stand-in character.")
+
+            limiter.inflight = 1  # the slot is busy
+            with self.assertRaises(HTTPException) as ctx:
+                await services.fetch_speculative_bio("Jane", 1.0, 100)
+            self.assertEqual(ctx.exception.status_code, 503)
+            limiter.inflight = 0
+
+    async def test_cached_name_starts_the_prefetch(self):
+        image = SimpleNamespace(digest="digest")
+        await services.result_cache.set(cache_key("name", image="digest", diversity=1.0, min_name_length=2,
+                                                  max_name_length=5, seed=1), "Jane")
+
+        self.assertEqual(await services.generate_name(image, 1.0, 2, 5, seed=1), "Jane")
+        self.assertEqual(self.prefetcher.stats()["started"], 1)
+        self.assertEqual(await services.generate_bio("Jane", 1.0, 200), "Jane is a stand-in character.")
+        self.assertEqual(self.prefetcher.stats()["hits"] + self.prefetcher.stats()["attached"], 1)
+
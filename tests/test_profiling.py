@@ -0,0 +1,94 @@
+import time
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.api.config import settings
+from src.api.profiling import SamplingProfiler, profiler
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_writes_collapsed_stacks(self):
+        sampler = SamplingProfiler(Path(self.tmp.name), max_seconds=0.2)
+        self.assertTrue(sampler.start(interval=0.001))
+        self.assertFalse(sampler.start())  # already running
+
+        deadline = time.monotonic() + 0.1
+        while time.monotonic() < deadline:
+            sum(range(1000))  # keep the main thread busy
+        output = sampler.stop()
+
+        self.assertFalse(sampler.active)
+        self.assertGreater(sampler.samples, 0)
+        lines = output.read_text().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertTrue(any(line.startswith("MainThread;") for line in lines))
+        self.assertTrue(all("profiler" not in line.split(";")[0] for line in lines))
+
+    def test_stops_after_requests(self):
+        sampler = SamplingProfiler(Path(self.tmp.name))
+        sampler.start(requests=2)
+        sampler.request_done()
+        self.assertTrue(sampler.active)
+        sampler.request_done()
+
+        deadline = time.monotonic() + 2
+        while sampler.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(sampler.active)
+        self.assertTrue(sampler.last_output.exists())
+
+
+class TestDiagnosticsEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_server_timing_header(self):
+        response = self.client.get("/jobs/stats")
+        timing = response.headers["server-timing"]
+        self.assertRegex(timing, r"serialization;dur=\d+\.\d, total;dur=\d+\.\d$")
+
+    def test_admin_gate(self):
+        # No token configured: the endpoints are hidden
+        self.assertEqual(self.client.get("/admin/profile").status_code, 404)
+
+        with mock.patch.object(settings, "admin_token", "secret"):
+            self.assertEqual(self.client.get("/admin/profile").status_code, 403)
+            headers = {"X-Admin-Token": "wrong"}
+            self.assertEqual(self.client.get("/admin/profile", headers=headers).status_code, 403)
+
+    def test_profile_next_requests(self):
+        headers = {"X-Admin-Token": "secret"}
+        with mock.patch.object(settings, "admin_token", "secret"), \
+                mock.patch.object(profiler, "output_dir", Path(self.tmp.name)):
+            response = self.client.post("/admin/profile", json={"requests": 2}, headers=headers)
+            self.assertEqual(response.status_code, 202)
+            self.assertTrue(response.json()["active"])
+            self.assertEqual(self.client.post("/admin/profile", json={}, headers=headers).status_code, 409)
+
+            self.client.get("/health")
+            self.client.get("/health")
+            profiler.stop()
+
+            status = self.client.get("/admin/profile", headers=headers).json()
+            self.assertFalse(status["active"])
+            self.assertTrue(status["output"].startswith(self.tmp.name))
+            self.assertTrue(Path(status["output"]).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
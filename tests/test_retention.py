@@ -0,0 +1,129 @@
+import time
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi import HTTPException
+
+from src.api import retention
+from src.api.store import ImageStore, PendingImage
+from src.api.retention import ImageJanitor
+
+
+class TestImageJanitor(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ImageStore(Path(self.tmp_dir.name))
+        self.janitor = ImageJanitor(self.store, ttl=60, max_bytes=1000, interval=0, protected=("example.jpg",))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def add(self, size: int, seed: int):
+        return self.store.add_bytes(bytes([seed]) * size, ".png")
+
+    async def test_ttl_eviction(self):
+        """Images unused for longer than the TTL are evicted, recently used ones stay."""
+        old, fresh = self.add(10, 1), self.add(10, 2)
+        old.last_access -= 120  # last used two minutes ago
+
+        evicted = await self.janitor.sweep()
+        self.assertEqual(evicted, [old.filename])
+        self.assertFalse(old.path.exists())
+        self.assertTrue(fresh.path.exists())
+
+    async def test_quota_evicts_least_recently_used(self):
+        """Over the byte quota, least recently used images go first."""
+        first, second, third = self.add(400, 1), self.add(400, 2), self.add(400, 3)
+        self.store.touch(first)
+
+        evicted = await self.janitor.sweep()
+        self.assertEqual(evicted, [second.filename])
+        self.assertEqual(self.store.total_bytes, 800)
+        self.assertIsNone(self.store.get_by_name(second.filename))
+        self.assertTrue(first.path.exists() and third.path.exists())
+
+    async def test_expired_images_count_towards_the_quota(self):
+        """Over quota, images already expiring in the same sweep free their bytes first."""
+        old, second, third = self.add(400, 1), self.add(400, 2), self.add(400, 3)
+        old.last_access -= 120
+
+        self.assertEqual(await self.janitor.sweep(), [old.filename])
+        self.assertEqual(self.store.total_bytes, 800)
+        self.assertTrue(second.path.exists() and third.path.exists())
+
+    async def test_shed_deletions_are_retried(self):
+        """Files the io pool had no room to delete are deleted by the next sweep."""
+        old = self.add(10, 1)
+        old.last_access -= 120
+
+        with mock.patch.object(retention.io_pool, "run", side_effect=HTTPException(status_code=503)):
+            self.assertEqual(await self.janitor.sweep(), [old.filename])
+        self.assertTrue(old.path.exists())
+        self.assertIsNone(self.store.get_by_name(old.filename))
+
+        self.assertEqual(await self.janitor.sweep(), [])
+        self.assertFalse(old.path.exists())
+
+    async def test_image_stored_again_before_its_deletion_survives(self):
+        """An evicted image uploaded again before its file is deleted keeps the new file."""
+        image = self.add(10, 1)
+        self.store.evict(image.filename)
+        again = self.add(10, 1)
+
+        self.store.unlink([image])
+        self.assertTrue(again.path.exists())
+        self.assertIs(self.store.get_by_name(image.filename), again)
+
+    async def test_pinned_and_protected_images_survive(self):
+        """Pinned and protected images are never evicted."""
+        (Path(self.tmp_dir.name) / "example.jpg").write_bytes(b"example")
+        store = ImageStore(Path(self.tmp_dir.name))
+        janitor = ImageJanitor(store, ttl=0, max_bytes=0, interval=0, protected=("example.jpg",))
+        in_use = store.add_bytes(b"in use", ".png")
+
+        with janitor.pinned(in_use.filename):
+            self.assertEqual(await janitor.sweep(now=time.time() + 1), [])
+        self.assertEqual(await janitor.sweep(now=time.time() + 1), [in_use.filename])
+        self.assertIsNotNone(store.get_by_name("example.jpg"))
+
+    def test_stale_partial_uploads_are_purged(self):
+        """Temporary upload files of an earlier process are deleted when the index is built."""
+        stale = Path(self.tmp_dir.name) / ".0123abcd.part"
+        stale.write_bytes(b"partial")
+        store = ImageStore(Path(self.tmp_dir.name))
+        pending = PendingImage(store, ".png")  # being written by this process
+
+        self.assertEqual(len(store), 0)
+        self.assertFalse(stale.exists())
+        self.assertTrue(pending.path.exists())
+        pending.discard()
+
+    def test_index_built_from_a_scan(self):
+        """The upload directory is read by `scan()`, which leaves the index alone until `load()`."""
+        old = self.add(10, 1)
+        store = ImageStore(Path(self.tmp_dir.name))
+
+        images = store.scan()
+        self.assertEqual([image.filename for image in images], [old.filename])
+        self.assertFalse(store._loaded)
+
+        store.load(images)
+        self.assertEqual(store.get(old.digest).filename, old.filename)
+
+
+    def test_duplicate_files_take_over_the_digest(self):
+        """Files with the same content (from before deduplication) stand in for each other when one goes."""
+        for name in ("a.png", "b.png", "c.png"):
+            (Path(self.tmp_dir.name) / name).write_bytes(b"same content")
+        store = ImageStore(Path(self.tmp_dir.name))
+        digest = store.get_by_name("a.png").digest
+
+        store.delete(store.get(digest).filename)
+        self.assertIn(store.get(digest).filename, {"a.png", "b.png", "c.png"})
+        store.delete(store.get(digest).filename)
+        store.delete(store.get(digest).filename)
+        self.assertIsNone(store.get(digest))
+        self.assertEqual(len(store), 0)
@@ -0,0 +1,136 @@
+import asyncio
+import base64
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from src.main import app
+from src.api.config import settings, UPLOAD_DIR
+from src.api.endpoints import session
+
+
+def encoded(path) -> str:
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+
+class TestSessionChannel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testing = settings.testing
+        settings.testing = True
+
+    @classmethod
+    def tearDownClass(cls):
+        settings.testing = cls.testing
+
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def test_operations(self):
+        """Upload, name, bio and anime over one connection, answered like the REST routes."""
+        image = encoded(UPLOAD_DIR / "example.jpg")  # already stored, so nothing new is kept
+        with self.client.websocket_connect("/session") as websocket:
+            websocket.send_json({"id": 1, "type": "upload", "filename": "example.jpg", "image": image})
+            self.assertEqual(websocket.receive_json(), {"id": 1, "type": "progress", "stage": "validating"})
+            result = websocket.receive_json()
+            self.assertEqual(result, {"id": 1, "type": "result", "success": True, "imgUrl": "/static/images/example.jpg"})
+
+            websocket.send_json({"id": "n", "type": "name", "imageSrc": result["imgUrl"], "diversity": 1.0,
+                                 "min_name_length": 2, "max_name_length": 5})
+            self.assertEqual(websocket.receive_json(), {"id": "n", "type": "result", "success": True, "name": "Test Name"})
+
+            websocket.send_json({"id": 3, "type": "bio", "name": "Test Name", "diversity": 1.0, "max_bio_length": 200})
+            messages = [websocket.receive_json() for _ in range(3)]
+            self.assertEqual([m.get("token") for m in messages[:2]], ["Test ", "Bio"])
+            self.assertEqual(messages[2], {"id": 3, "type": "result", "success": True, "bio": "Test Bio"})
+
+            websocket.send_json({"id": 4, "type": "anime", "image": image})
+            self.assertEqual(websocket.receive_json()["stage"], "converting")
+            result = websocket.receive_json()
+            self.assertEqual(result["type"], "result")
+            self.assertRegex(result["animeImgUrl"], r"^static/images/")
+
+    def test_errors(self):
+        """Bad messages get an error for their id; the connection stays usable."""
+        with self.client.websocket_connect("/session") as websocket:
+            websocket.send_text("not json")
+            self.assertEqual(websocket.receive_json(), {"id": None, "type": "error", "status": 400, "detail": "Invalid JSON"})
+
+            websocket.send_json({"id": 1, "type": "upload", "filename": "notes.txt", "image": "aGVsbG8="})
+            self.assertEqual(websocket.receive_json()["status"], 415)
+
+            websocket.send_json({"id": 2, "type": "name", "imageSrc": "static/images/missing.png", "diversity": 1.0,
+                                 "min_name_length": 2, "max_name_length": 5})
+            self.assertEqual(websocket.receive_json(), {"id": 2, "type": "error", "status": 404, "detail": "Image file not found"})
+
+            websocket.send_json({"id": 3, "type": "bio", "name": "Jane"})
+            error = websocket.receive_json()
+            self.assertEqual(error["status"], 422)
+            self.assertEqual({e["loc"][0] for e in error["detail"]}, {"diversity", "max_bio_length"})
+
+            websocket.send_json({"id": 4, "type": "teleport"})
+            self.assertEqual(websocket.receive_json()["status"], 400)
+
+            websocket.send_json({"id": 5, "type": "cancel"})
+            self.assertEqual(websocket.receive_json()["status"], 404)
+
+    def test_cancellation(self):
+        """Cancelling a bio closes its stream; other operations carry on."""
+        closed = []
+
+        async def endless_bio():
+            try:
+                yield "Jane "
+                await asyncio.Event().wait()
+            finally:
+                closed.append(True)
+
+        with mock.patch.object(session, "bio_chunks", lambda request_data: endless_bio()), \
+                self.client.websocket_connect("/session") as websocket:
+            websocket.send_json({"id": 1, "type": "bio", "name": "Jane", "diversity": 1.0, "max_bio_length": 200})
+            self.assertEqual(websocket.receive_json(), {"id": 1, "type": "progress", "token": "Jane "})
+
+            websocket.send_json({"id": 1, "type": "bio", "name": "Jane", "diversity": 1.0, "max_bio_length": 200})
+            self.assertEqual(websocket.receive_json()["status"], 409)
+
+            websocket.send_json({"id": 1, "type": "cancel"})
+            self.assertEqual(websocket.receive_json(), {"id": 1, "type": "cancelled"})
+            self.assertEqual(closed, [True])
+
+            websocket.send_json({"id": 1, "type": "name", "imageSrc": "static/images/example.jpg", "diversity": 1.0,
+                                 "min_name_length": 2, "max_name_length": 5})
+            self.assertEqual(websocket.receive_json()["name"], "Test Name")
+
+    def test_cancelled_upload_leaves_no_file(self):
+        """An upload cancelled during validation discards its temporary file."""
+        validating = []
+
+        async def stalled_validation(upload):
+            validating.append(upload.path)
+            await asyncio.Event().wait()
+
+        image = encoded(UPLOAD_DIR / "example.jpg")
+        with mock.patch.object(session, "accept_upload", stalled_validation), \
+                self.client.websocket_connect("/session") as websocket:
+            websocket.send_json({"id": 1, "type": "upload", "filename": "example.jpg", "image": image})
+            self.assertEqual(websocket.receive_json()["stage"], "validating")
+            websocket.send_json({"id": 1, "type": "cancel"})
+            self.assertEqual(websocket.receive_json(), {"id": 1, "type": "cancelled"})
+
+        self.assertEqual(len(validating), 1)
+        self.assertFalse(validating[0].exists())
+
+    def test_disabled(self):
+        with mock.patch.object(settings, "session_channel", False), \
+                self.client.websocket_connect("/session") as websocket:
+            with self.assertRaises(WebSocketDisconnect) as ctx:
+                websocket.receive_json()
+        self.assertEqual(ctx.exception.code, 4404)
+
+
+if __name__ == "__main__":
+    unittest.main()
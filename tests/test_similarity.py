@@ -0,0 +1,103 @@
+import io
+import random
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+from src.api import services
+from src.api.cache import ResultCache, MemoryCache
+from src.api.store import ImageStore
+from src.api.similarity import BKTree, NearDuplicateIndex, image_signature, hamming
+
+from tests.backend import StandInTestCase
+from tests.config import current_dir
+
+
+def encode(image: Image.Image, format: str = "PNG", **save_args) -> bytes:
+    data = io.BytesIO()
+    image.save(data, format=format, **save_args)
+    return data.getvalue()
+
+
+class TestSimilarity(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.photo = Image.open(Path(current_dir) / "files/sample.jpg").convert("RGB")
+
+    def test_signature_survives_resave_and_small_crops(self):
+        phash, color = image_signature(encode(self.photo))
+        width, height = self.photo.size
+        variants = [
+            encode(self.photo, "JPEG", quality=40),
+            encode(self.photo.resize((width // 2, height // 2))),
+            encode(self.photo.crop((width // 50, height // 50, width - width // 50, height - height // 50))),
+        ]
+        for variant in variants:
+            variant_hash, _ = image_signature(variant)
+            self.assertLessEqual(hamming(phash, variant_hash), 6)
+
+        flipped_hash, _ = image_signature(encode(self.photo.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+        self.assertGreater(hamming(phash, flipped_hash), 10)
+
+    def test_bk_tree_matches_brute_force(self):
+        rng = random.Random(0)
+        hashes = [rng.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for phash in hashes:
+            tree.add(phash)
+        for phash in hashes[:250]:
+            tree.remove(phash)  # triggers a rebuild past half dead
+        live = hashes[250:]
+
+        for query in [phash ^ (1 << rng.randrange(64)) for phash in live[:50]] + [rng.getrandbits(64)]:
+            expected = sorted((hamming(query, phash), phash) for phash in live if hamming(query, phash) <= 6)
+            self.assertEqual(tree.nearest(query, 6), [phash for _, phash in expected])
+
+    def test_index_eviction_and_color_check(self):
+        index = NearDuplicateIndex(max_entries=2, max_distance=2)
+        index.add((0b1111, (10, 10, 10)), "a")
+        index.add((0b0000, (200, 200, 200)), "b")
+        self.assertEqual(index.find((0b1110, (12, 10, 9))), "a")
+        self.assertIsNone(index.find((0b0001, (10, 10, 10))))  # close hash, different colour
+
+        index.add((1 << 40, (0, 0, 0)), "c")  # "b" is least recently used
+        self.assertIsNone(index.find((0b0000, (200, 200, 200))))
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.stats.evictions, 1)
+
+
+class TestNearDuplicateConversion(StandInTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.control(requests=0)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ImageStore(Path(self.tmp_dir.name))
+        self.patch(
+            mock.patch.object(services, "inference_client", self.client),
+            mock.patch.object(services, "result_cache", ResultCache(MemoryCache())),
+            mock.patch.object(services, "image_store", self.store),
+            mock.patch.object(services, "anime_index", NearDuplicateIndex()),
+        )
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.tmp_dir.cleanup()
+
+    async def convert(self, data: bytes):
+        original = self.store.add_bytes(data, ".png", prefix="original_")
+        return await services.convert_to_anime(data, original)
+
+    async def test_recompressed_copy_reuses_result(self):
+        photo = Image.open(Path(current_dir) / "files/sample.jpg").convert("RGB")
+
+        anime = await self.convert(encode(photo))
+        self.assertIs(await self.convert(encode(photo, "JPEG", quality=50)), anime)
+        self.assertEqual(self.backend.stats()["requests"], 1)
+
+        await self.convert(encode(photo.transpose(Image.Transpose.FLIP_TOP_BOTTOM)))
+        self.assertEqual(self.backend.stats()["requests"], 2)
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from src.api import services
+from src.api.cache import ResultCache, MemoryCache
+from src.api.singleflight import SingleFlight
+
+from tests.backend import StandInTestCase
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.release = asyncio.Event()
+        self.calls = 0
+        self.cancelled = False
+
+    async def call(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "result"
+
+    async def test_concurrent_duplicates_share_one_call(self):
+        flights = SingleFlight()
+        waiters = [asyncio.create_task(flights.do("key", self.call)) for _ in range(5)]
+        other = asyncio.create_task(flights.do("other", self.call))
+        await asyncio.sleep(0)
+
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*waiters), ["result"] * 5)
+        await other
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(flights.stats(), {"inflight": 0, "calls": 2, "coalesced": 4})
+
+    async def test_one_waiter_leaving_does_not_cancel_the_call(self):
+        flights = SingleFlight()
+        leaving = asyncio.create_task(flights.do("key", self.call))
+        staying = asyncio.create_task(flights.do("key", self.call))
+        await asyncio.sleep(0)
+
+        leaving.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await staying, "result")
+        self.assertFalse(self.cancelled)
+
+    async def test_call_is_cancelled_when_every_waiter_leaves(self):
+        flights = SingleFlight()
+        waiters = [asyncio.create_task(flights.do("key", self.call)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        self.assertTrue(self.cancelled)
+        self.assertEqual(len(flights), 0)
+
+    async def test_errors_reach_every_waiter(self):
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("key", failing) for _ in range(3)), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+
+class TestCoalescedServices(StandInTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.control(requests=0, delay=0.2)
+        self.patch(
+            mock.patch.object(services, "inference_client", self.client),
+            mock.patch.object(services, "result_cache", ResultCache(MemoryCache())),
+            mock.patch.object(services, "flights", SingleFlight()),
+        )
+
+    async def asyncTearDown(self):
+        self.backend.control(delay=0)
+        await super().asyncTearDown()
+
+    async def test_identical_bio_requests(self):
+        bios = await asyncio.gather(*(services.generate_bio("Jane", 1.0, 100) for _ in range(4)))
+        self.assertEqual(set(bios), {"Jane is a stand-in character."})
+        self.assertEqual(self.backend.stats()["requests"], 1)
@@ -0,0 +1,82 @@
+import re
+import unittest
+
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.api.static import choose_encoding, etag_matches, IMMUTABLE
+
+
+class TestStaticDelivery(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding("gzip, deflate, br", {"identity", "gzip", "br"}), "br")
+        self.assertEqual(choose_encoding("gzip, deflate, br", {"identity", "gzip"}), "gzip")
+        self.assertEqual(choose_encoding("br;q=0, gzip;q=0.5", {"identity", "gzip", "br"}), "gzip")
+        self.assertEqual(choose_encoding("*", {"identity", "gzip"}), "gzip")
+        self.assertEqual(choose_encoding("", {"identity", "gzip"}), "identity")
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"a", W/"b"', '"b"'))
+        self.assertTrue(etag_matches("*", '"b"'))
+        self.assertFalse(etag_matches('"a"', '"b"'))
+
+    def test_page_is_precompressed_and_revalidated(self):
+        plain = self.client.get("/", headers={"Accept-Encoding": "identity"})
+        self.assertEqual(plain.status_code, 200)
+        self.assertNotIn("content-encoding", plain.headers)
+        self.assertEqual(plain.headers["cache-control"], "no-cache")
+
+        compressed = self.client.get("/upload_image", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(compressed.headers["content-encoding"], "gzip")
+        self.assertEqual(compressed.headers["vary"], "Accept-Encoding")
+        self.assertEqual(compressed.content, plain.content)  # decoded by the client
+        self.assertNotEqual(compressed.headers["etag"], plain.headers["etag"])
+
+        again = self.client.get("/generate/name", headers={"Accept-Encoding": "gzip",
+                                                           "If-None-Match": compressed.headers["etag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+    def test_fingerprinted_assets_are_immutable(self):
+        page = self.client.get("/").text
+        url = re.search(r'"(static/favicon/site\.webmanifest\?v=\w+)"', page).group(1)
+
+        response = self.client.get("/" + url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["cache-control"], IMMUTABLE)
+        self.assertEqual(response.headers["content-type"], "application/manifest+json")
+
+        unversioned = self.client.get("/static/favicon/site.webmanifest")
+        self.assertRegex(unversioned.headers["cache-control"], r"^public, max-age=\d+$")
+        stale = self.client.get("/static/favicon/site.webmanifest?v=0123456789ab")
+        self.assertNotEqual(stale.headers["cache-control"], IMMUTABLE)
+
+        not_modified = self.client.get("/" + url, headers={"If-None-Match": unversioned.headers["etag"]})
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_files_outside_the_cache(self):
+        # Uploads and range requests are served from disk
+        response = self.client.get("/static/images/example.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("etag", response.headers)
+
+        ranged = self.client.get("/static/gifs/1.gif", headers={"Range": "bytes=0-5"})
+        self.assertEqual(ranged.status_code, 206)
+        self.assertEqual(ranged.content, b"GIF89a")
+
+        self.assertEqual(self.client.get("/static/missing.css").status_code, 404)
+
+    def test_gzip_variant_is_valid(self):
+        response = self.client.get("/static/favicon/favicon.ico", headers={"Accept-Encoding": "gzip"})
+        raw = self.client.get("/static/favicon/favicon.ico", headers={"Accept-Encoding": "identity"}).content
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertLess(int(response.headers["content-length"]), len(raw))
+        self.assertEqual(response.content, raw)  # decoded by the client
+
+
+if __name__ == "__main__":
+    unittest.main()
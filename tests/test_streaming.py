@@ -0,0 +1,61 @@
+import time
+import asyncio
+from unittest import mock
+
+from fastapi import HTTPException
+
+from src.api import services
+from src.api.cache import ResultCache, MemoryCache
+
+from tests.backend import StandInTestCase
+
+
+class TestBioStreaming(StandInTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.control(no_stream=False, token_delay=0.0, status=200, streams_completed=0, streams_cancelled=0)
+
+    async def test_tokens_are_relayed(self):
+        chunks = [chunk async for chunk in self.client.stream_bio("Jane", 1.0, 100)]
+
+        self.assertEqual(chunks, ["Jane ", "is ", "a ", "stand-in ", "character."])
+        self.assertEqual(self.backend.stats()["streams_completed"], 1)
+
+    async def test_backend_without_streaming(self):
+        self.backend.control(no_stream=True)
+
+        chunks = [chunk async for chunk in self.client.stream_bio("Jane", 1.0, 100)]
+
+        self.assertEqual(chunks, ["Jane is a stand-in character."])
+
+    async def test_backend_failure(self):
+        self.backend.control(status=500)
+
+        with self.assertRaises(HTTPException) as ctx:
+            await anext(self.client.stream_bio("Jane", 1.0, 100))
+        self.assertEqual(ctx.exception.status_code, 502)
+
+    async def test_closing_the_stream_cancels_upstream(self):
+        """An abandoned stream closes its backend connection, stopping the generation."""
+        self.backend.control(token_delay=0.5)
+
+        chunks = self.client.stream_bio("Jane", 1.0, 100)
+        self.assertEqual(await anext(chunks), "Jane ")
+        await chunks.aclose()
+
+        deadline = time.monotonic() + 5
+        while self.backend.stats()["streams_cancelled"] == 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self.assertEqual(self.backend.stats()["streams_cancelled"], 1)
+        self.assertEqual(self.backend.stats()["streams_completed"], 0)
+
+    async def test_completed_stream_is_cached(self):
+        cache = ResultCache(MemoryCache())
+        with mock.patch.object(services, "inference_client", self.client), \
+                mock.patch.object(services, "result_cache", cache):
+            streamed = "".join([chunk async for chunk in services.stream_bio("Jane", 1.0, 100, seed=7)])
+            cached = [chunk async for chunk in services.stream_bio("Jane", 1.0, 100, seed=7)]
+
+        self.assertEqual(cached, [streamed])
+        self.assertEqual(self.backend.stats()["streams_completed"], 1)